@@ -0,0 +1,62 @@
+import os
+import time
+
+from app.agents.state import AgentState
+from app.llm.embedding import embed_query
+from app.utils.answer_cache import SemanticAnswerCache
+from app.vector_store import owner_version
+
+# Past questions kept per owner; 0 disables the answer cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+# Seconds a cached answer stays valid
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Question similarity (0-1) needed to reuse an answer; paraphrases of the
+# same question typically score above 0.9 with all-MiniLM-L6-v2
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+
+# Entries are dropped when the owner's documents change (owner_version)
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MIN_SIMILARITY)
+
+
+def lookup_answer(question: str, owner_id: int):
+    """Cached answer for a question like this one.
+
+    Returns:
+        ({"answer", "from_documents"} or None, lookup) where lookup is
+        passed to remember_answer() after a miss
+    """
+    lookup = {"version": owner_version(owner_id), "started": time.perf_counter()}
+    cached = answer_cache.get(owner_id, lookup["version"], embed_query(question))
+    return cached, lookup
+
+
+def remember_answer(question: str, owner_id: int, lookup: dict, answer: str, from_documents: bool):
+    """Cache an answer under the index version it was looked up with."""
+    answer_cache.set(
+        owner_id,
+        lookup["version"],
+        embed_query(question),
+        {"answer": answer, "from_documents": from_documents},
+        latency=time.perf_counter() - lookup["started"],
+    )
+
+
+def cache_lookup_node(state: AgentState) -> AgentState:
+    cached, lookup = lookup_answer(state["question"], state["owner_id"])
+    if cached is not None:
+        print(f"Answer cache hit for owner {state['owner_id']}")
+        state["answer"] = cached["answer"]
+        state["from_documents"] = cached["from_documents"]
+    state["answer_cache"] = {**lookup, "hit": cached is not None}
+    return state
+
+
+def cache_store_node(state: AgentState) -> AgentState:
+    remember_answer(
+        state["question"],
+        state["owner_id"],
+        state["answer_cache"],
+        state["answer"],
+        bool(state.get("from_documents")),
+    )
+    return state
@@ -1,37 +1,41 @@
-from app.llm.azure_client import chat_completion
-import re
+from app.agents.context_builder import build_context, count_tokens
+from app.agents.routing import routing_for
+from app.llm.azure_client import achat_completion, achat_completion_stream, chat_completion
+import os
 
-def answer_node(state):
+# Best chunk similarity (0-1) at which retrieved chunks are used as context
+# even without document keywords. 0.6 is the old "squared L2 < 0.8" cutoff;
+# tune it with benchmarks/calibrate_threshold.py.
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.6"))
+
+DOCUMENT_PREFIX = "This is from document: "
+GENERAL_PREFIX = "This is not from documents.\n\n"
+
+def build_prompt(state):
+    """
+    Decide whether to answer from the retrieved chunks and build the prompt.
+    Returns (from_documents, prompt).
+    """
     question = state["question"]
 
     # Use chunks if any were retrieved
     if state.get("retrieved_chunks") and len(state["retrieved_chunks"]) > 0:
-        context = "\n\n".join(chunk["text"] for chunk in state["retrieved_chunks"])
-        best_score = state["retrieved_chunks"][0].get("score", 999)
-        
-        # Document-related keywords (user explicitly asking about docs)
-        doc_keywords = [
-            r'\b(this|the|my)\s+(doc|document|file|pdf|text)\b',
-            r'\bsummarize\b',
-            r'\bwhat.*in\s+(this|it|here|the doc)\b',
-            r'\btell me about\s+(this|it)\b',
-            r'\bexplain\s+(this|it)\b',
-            r'\buploaded\b',
-            r'\babove\b',
-            r'\bprovided\b',
-        ]
+        # Hybrid results are ordered by fused rank, not by similarity
+        best_score = max(chunk.get("score", 0.0) for chunk in state["retrieved_chunks"])
         
-        question_lower = question.lower()
-        has_doc_keywords = any(re.search(pattern, question_lower) for pattern in doc_keywords)
+        # Keyword match from intent_node (see app/agents/routing.py)
+        has_doc_keywords = routing_for(state)["has_doc_keywords"]
         
         # HYBRID DECISION:
         # 1. If explicit doc keywords → Always use context
-        # 2. If no keywords but good similarity (< 0.8) → Use context  
-        # 3. If no keywords and poor similarity (> 0.8) → General answer
+        # 2. If no keywords but good similarity (>= CONTEXT_MIN_SCORE) → Use context
+        # 3. If no keywords and poor similarity → General answer
         
-        should_use_context = has_doc_keywords or best_score < 0.8
+        should_use_context = has_doc_keywords or best_score >= CONTEXT_MIN_SCORE
         
         if should_use_context:
+            # Overlapping chunks merged, best first, within CONTEXT_MAX_TOKENS
+            context, context_tokens = build_context(state["retrieved_chunks"])
             # Use document context
             prompt = f"""You are a helpful AI assistant. The user has uploaded documents to your system and you have direct access to their content below.
 
@@ -48,18 +52,75 @@ DOCUMENT CONTENT:
 USER QUESTION: {question}
 
 Answer the question based on the document content above:"""
-            answer = chat_completion([prompt])
-            # Extract first sentence
-            first_sentence = answer.split('.')[0] + '.' if '.' in answer else answer
-            formatted_answer = f"This is from document: {first_sentence}\n\n{answer}"
+            raw_tokens = count_tokens("\n\n".join(chunk["text"] for chunk in state["retrieved_chunks"]))
+            print(f"Prompt tokens: {count_tokens(prompt)} "
+                  f"(context {context_tokens}, {raw_tokens} before merging and trimming)")
+            return True, prompt
         else:
             # Poor match and no doc keywords - use general answer
             print(f"Poor match (score={best_score:.3f}) with no doc keywords - general answer")
-            answer = chat_completion([question])
-            formatted_answer = f"This is not from documents.\n\n{answer}"
-    else:
-        answer = chat_completion([question])
-        formatted_answer = f"This is not from documents.\n\n{answer}"
+    print(f"Prompt tokens: {count_tokens(question)}")
+    return False, question
+
+def format_answer(from_documents: bool, answer: str) -> str:
+    if from_documents:
+        # Extract first sentence
+        first_sentence = answer.split('.')[0] + '.' if '.' in answer else answer
+        return f"{DOCUMENT_PREFIX}{first_sentence}\n\n{answer}"
+    return f"{GENERAL_PREFIX}{answer}"
+
+def answer_node(state):
+    from_documents, prompt = build_prompt(state)
+    answer = chat_completion([prompt])
+    state["answer"] = format_answer(from_documents, answer)
+    state["from_documents"] = from_documents
+    return state
 
-    state["answer"] = formatted_answer
+async def aanswer_node(state):
+    """Async answer_node, used when the graph is run with ainvoke."""
+    from_documents, prompt = build_prompt(state)
+    answer = await achat_completion([prompt])
+    state["answer"] = format_answer(from_documents, answer)
+    state["from_documents"] = from_documents
     return state
+
+class StreamFormatter:
+    """
+    Turns completion deltas into pieces that concatenate to exactly what
+    format_answer() returns for the full completion.
+
+    The prefix is available before the LLM is called. For document answers
+    the first sentence is streamed as it arrives and repeated once it ends.
+    """
+
+    def __init__(self, from_documents: bool):
+        self.from_documents = from_documents
+        self.first_sentence = ""
+        self.sentence_done = not from_documents
+
+    def prefix(self) -> str:
+        return DOCUMENT_PREFIX if self.from_documents else GENERAL_PREFIX
+
+    def feed(self, delta: str) -> str:
+        if self.sentence_done:
+            return delta
+        end = delta.find('.')
+        if end == -1:
+            self.first_sentence += delta
+            return delta
+        self.first_sentence += delta[:end + 1]
+        self.sentence_done = True
+        return delta[:end + 1] + "\n\n" + self.first_sentence + delta[end + 1:]
+
+    def finish(self) -> str:
+        # No period: the whole answer is the "first sentence"
+        return "" if self.sentence_done else "\n\n" + self.first_sentence
+
+async def astream_answer(from_documents: bool, prompt: str):
+    """Yield the formatted answer piece by piece while it is generated."""
+    formatter = StreamFormatter(from_documents)
+    yield formatter.prefix()
+    async for delta in achat_completion_stream([prompt]):
+        yield formatter.feed(delta)
+    if formatter.finish():
+        yield formatter.finish()
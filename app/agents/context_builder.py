@@ -0,0 +1,151 @@
+"""Prompt context from retrieved chunks.
+
+The chunker overlaps neighbouring chunks by up to CHUNK_OVERLAP, so
+joining retrieved chunks verbatim repeats text. build_context() merges
+chunks that are adjacent in their document, by their character offsets,
+into one passage without the repeated span, orders passages best first
+and stops at a token budget.
+"""
+import os
+import re
+
+# Token budget for the document context in a prompt
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# tiktoken encoding of the deployed model (cl100k_base: gpt-35-turbo / gpt-4)
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+# A passage cut to fewer tokens than this is left out instead
+MIN_PASSAGE_TOKENS = 32
+# Shorter matches between adjacent chunks are coincidence, not overlap
+MIN_OVERLAP_CHARS = 8
+
+PASSAGE_SEPARATOR = "\n\n"
+
+_encoding = None
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def _get_encoding():
+    """tiktoken encoding, or False when it can't be loaded (e.g. offline)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        except Exception as e:
+            print(f"WARNING: tiktoken encoding {CONTEXT_TOKENIZER!r} unavailable ({e}), "
+                  f"approximating token counts")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text that fits in max_tokens."""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    matches = list(_APPROX_TOKEN.finditer(text))
+    return text if len(matches) <= max_tokens else text[:matches[max_tokens].start()].rstrip()
+
+
+def _overlap(previous: str, following: str) -> int:
+    """Length of the longest suffix of `previous` that starts `following`."""
+    for size in range(min(len(previous), len(following)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(chunks: list) -> list:
+    """Merge retrieved chunks into passages.
+
+    Chunks of the same document whose character ranges ("start" plus the
+    text length) overlap or touch were cut from contiguous text; they
+    become one passage with the repeated span removed, and a chunk that
+    lies inside a passage is dropped. Chunks stored before offsets were
+    recorded (start -1) are only merged with the next chunk ID, and only
+    when their texts overlap.
+
+    Returns:
+        [{"document_id", "text", "score"}] ordered best score first
+    """
+    by_document = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk["document_id"], []).append(chunk)
+
+    passages = []
+    for document_id, document_chunks in by_document.items():
+        located = sorted(
+            (chunk for chunk in document_chunks if chunk.get("start", -1) >= 0),
+            key=lambda chunk: chunk["start"],
+        )
+        passage = None
+        passage_end = 0
+        for chunk in located:
+            start = chunk["start"]
+            end = start + len(chunk["text"])
+            if passage is not None and start <= passage_end:
+                if end > passage_end:
+                    passage["text"] += chunk["text"][passage_end - start:]
+                    passage_end = end
+                passage["score"] = max(passage["score"], chunk.get("score", 0.0))
+            else:
+                passage = {"document_id": document_id, "text": chunk["text"], "score": chunk.get("score", 0.0)}
+                passage_end = end
+                passages.append(passage)
+
+        unlocated = sorted(
+            (chunk for chunk in document_chunks if chunk.get("start", -1) < 0),
+            key=lambda chunk: chunk.get("chunk_id", 0),
+        )
+        passage = None
+        previous_id = None
+        for chunk in unlocated:
+            chunk_id = chunk.get("chunk_id")
+            adjacent = passage is not None and chunk_id is not None and previous_id is not None and chunk_id == previous_id + 1
+            size = _overlap(passage["text"], chunk["text"]) if adjacent else 0
+            if size:
+                passage["text"] += chunk["text"][size:]
+                passage["score"] = max(passage["score"], chunk.get("score", 0.0))
+            elif passage is None or chunk["text"] not in passage["text"]:
+                passage = {"document_id": document_id, "text": chunk["text"], "score": chunk.get("score", 0.0)}
+                passages.append(passage)
+            previous_id = chunk_id
+    passages.sort(key=lambda passage: passage["score"], reverse=True)
+    return passages
+
+
+def build_context(chunks: list, max_tokens: int = None) -> tuple:
+    """Merge, order and trim retrieved chunks to a token budget.
+
+    Args:
+        chunks: search_similar_chunks() results
+        max_tokens: Budget for the context; defaults to CONTEXT_MAX_TOKENS
+
+    Returns:
+        (context, token_count)
+    """
+    budget = CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    texts = []
+    used = 0
+    for passage in merge_chunks(chunks):
+        separator = separator_tokens if texts else 0
+        remaining = budget - used - separator
+        text = passage["text"]
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                break
+            text = truncate_to_tokens(text, remaining)
+            tokens = count_tokens(text)
+        texts.append(text)
+        used += separator + tokens
+    return PASSAGE_SEPARATOR.join(texts), used
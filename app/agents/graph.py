@@ -1,27 +1,66 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from app.agents.state import AgentState
 from app.agents.nodes import intent_node
 from app.agents.retrieval_node import retrieval_node
-from app.agents.answer_node import answer_node
+from app.agents.answer_node import aanswer_node, answer_node
+from app.agents.answer_cache_node import cache_lookup_node, cache_store_node
 
 graph = StateGraph(AgentState)
 
-graph.add_node("intent", intent_node)
+# Paraphrases of a recent question skip retrieval and the LLM
+graph.add_node("lookup", cache_lookup_node)
+graph.add_node("classify", intent_node)
 graph.add_node("retrieve", retrieval_node)
-graph.add_node("answer", answer_node)
+# invoke() calls answer_node; ainvoke() awaits aanswer_node, while the
+# sync nodes run in the default executor off the event loop
+graph.add_node("generate", RunnableLambda(answer_node, afunc=aanswer_node))
+graph.add_node("remember", cache_store_node)
 
-graph.set_entry_point("intent")
+graph.set_entry_point("lookup")
 
 graph.add_conditional_edges(
-    "intent",
+    "lookup",
+    lambda state: "hit" if state["answer_cache"]["hit"] else "miss",
+    {
+        "hit": END,
+        "miss": "classify"
+    }
+)
+
+graph.add_conditional_edges(
+    "classify",
     lambda state: state["intent"],
     {
         "document_query": "retrieve",
-        "general_query": "answer"
+        "general_query": "generate"
     }
 )
 
-graph.add_edge("retrieve", "answer")
-graph.add_edge("answer", END)
+graph.add_edge("retrieve", "generate")
+graph.add_edge("generate", "remember")
+graph.add_edge("remember", END)
 
 qa_agent = graph.compile()
+
+# Same routing without the answer step or answer cache, for streaming the
+# answer separately
+routing_graph = StateGraph(AgentState)
+
+routing_graph.add_node("classify", intent_node)
+routing_graph.add_node("retrieve", retrieval_node)
+
+routing_graph.set_entry_point("classify")
+
+routing_graph.add_conditional_edges(
+    "classify",
+    lambda state: state["intent"],
+    {
+        "document_query": "retrieve",
+        "general_query": END
+    }
+)
+
+routing_graph.add_edge("retrieve", END)
+
+routing_agent = routing_graph.compile()
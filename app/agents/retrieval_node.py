@@ -1,11 +1,18 @@
+import os
+
 from app.vector_store import search_similar_chunks
 from app.agents.state import AgentState
 
+# Search mode used to retrieve context: "vector", "keyword" or "hybrid"
+# (see vector_store.search_similar_chunks); a "search_mode" in the state wins
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
 def retrieval_node(state: AgentState) -> AgentState:
     chunks = search_similar_chunks(
         state["question"],
         state["owner_id"],
-        top_k=5
+        top_k=5,
+        mode=state.get("search_mode") or RETRIEVAL_MODE,
     )
     
     state["retrieved_chunks"] = chunks
@@ -0,0 +1,46 @@
+"""Question routing shared by the agent nodes.
+
+All document keyword patterns are compiled into one alternation at import,
+so a question is scanned once. intent_node stores the result in
+state["routing"]; answer_node reads it instead of matching again.
+"""
+import re
+
+# Feature name -> pattern suggesting the user asks about their documents
+DOC_KEYWORD_PATTERNS = {
+    "doc_reference": r'\b(?:this|the|my)\s+(?:doc|document|file|pdf|text)\b',
+    "summarize": r'\bsummarize\b',
+    "what_in": r'\bwhat.*in\s+(?:this|it|here|the doc)\b',
+    "tell_me_about": r'\btell me about\s+(?:this|it)\b',
+    "explain": r'\bexplain\s+(?:this|it)\b',
+    "uploaded": r'\buploaded\b',
+    "above": r'\babove\b',
+    "provided": r'\bprovided\b',
+    "content_of_doc": r'\bcontent\b.*\b(?:document|file)\b',
+    "list_from_doc": r'\blist.*\b(?:from|in)\b.*\b(?:doc|document)\b',
+    "find_in_doc": r'\bfind.*\b(?:in|from)\b.*\b(?:doc|document)\b',
+    "show_from_doc": r'\bshow.*\b(?:from|in)\b.*\b(?:doc|document)\b',
+}
+
+DOC_KEYWORDS = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in DOC_KEYWORD_PATTERNS.items()),
+    re.IGNORECASE,
+)
+
+
+def route_question(question: str) -> dict:
+    """Match the question against every document keyword pattern in one pass.
+
+    Returns:
+        {"has_doc_keywords": bool, "features": [matched feature names]}
+    """
+    features = []
+    for match in DOC_KEYWORDS.finditer(question):
+        if match.lastgroup not in features:
+            features.append(match.lastgroup)
+    return {"has_doc_keywords": bool(features), "features": features}
+
+
+def routing_for(state) -> dict:
+    """The state's routing, computed only if intent_node didn't store it."""
+    return state.get("routing") or route_question(state["question"])
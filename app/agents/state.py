@@ -4,5 +4,9 @@ class AgentState(TypedDict):
     question: str
     owner_id: int
     intent: Optional[str]
+    routing: Optional[dict]
+    search_mode: Optional[str]
     retrieved_chunks: Optional[List[dict]]
     answer: Optional[str]
+    from_documents: Optional[bool]
+    answer_cache: Optional[dict]
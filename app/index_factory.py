@@ -0,0 +1,230 @@
+"""FAISS index construction for owner partitions.
+
+Supported index types:
+
+    flat       exact search over full float32 vectors
+    ivf_flat   inverted lists over k-means cells, full vectors (needs training)
+    hnsw       graph search, full vectors plus graph links, no training
+    ivf_pq     inverted lists with product-quantized codes, ~DIM/8 bytes
+               per vector instead of DIM * 4 (needs training)
+
+Every index is wrapped in an IndexIDMap so ids are chunk IDs whatever the
+type. Built with mappable=True, a flat index is laid out as an IVF-Flat
+with a single list, which scans every vector just the same: faiss can
+memory-map inverted lists (read_index(path, IO_FLAG_MMAP)) but copies a
+plain flat index into memory. VECTOR_INDEX_TYPE picks a fixed type, or "auto" picks by partition
+size. Types that need training fall back to flat until the partition has
+enough vectors to train them.
+
+Embeddings are L2-normalized, so inner product (the default metric) is
+cosine similarity. Search results carry scores from to_similarity(): the
+cosine similarity clipped to [0, 1], where 1 is an identical direction and
+0 is unrelated (or opposite). Scores are the same under either metric.
+"""
+import os
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+METRICS = {"ip": faiss.METRIC_INNER_PRODUCT, "l2": faiss.METRIC_L2}
+# "ip" (inner product) or "l2" (squared Euclidean distance)
+VECTOR_INDEX_METRIC = os.getenv("VECTOR_INDEX_METRIC", "ip")
+if VECTOR_INDEX_METRIC not in METRICS:
+    raise ValueError(f"VECTOR_INDEX_METRIC must be one of {tuple(METRICS)}, got {VECTOR_INDEX_METRIC!r}")
+METRIC = METRICS[VECTOR_INDEX_METRIC]
+
+# "auto" or one of INDEX_TYPES
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+# auto: exact search below this many vectors per owner, IVF-Flat above
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "50000"))
+# auto: compressed IVF-PQ at and above this many vectors per owner
+IVF_PQ_MIN_VECTORS = int(os.getenv("IVF_PQ_MIN_VECTORS", "1000000"))
+
+# Recall/speed trade-off: IVF cells visited and HNSW candidate list size
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+# PQ code: one 8-bit code per PQ_SUBVECTOR_DIM dimensions
+PQ_SUBVECTOR_DIM = int(os.getenv("PQ_SUBVECTOR_DIM", "8"))
+
+# k-means wants ~39 points per centroid; more than 256 adds little
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+
+
+def nlist_for(ntotal: int) -> int:
+    """IVF cell count for a partition of `ntotal` vectors."""
+    return int(min(max(4 * np.sqrt(ntotal), 16), 65536))
+
+
+def can_train(index_type: str, ntotal: int) -> bool:
+    if index_type in ("flat", "hnsw"):
+        return True
+    return ntotal >= MIN_POINTS_PER_CENTROID * nlist_for(ntotal)
+
+
+def choose_index_type(ntotal: int, configured: str = None) -> str:
+    """Index type for a partition of `ntotal` vectors."""
+    configured = configured or VECTOR_INDEX_TYPE
+    if configured == "auto":
+        if ntotal >= IVF_PQ_MIN_VECTORS:
+            index_type = "ivf_pq"
+        elif ntotal >= ANN_MIN_VECTORS:
+            index_type = "ivf_flat"
+        else:
+            index_type = "flat"
+    elif configured in INDEX_TYPES:
+        index_type = configured
+    else:
+        raise ValueError(f"VECTOR_INDEX_TYPE must be 'auto' or one of {INDEX_TYPES}, got {configured!r}")
+    return index_type if can_train(index_type, ntotal) else "flat"
+
+
+def create_index(index_type: str, dim: int, ntotal: int = 0, metric: int = METRIC, mappable: bool = False):
+    """Empty, possibly untrained IndexIDMap of the given type, sized for `ntotal` vectors."""
+    if index_type == "flat" and mappable:
+        # One list, so its centroid never changes which vectors are scanned
+        quantizer = faiss.IndexFlat(dim, metric)
+        quantizer.add(np.zeros((1, dim), dtype="float32"))
+        inner = faiss.IndexIVFFlat(quantizer, dim, 1, metric)
+        inner.is_trained = True
+    elif index_type == "flat":
+        inner = faiss.IndexFlat(dim, metric)
+    elif index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        quantizer = faiss.IndexFlat(dim, metric)
+        nlist = nlist_for(ntotal)
+        if index_type == "ivf_flat":
+            inner = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, dim // PQ_SUBVECTOR_DIM, 8, metric)
+    else:
+        raise ValueError(f"unknown index type {index_type!r}")
+    apply_search_params(inner)
+    # The faiss wrappers keep the quantizer and inner index alive
+    return faiss.IndexIDMap(inner)
+
+
+def apply_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Set nprobe / efSearch on an index (or the index inside an IndexIDMap)."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe or VECTOR_INDEX_NPROBE, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search or VECTOR_INDEX_EF_SEARCH
+
+
+def index_type_of(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVFFlat):
+        return "ivf_flat" if inner.nlist > 1 else "flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_settings(index_type: str) -> str:
+    """Settings that shape an index of this type, beyond the vectors in it."""
+    settings = [index_type, VECTOR_INDEX_METRIC]
+    if index_type == "hnsw":
+        settings += [f"m{HNSW_M}", f"ef{HNSW_EF_CONSTRUCTION}"]
+    elif index_type == "ivf_pq":
+        settings.append(f"pq{PQ_SUBVECTOR_DIM}")
+    return "_".join(settings)
+
+
+def build_index(index_type: str, vectors: np.ndarray, ids: np.ndarray, metric: int = METRIC,
+                mappable: bool = False):
+    """Train (on a sample when large) and fill an index of the given type."""
+    index = create_index(index_type, vectors.shape[1], len(vectors), metric, mappable)
+    if not index.is_trained:
+        sample_size = MAX_POINTS_PER_CENTROID * nlist_for(len(vectors))
+        if len(vectors) > sample_size:
+            rows = np.sort(np.random.default_rng(0).choice(len(vectors), sample_size, replace=False))
+            sample = vectors[rows]
+        else:
+            sample = vectors
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+    index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), np.asarray(ids, dtype="int64"))
+    return index
+
+
+def copy_index(index):
+    """Writable in-memory copy of an index, also of one memory-mapped from a file.
+
+    faiss cannot clone mapped inverted lists, so everything else is copied
+    through a serialized form without them and the lists one by one.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if not isinstance(inner, faiss.IndexIVF) or isinstance(
+        faiss.downcast_InvertedLists(inner.invlists), faiss.ArrayInvertedLists
+    ):
+        return faiss.clone_index(index)
+    writer = faiss.VectorIOWriter()
+    faiss.write_index(index, writer)
+    reader = faiss.VectorIOReader()
+    reader.data.swap(writer.data)
+    copy = faiss.read_index(reader, faiss.IO_FLAG_SKIP_IVF_DATA)
+    copy_inner = faiss.downcast_index(copy.index) if isinstance(copy, faiss.IndexIDMap) else copy
+    lists = faiss.ArrayInvertedLists(inner.nlist, inner.code_size)
+    for list_no in range(inner.nlist):
+        size = inner.invlists.list_size(list_no)
+        if size:
+            lists.add_entries(list_no, size, inner.invlists.get_ids(list_no), inner.invlists.get_codes(list_no))
+    copy_inner.replace_invlists(lists, True)
+    lists.this.disown()  # owned by copy_inner now
+    copy_inner.ntotal = copy.ntotal = index.ntotal
+    return copy
+
+
+class ExcludingSearch:
+    """search() over an IndexIDMap that skips some of its IDs inside faiss.
+
+    A search for k results then returns k of the other IDs, where filtering
+    afterwards would have to over-fetch by every excluded ID. IndexIDMap
+    takes no search parameters, so the selector holds positions in the
+    inner index and the labels found are mapped back through id_map.
+    """
+
+    def __init__(self, index, excluded_ids: np.ndarray):
+        self.index = index  # keeps the inner index and id_map alive
+        self.inner = faiss.downcast_index(index.index)
+        self.labels = faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+        positions = np.flatnonzero(np.isin(self.labels, excluded_ids)).astype("int64")
+        self.excluded_count = len(positions)
+        # Search parameters hold plain pointers to the selectors, so they
+        # are kept here; the batch copies the positions
+        self._batch = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+        self._selector = faiss.IDSelectorNot(self._batch)
+        if isinstance(self.inner, faiss.IndexIVF):
+            self.params = faiss.SearchParametersIVF()
+            self.params.nprobe = self.inner.nprobe
+        elif isinstance(self.inner, faiss.IndexHNSW):
+            self.params = faiss.SearchParametersHNSW()
+            self.params.efSearch = self.inner.hnsw.efSearch
+        else:
+            self.params = faiss.SearchParameters()
+        self.params.sel = self._selector
+
+    def search(self, queries: np.ndarray, k: int):
+        """Like index.search(): (distances, ids), with -1 ids past the last hit."""
+        distances, positions = self.inner.search(queries, k, params=self.params)
+        return distances, np.where(positions >= 0, self.labels[positions], -1)
+
+
+def to_similarity(distances: np.ndarray, metric: int = METRIC) -> np.ndarray:
+    """Raw faiss distances for normalized vectors -> scores in [0, 1].
+
+    Inner product is the cosine already; squared L2 is 2 - 2 * cosine.
+    """
+    distances = np.asarray(distances, dtype="float32")
+    cosine = distances if metric == faiss.METRIC_INNER_PRODUCT else 1 - distances / 2
+    return np.clip(cosine, 0.0, 1.0)
@@ -0,0 +1,173 @@
+"""BM25 keyword search over one owner's chunks.
+
+Each term maps to a flat array("q") of postings, one int64 per chunk that
+contains the term:
+
+    chunk_id << 24 | min(chunk_length, 65535) << 8 | min(term_frequency, 255)
+
+so a posting costs 8 bytes and nothing else is stored per chunk. Scoring
+decodes whole posting lists with numpy and accumulates BM25 per chunk with
+one bincount, so a query touches only the lists of its own terms.
+"""
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_ID_SHIFT = 24
+_LENGTH_SHIFT = 8
+_MAX_LENGTH = 0xFFFF
+_MAX_TF = 0xFF
+
+# Words, and identifiers such as INV-2023-0042, a/b/c or 3.14
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-/.]\w+)*")
+_SEPARATORS = re.compile(r"[-/.]")
+
+# Frequent words carry no signal for BM25 and have the longest posting lists
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or "
+    "that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercased terms. Compound identifiers yield the whole identifier
+    and its parts, so "INV-2023-0042" matches both exactly and by piece."""
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text.lower()):
+        parts = _SEPARATORS.split(match)
+        if len(parts) > 1:
+            tokens.append(match)
+        tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+class KeywordIndex:
+    """Incrementally built BM25 inverted index.
+
+    Removed chunks keep their postings until compact() is called; callers
+    filter them out of results.
+    """
+
+    def __init__(self):
+        self.postings = {}  # term -> array("q") of packed postings
+        self.chunk_count = 0  # chunks added, including removed ones not compacted yet
+        self.total_length = 0
+        self._removed = set()  # chunk IDs marked removed since the last compact()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.chunk_count - self.removed_count
+
+    @property
+    def removed_count(self) -> int:
+        return len(self._removed)
+
+    def add(self, chunk_ids, texts):
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                base = int(chunk_id) << _ID_SHIFT | min(length, _MAX_LENGTH) << _LENGTH_SHIFT
+                for term, tf in terms.items():
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        posting = self.postings[term] = array("q")
+                    posting.append(base | min(tf, _MAX_TF))
+                self.chunk_count += 1
+                self.total_length += length
+
+    def mark_removed(self, chunk_ids):
+        """Leave added chunks out of len() and drop their postings at the next compact()."""
+        with self._lock:
+            self._removed.update(int(chunk_id) for chunk_id in chunk_ids)
+
+    def compact(self):
+        """Drop postings of removed chunks.
+
+        Runs under the lock, so chunks marked removed meanwhile wait for the
+        next compact() instead of being lost.
+        """
+        with self._lock:
+            if not self._removed:
+                return
+            removed_ids = np.fromiter(self._removed, dtype="int64", count=len(self._removed))
+            postings = {}
+            lengths = {}  # removed chunk_id -> length
+            for term, posting in self.postings.items():
+                packed = np.frombuffer(posting, dtype="int64")
+                gone = np.isin(packed >> _ID_SHIFT, removed_ids)
+                if not gone.any():
+                    postings[term] = posting
+                    continue
+                dropped = packed[gone]
+                lengths.update(zip((dropped >> _ID_SHIFT).tolist(), ((dropped >> _LENGTH_SHIFT) & _MAX_LENGTH).tolist()))
+                if not gone.all():
+                    postings[term] = array("q", packed[~gone].tobytes())
+            packed = None  # a view left alive would make add() raise BufferError
+            self.postings = postings
+            self.chunk_count -= len(removed_ids)
+            self.total_length -= sum(lengths.values())
+            self._removed = set()
+
+    def search(self, query: str, top_k: int, allowed: np.ndarray = None) -> list:
+        """Best chunks for the query by BM25.
+
+        Args:
+            allowed: Ascending chunk IDs that may be returned, or None for any
+
+        Returns:
+            [(chunk_id, score)] best first
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            live = max(len(self), 1)
+            average_length = self.total_length / max(self.chunk_count, 1) or 1.0
+            ids, scores = [], []
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                packed = np.frombuffer(posting, dtype="int64")
+                df = len(packed)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                tf = (packed & _MAX_TF).astype("float32")
+                length = ((packed >> _LENGTH_SHIFT) & _MAX_LENGTH).astype("float32")
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                ids.append(packed >> _ID_SHIFT)
+                scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+            packed = None  # the arrays kept above are computed, not views
+        if not ids:
+            return []
+
+        chunk_ids, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        if allowed is not None:
+            positions = np.minimum(np.searchsorted(allowed, chunk_ids), max(len(allowed) - 1, 0))
+            keep = allowed[positions] == chunk_ids if len(allowed) else np.zeros(len(chunk_ids), dtype=bool)
+            chunk_ids, totals = chunk_ids[keep], totals[keep]
+        if len(chunk_ids) > top_k:
+            best = np.argpartition(-totals, top_k)[:top_k]
+            chunk_ids, totals = chunk_ids[best], totals[best]
+        order = np.argsort(-totals, kind="stable")
+        return [(int(chunk_ids[i]), float(totals[i])) for i in order]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuse ranked lists of chunk IDs: score = sum of 1 / (k + rank).
+
+    Returns:
+        [(chunk_id, fused_score)] best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
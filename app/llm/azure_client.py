@@ -1,18 +1,46 @@
+import asyncio
 import os
+import random
+import httpx
+import openai
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 
 # Load .env variables
 load_dotenv()
 
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
+# "azure", or "fake" for the offline client in fake_client.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure")
 
 DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 
+# Seconds allowed for a whole request and for opening a connection
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+# Retries after a 429, 5xx, timeout or connection error
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Backoff before retry n is uniform in [0, min(max, base * 2**n)]
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# Requests in flight to the LLM at once, per worker process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Pooled HTTP connections kept by the async client
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+_timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+if LLM_BACKEND == "fake":
+    from app.llm.fake_client import FakeOpenAI
+    client = FakeOpenAI()
+else:
+    client = AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        timeout=_timeout,
+        max_retries=LLM_MAX_RETRIES
+    )
+
 
 def chat_completion(messages: list[str]) -> str:
     """
@@ -27,3 +55,142 @@ def chat_completion(messages: list[str]) -> str:
     )
 
     return response.choices[0].message.content
+
+
+# -------------------------
+# ASYNC CLIENT
+# -------------------------
+
+def create_async_client(azure_endpoint: str = None, api_key: str = None, api_version: str = None):
+    """
+    Async client over a pooled httpx connection pool.
+    Its own retries are disabled; achat_completion retries with jitter.
+    """
+    if LLM_BACKEND == "fake" and azure_endpoint is None:
+        from app.llm.fake_client import AsyncFakeOpenAI
+        return AsyncFakeOpenAI()
+    return AsyncAzureOpenAI(
+        api_key=api_key or os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=api_version or os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT"),
+        timeout=_timeout,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=_timeout,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        ),
+    )
+
+# Pooled connections and the semaphore belong to one event loop. uvicorn
+# runs a single loop per worker; they are only recreated if the loop
+# changes, e.g. between test clients. The app's lifespan closes the
+# client on shutdown.
+_loop = None
+_async_client = None
+_semaphore = None
+
+def _loop_state():
+    global _loop, _async_client, _semaphore
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:
+        previous_loop, previous_client = _loop, _async_client
+        _loop = loop
+        _async_client = create_async_client()
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        if previous_client is not None and previous_loop.is_running():
+            # Its connections belong to the other loop; close them there
+            asyncio.run_coroutine_threadsafe(previous_client.close(), previous_loop)
+    return _async_client, _semaphore
+
+async def aclose_async_client():
+    """Close the shared async client and its connection pool, if one was created."""
+    global _loop, _async_client, _semaphore
+    llm_client = _async_client
+    _loop = _async_client = _semaphore = None
+    if llm_client is not None:
+        await llm_client.close()
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        # Never retry sooner than the server asked
+        return max(delay, min(float(retry_after), LLM_RETRY_MAX_SECONDS))
+    except (TypeError, ValueError):
+        return delay
+
+class _NoLimit:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+async def _with_retries(request, llm_client=None, limit: bool = True):
+    """
+    Run `await request(client)`, retrying retryable failures. With
+    `limit`, each attempt holds a concurrency slot, released while
+    backing off.
+    """
+    default_client, semaphore = _loop_state()
+    llm_client = llm_client or default_client
+    slot = semaphore if limit else _NoLimit()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with slot:
+                return await request(llm_client)
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt, e)
+            print(f"LLM request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+async def achat_completion(messages: list[str], llm_client=None) -> str:
+    """
+    Async chat_completion with timeouts, retries and the global
+    concurrency limit.
+    """
+    async def request(llm_client):
+        response = await llm_client.chat.completions.create(
+            model=DEPLOYMENT_NAME,
+            messages=[
+                {"role": "user", "content": msg} for msg in messages
+            ],
+            temperature=0.2
+        )
+        return response.choices[0].message.content
+
+    return await _with_retries(request, llm_client)
+
+async def achat_completion_stream(messages: list[str], llm_client=None):
+    """
+    Async chat_completion, yielding the response text piece by piece as
+    it is generated. Opening the stream is retried; once
+    tokens have been yielded, errors are raised to the caller.
+    One concurrency slot is held from the first attempt until the
+    stream ends.
+    """
+    _, semaphore = _loop_state()
+
+    async def request(llm_client):
+        return await llm_client.chat.completions.create(
+            model=DEPLOYMENT_NAME,
+            messages=[
+                {"role": "user", "content": msg} for msg in messages
+            ],
+            temperature=0.2,
+            stream=True
+        )
+
+    async with semaphore:
+        stream = await _with_retries(request, llm_client, limit=False)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
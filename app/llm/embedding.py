@@ -1,29 +1,237 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from functools import lru_cache
+from app.llm.embedding_backends import BACKENDS, EmbeddingBackend, create_backend
+from app.utils.disk_cache import DiskLRUCache
 
-# Load the model once at module level
-print("Loading sentence transformer model...")
-try:
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    # Warm up the model with a test encoding
-    _ = model.encode("test", convert_to_numpy=True)
-    print(f"Model loaded successfully! Embedding dimension: {model.get_sentence_embedding_dimension()}")
-except Exception as e:
-    print(f"ERROR loading model: {e}")
-    raise
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# "torch" (default), "onnx" or "onnx-int8"; see app/llm/embedding_backends.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+if EMBEDDING_BACKEND not in BACKENDS:
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {BACKENDS}, got {EMBEDDING_BACKEND!r}")
+
+# Loaded on first use (or by the startup warm-up in app.main), so importing
+# this module doesn't pull in torch or the model weights
+_model = None
+_model_lock = threading.Lock()
+
+def get_model() -> EmbeddingBackend:
+    """The embedding backend, loaded and warmed up on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print(f"Loading {MODEL_NAME} on the {EMBEDDING_BACKEND} backend...")
+                try:
+                    model = create_backend(EMBEDDING_BACKEND, MODEL_NAME)
+                    # Warm up the model with a test encoding
+                    dim = model.encode(["test"]).shape[1]
+                    if dim != DIM:
+                        raise ValueError(f"{EMBEDDING_BACKEND} backend returns {dim}-dim vectors, expected {DIM}")
+                    print(f"Model loaded successfully! Embedding dimension: {dim}")
+                except Exception as e:
+                    print(f"ERROR loading model: {e}")
+                    raise
+                _model = model
+    return _model
+
+def model_loaded() -> bool:
+    return _model is not None
 
 DIM = 384  # Dimension for all-MiniLM-L6-v2
 
-def embed_text(text: str) -> list[float]:
+# Texts per forward pass when embedding many texts at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Chunk embeddings keyed by content hash, shared across uploads and restarts
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+embedding_cache = DiskLRUCache(
+    os.path.join(CACHE_DIR, "embeddings.sqlite"), EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+)
+
+# Query embeddings kept in memory, keyed on normalized query text
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+# Concurrent query embeddings are batched into one encode call: a batch
+# closes after this many queries or this many ms after its first query
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "2"))
+
+def embed_texts(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
     """
-    Generate semantic embeddings using sentence transformers.
-    Returns normalized 384-dimensional vector.
+    Embed many texts in batched forward passes.
+    Returns a (len(texts), DIM) float32 array of normalized vectors.
     """
+    if not texts:
+        return np.empty((0, DIM), dtype="float32")
     try:
-        embedding = model.encode(text, convert_to_numpy=True, show_progress_bar=False)
-        # Normalize the embedding
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding.tolist()
+        embeddings = get_model().encode(texts, batch_size=batch_size).astype("float32", copy=False)
+        # Normalize all rows at once
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
     except Exception as e:
-        print(f"ERROR in embed_text: {e}")
+        print(f"ERROR in embed_texts: {e}")
         raise
+
+def embed_text(text: str) -> list[float]:
+    """
+    Generate semantic embeddings using sentence transformers.
+    Returns normalized 384-dimensional vector.
+    """
+    return embed_texts([text])[0].tolist()
+
+
+# Vectors from another model, or another backend of it, are not reused;
+# torch keeps the plain model name so existing cache entries stay valid
+_MODEL_ID = MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{MODEL_NAME}:{EMBEDDING_BACKEND}"
+
+def _embedding_key(text: str) -> str:
+    return hashlib.sha256(f"{_MODEL_ID}\0{text}".encode("utf-8")).hexdigest()
+
+def forget_embeddings(texts: list[str]):
+    """Drop the cached embeddings of these texts, e.g. of a deleted document's chunks."""
+    embedding_cache.delete_many(list({_embedding_key(text) for text in texts}))
+
+def embed_chunks(texts: list[str]) -> np.ndarray:
+    """
+    Like embed_texts, but identical texts are embedded once and
+    previously seen texts are served from the disk cache.
+    """
+    keys = [_embedding_key(text) for text in texts]
+    cached = embedding_cache.get_many(list(set(keys)))
+    embeddings = np.empty((len(texts), DIM), dtype="float32")
+
+    missing = {}  # key -> positions of texts with that key
+    for i, key in enumerate(keys):
+        if key in cached:
+            embeddings[i] = np.frombuffer(cached[key], dtype="float32")
+        else:
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        fresh = embed_texts([texts[positions[0]] for positions in missing.values()])
+        for vector, positions in zip(fresh, missing.values()):
+            embeddings[positions] = vector
+        embedding_cache.set_many({key: vector.tobytes() for key, vector in zip(missing, fresh)})
+    return embeddings
+
+
+def normalize_query(text: str) -> str:
+    # The model's tokenizer is uncased and ignores extra whitespace,
+    # so this does not change the embedding
+    return " ".join(text.lower().split())
+
+class EmbeddingBatcher:
+    """Micro-batches single-text embedding requests from many threads.
+
+    A background thread takes the first waiting request, collects more
+    until `max_batch_size` are gathered or `max_wait_ms` has passed, runs
+    one `encode` over the distinct texts and hands each caller its row.
+
+    Args:
+        encode: Function mapping a list of texts to a (len, DIM) array
+        max_batch_size: Requests per encode call
+        max_wait_ms: Longest time a request waits for others to join
+    """
+
+    def __init__(self, encode, max_batch_size: int, max_wait_ms: float):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Counter()  # batch size -> number of batches
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and self.max_wait > 0
+
+    def embed(self, text: str) -> np.ndarray:
+        """(1, DIM) embedding of `text`, computed in a shared batch."""
+        if not self.enabled:
+            self.batch_sizes[1] += 1
+            return self.encode([text])
+        self._start()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batch_sizes[len(batch)] += 1
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                embeddings = self.encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            # Copies, so a cached row does not pin the whole batch array
+            rows = {text: embeddings[i:i + 1].copy() for i, text in enumerate(texts)}
+            for text, future in batch:
+                future.set_result(rows[text])
+
+    def stats(self) -> dict:
+        sizes = dict(self.batch_sizes)
+        batches = sum(sizes.values())
+        requests = sum(size * count for size, count in sizes.items())
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "max_batch_size": max(sizes, default=0),
+            "batch_sizes": dict(sorted(sizes.items())),
+            "max_batch_size_limit": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+query_batcher = EmbeddingBatcher(embed_texts, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_MAX_WAIT_MS)
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_normalized_query(normalized: str) -> np.ndarray:
+    embedding = query_batcher.embed(normalized)
+    embedding.setflags(write=False)
+    return embedding
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Embed a search query as a (1, DIM) float32 array.
+    Repeated queries are served from an in-memory LRU cache; the
+    returned array is shared and read-only. Concurrent misses are
+    embedded together by query_batcher.
+    """
+    return _embed_normalized_query(normalize_query(text))
+
+def query_cache_stats() -> dict:
+    info = _embed_normalized_query.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
@@ -0,0 +1,160 @@
+"""Embedding backends: the same sentence-transformers model on different runtimes.
+
+    torch      SentenceTransformer on PyTorch (reference)
+    onnx       the model's transformer exported to ONNX, run by ONNX Runtime
+    onnx-int8  the ONNX export with weights dynamically quantized to int8
+
+The ONNX backends apply the same mean pooling as SentenceTransformer, so
+vectors have the same dimension and near-identical direction (see
+tests/test_embedding_backends.py). The export needs torch and
+sentence-transformers once; it is written to ONNX_MODEL_DIR and later
+loads only need onnxruntime and transformers' tokenizer.
+"""
+import abc
+import json
+import os
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Exported ONNX models and tokenizer files
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join("models", "onnx"))
+# ONNX Runtime threads per inference; 0 lets it use every core
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+ONNX_CONFIG_FILE = "embedding_config.json"
+
+
+class EmbeddingBackend(abc.ABC):
+    """Turns texts into (len(texts), dim) float32 embeddings, not yet normalized."""
+
+    name = None
+
+    @abc.abstractmethod
+    def encode(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        """Embed `texts` in batches of `batch_size`."""
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool = True):
+    """Export the model's transformer to ONNX, and an int8 copy if `quantize`.
+
+    Needs torch and sentence-transformers; the ONNX backends don't.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0]
+    tokenizer = transformer.tokenizer
+    auto_model = transformer.auto_model.eval()
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(model_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(auto_model),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({"model_name": model_name, "max_seq_length": sentence_model.max_seq_length}, f)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(model_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    print(f"Exported {model_name} to {model_dir}")
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime on CPU, exporting the model first if it isn't in model_dir."""
+
+    def __init__(self, model_name: str, model_dir: str = None, quantized: bool = False):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        model_dir = model_dir or os.path.join(ONNX_MODEL_DIR, model_name)
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(path):
+            export_onnx(model_name, model_dir, quantize=quantized)
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            config = json.load(f)
+        if config["model_name"] != model_name:
+            raise ValueError(f"{model_dir} holds {config['model_name']}, not {model_name}")
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def encode(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype="float32")
+        # Batch texts of similar length together to cut padding
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            batch = self.tokenizer(
+                [texts[i] for i in positions],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feed = {name: batch[name].astype("int64") for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            # Mean pooling over real tokens, as SentenceTransformer does
+            mask = batch["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            for position, vector in zip(positions, pooled):
+                embeddings[position] = vector
+        return np.stack(embeddings).astype("float32", copy=False)
+
+
+def create_backend(name: str, model_name: str, model_dir: str = None) -> EmbeddingBackend:
+    """Backend by name, one of BACKENDS."""
+    if name == "torch":
+        return TorchBackend(model_name)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, model_dir, quantized=name == "onnx-int8")
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {BACKENDS}, got {name!r}")
@@ -0,0 +1,63 @@
+"""Offline stand-in for the AzureOpenAI client (LLM_BACKEND=fake).
+
+Mirrors the slice of the openai client API that azure_client uses,
+`client.chat.completions.create(...)`, plus `stream=True` on the async
+client, and answers deterministically so endpoints can be exercised
+without network access or credentials.
+"""
+import asyncio
+import os
+import re
+from types import SimpleNamespace
+
+# Fixed reply text; by default the reply echoes the start of the last message
+FAKE_LLM_RESPONSE = os.getenv("FAKE_LLM_RESPONSE")
+# Delay before each streamed token, to make time-to-first-byte visible
+FAKE_LLM_TOKEN_DELAY_MS = float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "0"))
+
+
+def fake_reply(messages: list) -> str:
+    if FAKE_LLM_RESPONSE is not None:
+        return FAKE_LLM_RESPONSE
+    last = " ".join(messages[-1]["content"].split()) if messages else ""
+    return f"Fake answer. You asked: {last[:200]}"
+
+
+def _tokens(text: str) -> list:
+    # Words with their leading whitespace, like real streamed deltas
+    return re.findall(r"\s*\S+", text)
+
+
+class _Completions:
+    def create(self, model=None, messages=(), temperature=None, **kwargs):
+        message = SimpleNamespace(role="assistant", content=fake_reply(list(messages)))
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model=None, messages=(), temperature=None, stream=False, **kwargs):
+        if not stream:
+            return super().create(model, messages, temperature)
+        return self._astream(fake_reply(list(messages)))
+
+    async def _astream(self, reply: str):
+        for token in _tokens(reply):
+            if FAKE_LLM_TOKEN_DELAY_MS:
+                await asyncio.sleep(FAKE_LLM_TOKEN_DELAY_MS / 1000)
+            delta = SimpleNamespace(content=token)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+        done = SimpleNamespace(content=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=done, finish_reason="stop")])
+
+
+class AsyncFakeOpenAI:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions())
+
+    async def close(self):
+        pass
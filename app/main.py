@@ -1,29 +1,93 @@
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session, sessionmaker
 from pydantic import BaseModel
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_path
-import tempfile
+from contextlib import asynccontextmanager
+import json
 import os
+import threading
 
 from app.database import get_db
 from app.models.user import User
 from app.models.document import Document
 from app.schemas.user import UserCreate, UserResponse
-from app.schemas.document import DocumentCreate, DocumentResponse
+from app.schemas.document import DocumentContentUpdate, DocumentCreate, DocumentResponse
 
 # ✅ CORRECT imports (FIXED)
 from app.vector_store import (
+    SEARCH_MODES,
+    delete_document_chunks,
+    ensure_index_loaded,
     index_document_chunks,
+    index_loaded,
     search_similar_chunks,
 )
+from app.llm.azure_client import aclose_async_client
+from app.llm.embedding import get_model, model_loaded
+from app.services.ingestion import (
+    IngestionJob,
+    QueueFullError,
+    forget_extraction,
+    is_supported,
+    job_queue,
+    run_ingestion,
+    save_upload,
+)
+
+from app.agents.answer_cache_node import lookup_answer, remember_answer
+from app.agents.answer_node import astream_answer, build_prompt
+from app.agents.graph import qa_agent, routing_agent
+
+# Set if the background warm-up failed; reported by /readyz
+warm_up_error = None
+
+
+def warm_up():
+    """Load the embedding model and vector index off the request path.
+
+    Requests that need them before this finishes load them on demand.
+    """
+    global warm_up_error
+    try:
+        get_model()
+        ensure_index_loaded()
+        print("Warm-up done, ready to serve searches")
+    except Exception as e:
+        print(f"ERROR during warm-up: {e}")
+        warm_up_error = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start serving right away; /readyz reports when warm-up is done
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    await aclose_async_client()
+
 
-from app.agents.graph import qa_agent
+app = FastAPI(lifespan=lifespan)
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-app = FastAPI()
+# -------------------------
+# HEALTH
+# -------------------------
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the embedding model and vector index are loaded (503 until then)."""
+    checks = {"model": model_loaded(), "index": index_loaded()}
+    ready = all(checks.values())
+    body = {"status": "ready" if ready else "starting", **checks}
+    if warm_up_error and not ready:
+        body["error"] = warm_up_error
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 # -------------------------
 # USERS
@@ -67,28 +131,42 @@ def get_user_documents(user_id: int, db: Session = Depends(get_db)):
     return db.query(Document).filter(Document.owner_id == user_id).all()
 
 
-# -------------------------
-# OCR HELPERS
-# -------------------------
+@app.delete("/documents/{document_id}")
+def delete_document(document_id: int, db: Session = Depends(get_db)):
+    document = db.get(Document, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
 
-def extract_text_from_image(path: str) -> str:
-    image = Image.open(path)
-    return pytesseract.image_to_string(image)
+    # Vectors first: a failure leaves the row, so the delete can be retried
+    chunks_removed = delete_document_chunks(document.id, document.owner_id)
+    owner_id = document.owner_id
+    db.delete(document)
+    db.commit()
+    # Again, for chunks an upload job published after the first pass; a job
+    # publishing later than this sees the row gone and removes its own
+    chunks_removed += delete_document_chunks(document_id, owner_id)
+    forget_extraction(document_id)
+    return {"document_id": document_id, "chunks_removed": chunks_removed}
 
 
-def extract_text_from_pdf(path: str) -> str:
-    pages = convert_from_path(path)
-    text = ""
-    for page in pages:
-        text += pytesseract.image_to_string(page) + "\n"
-    return text
+@app.put("/documents/{document_id}/content", response_model=DocumentResponse)
+def update_document_content(document_id: int, update: DocumentContentUpdate, db: Session = Depends(get_db)):
+    document = db.get(Document, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    document.content = update.content
+    db.commit()
+    db.refresh(document)
+    index_document_chunks(document.id, update.content, document.owner_id, replace=True)
+    return document
 
 
 # -------------------------
-# OCR UPLOAD
+# OCR UPLOAD (BACKGROUND JOBS)
 # -------------------------
 
-@app.post("/documents/upload", status_code=201)
+@app.post("/documents/upload", status_code=202)
 def upload_document(
     owner_id: int,
     file: UploadFile = File(...),
@@ -97,38 +175,38 @@ def upload_document(
     owner = db.query(User).filter(User.id == owner_id).first()
     if not owner:
         raise HTTPException(status_code=404, detail="User not found")
+    if not is_supported(file.content_type):
+        raise HTTPException(status_code=415, detail="Unsupported file type")
 
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(file.file.read())
-        temp_path = tmp.name
-
-    try:
-        if file.content_type.startswith("image/"):
-            extracted_text = extract_text_from_image(temp_path)
-        elif file.content_type == "application/pdf":
-            extracted_text = extract_text_from_pdf(temp_path)
-        else:
-            raise HTTPException(status_code=415, detail="Unsupported file type")
-    finally:
-        os.remove(temp_path)
-
-    document = Document(
-        title=file.filename,
-        content=extracted_text,
-        owner_id=owner_id,
-    )
+    # Stream the upload to disk instead of reading it into memory
+    temp_path, content_hash = save_upload(file.file)
 
+    # Content is filled in by the background job
+    document = Document(title=file.filename, owner_id=owner_id)
     db.add(document)
     db.commit()
     db.refresh(document)
 
-    # ✅ INDEX CHUNKS INTO FAISS
-    index_document_chunks(document.id, document.content, document.owner_id)
+    job = IngestionJob(owner_id, document.id, file.filename, file.content_type, content_hash)
+    # The job outlives this request's session; it opens its own on the same database
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    try:
+        job_queue.submit(job, run_ingestion, temp_path, session_factory)
+    except QueueFullError:
+        os.remove(temp_path)
+        db.delete(document)
+        db.commit()
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, retry later")
 
-    return {
-        "document_id": document.id,
-        "extracted_text": extracted_text,
-    }
+    return job.to_dict()
+
+
+@app.get("/documents/jobs/{job_id}")
+def get_upload_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 # -------------------------
@@ -136,8 +214,10 @@ def upload_document(
 # -------------------------
 
 @app.post("/search")
-def semantic_search(query: str, owner_id: int, top_k: int = 5):
-    return search_similar_chunks(query, owner_id, top_k)
+def semantic_search(query: str, owner_id: int, top_k: int = 5, mode: str = "vector"):
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(SEARCH_MODES)}")
+    return search_similar_chunks(query, owner_id, top_k, mode=mode)
 
 
 # -------------------------
@@ -150,18 +230,82 @@ class AskRequest(BaseModel):
 
 
 @app.post("/ai/ask")
-def ask_ai(req: AskRequest):
-    result = qa_agent.invoke({"question": req.question, "owner_id": req.owner_id})
+async def ask_ai(req: AskRequest):
+    result = await qa_agent.ainvoke({"question": req.question, "owner_id": req.owner_id})
     return {"answer": result["answer"]}
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ai/ask/stream")
+async def ask_ai_stream(req: AskRequest):
+    """
+    Server-Sent Events version of /ai/ask:
+    - "route": {"from_documents": bool} once routing and retrieval are done
+    - "token": {"text": str} pieces of the answer as the LLM generates them
+    - "done": {"answer": str} the full answer, identical to /ai/ask
+    - "error": {"detail": str} if generation fails midway
+    """
+    async def events():
+        try:
+            cached, lookup = await run_in_threadpool(lookup_answer, req.question, req.owner_id)
+            if cached is not None:
+                yield _sse("route", {"from_documents": cached["from_documents"]})
+                yield _sse("token", {"text": cached["answer"]})
+                yield _sse("done", {"answer": cached["answer"]})
+                return
+            state = await routing_agent.ainvoke({"question": req.question, "owner_id": req.owner_id})
+            from_documents, prompt = build_prompt(state)
+            yield _sse("route", {"from_documents": from_documents})
+            pieces = []
+            async for text in astream_answer(from_documents, prompt):
+                pieces.append(text)
+                yield _sse("token", {"text": text})
+            answer = "".join(pieces)
+            remember_answer(req.question, req.owner_id, lookup, answer, from_documents)
+            yield _sse("done", {"answer": answer})
+        except Exception as e:
+            print(f"ERROR in /ai/ask/stream: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop nginx-style proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/debug/index_size")
 def get_index_size():
-    from app.vector_store import index, chunk_metadata
+    ensure_index_loaded()
+    from app.vector_store import owner_snapshots, chunk_metadata, total_vectors, list_owners, owner_chunk_count, owner_index_type
+    owners = list_owners()
     return {
-        "index_size": index.ntotal,
+        "index_size": total_vectors(),
+        "partition_count": len(owner_snapshots),
         "metadata_count": len(chunk_metadata),
-        "owners": list(set([m["owner_id"] for m in chunk_metadata])) if chunk_metadata else []
+        "owners": owners,
+        "chunks_per_owner": {owner_id: owner_chunk_count(owner_id) for owner_id in owners},
+        "index_type_per_owner": {owner_id: owner_index_type(owner_id) for owner_id in owners},
+    }
+
+
+@app.get("/debug/cache_stats")
+def get_cache_stats():
+    from app.llm.embedding import query_cache_stats, query_batcher, embedding_cache
+    from app.services.ingestion import extraction_cache
+    from app.vector_store import result_cache
+    from app.agents.answer_cache_node import answer_cache
+    return {
+        "answers": answer_cache.stats(),
+        "query_embeddings": query_cache_stats(),
+        "query_batches": query_batcher.stats(),
+        "search_results": result_cache.stats(),
+        "chunk_embeddings": embedding_cache.stats(),
+        "extractions": extraction_cache.stats(),
     }
 
 
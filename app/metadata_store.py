@@ -0,0 +1,224 @@
+"""Columnar, memory-mapped chunk metadata.
+
+Each segment stores its metadata as separate files:
+
+    document_ids.npy   int64 (rows,)
+    owner_ids.npy      int64 (rows,)
+    chunk_hashes.npy   uint64 (rows,) see chunk_hash()
+    char_starts.npy    int64 (rows,) offset of the chunk in its document, -1 if unknown
+    pages.npy          int64 (rows,) 1-based page the chunk starts on, 0 if unknown
+    text_offsets.npy   int64 (rows + 1,) byte offsets into text.bin
+    text.bin           UTF-8 chunk texts, concatenated
+
+All of them are mapped read-only, so chunk text lives in the OS page cache
+and is shared by every worker process instead of being unpickled into each
+one. Column data is passed around as a dict with one entry per column plus
+"text_offsets" and "text".
+"""
+import bisect
+import hashlib
+import mmap
+import os
+
+import numpy as np
+
+# Fixed-width columns stored as <name>.npy
+COLUMNS = {
+    "document_ids": "int64",
+    "owner_ids": "int64",
+    "chunk_hashes": "uint64",
+    "char_starts": "int64",
+    "pages": "int64",
+}
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+TEXT_FILE = "text.bin"
+
+
+def chunk_hash(text: str) -> int:
+    """64-bit content hash of a chunk's text."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def _save_npy(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_columns(directory: str, columns: dict):
+    """Write one segment's metadata columns into `directory`."""
+    for name, dtype in COLUMNS.items():
+        _save_npy(os.path.join(directory, f"{name}.npy"), np.asarray(columns[name], dtype=dtype))
+    _save_npy(os.path.join(directory, TEXT_OFFSETS_FILE), np.asarray(columns["text_offsets"], dtype="int64"))
+    with open(os.path.join(directory, TEXT_FILE), "wb") as f:
+        f.write(columns["text"])
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def columns_from_dicts(metadata: list) -> dict:
+    """Convert [{"document_id", "owner_id", "text"}, ...] into column data.
+
+    Optional "chunk_hash", "start" and "page" entries are stored too.
+    """
+    encoded = [meta["text"].encode("utf-8") for meta in metadata]
+    text_offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(text) for text in encoded], out=text_offsets[1:])
+    return {
+        "document_ids": np.array([meta["document_id"] for meta in metadata], dtype="int64"),
+        "owner_ids": np.array([meta["owner_id"] for meta in metadata], dtype="int64"),
+        "chunk_hashes": np.array(
+            [meta.get("chunk_hash", chunk_hash(meta["text"])) for meta in metadata], dtype="uint64"
+        ),
+        "char_starts": np.array([meta.get("start", -1) for meta in metadata], dtype="int64"),
+        "pages": np.array([meta.get("page", 0) for meta in metadata], dtype="int64"),
+        "text_offsets": text_offsets,
+        "text": b"".join(encoded),
+    }
+
+
+class MetadataSegment:
+    """Read-only view of one segment's metadata columns."""
+
+    def __init__(self, columns: dict):
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+        self.text_offsets = columns["text_offsets"]
+        self.text = columns["text"]  # mmap or bytes
+
+    @classmethod
+    def open(cls, directory: str) -> "MetadataSegment":
+        columns = {"text_offsets": np.load(os.path.join(directory, TEXT_OFFSETS_FILE), mmap_mode="r")}
+        with open(os.path.join(directory, TEXT_FILE), "rb") as f:
+            # Zero-length files cannot be mapped
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        if hasattr(mmap, "MADV_RANDOM") and isinstance(text, mmap.mmap):
+            # Rows are read by ID, readahead would only pull in unrelated text
+            text.madvise(mmap.MADV_RANDOM)
+        columns["text"] = text
+
+        for name in COLUMNS:
+            columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        segment = cls(columns)
+
+        rows = len(segment)
+        if segment.text_offsets[rows] > len(text):
+            raise ValueError(f"text offsets exceed {TEXT_FILE} size in {directory}")
+        return segment
+
+    def __len__(self) -> int:
+        return min(min(len(getattr(self, name)) for name in COLUMNS), len(self.text_offsets) - 1)
+
+    def get_text(self, row: int) -> str:
+        return self.text[self.text_offsets[row]:self.text_offsets[row + 1]].decode("utf-8")
+
+    def row(self, row: int) -> dict:
+        return {
+            "document_id": int(self.document_ids[row]),
+            "owner_id": int(self.owner_ids[row]),
+            "text": self.get_text(row),
+            "start": int(self.char_starts[row]),
+            "page": int(self.pages[row]),
+        }
+
+    def columns(self, rows: int = None) -> dict:
+        """Column data for the first `rows` rows, ready for write_columns."""
+        rows = len(self) if rows is None else rows
+        text_offsets = np.array(self.text_offsets[:rows + 1], dtype="int64")
+        columns = {name: np.array(getattr(self, name)[:rows]) for name in COLUMNS}
+        columns["text_offsets"] = text_offsets - text_offsets[0]
+        columns["text"] = bytes(self.text[text_offsets[0]:text_offsets[-1]])
+        return columns
+
+
+def concat_columns(parts: list) -> dict:
+    """Concatenate column data from several segments into one."""
+    text_offsets = [np.zeros(1, dtype="int64")]
+    base = 0
+    for part in parts:
+        text_offsets.append(part["text_offsets"][1:] + base)
+        base += len(part["text"])
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+    columns["text_offsets"] = np.concatenate(text_offsets)
+    columns["text"] = b"".join(part["text"] for part in parts)
+    return columns
+
+
+class ChunkMetadataStore:
+    """Sequence of chunk metadata rows spread over mapped segments.
+
+    Indexing by global row returns {"document_id", "owner_id", "text",
+    "start", "page"}, the old list-of-dicts entries plus the chunk's
+    position in its document.
+    """
+
+    def __init__(self, segments=None):
+        self.set_segments(segments or [])
+
+    @property
+    def segments(self) -> list:
+        return list(self._layout[0])
+
+    def set_segments(self, segments: list):
+        segments = tuple(segments)
+        starts = []
+        total = 0
+        for segment in segments:
+            starts.append(total)
+            total += len(segment)
+        # One immutable (segments, starts, total) tuple, replaced in a single
+        # assignment, so concurrent lookups see the old or the new layout
+        self._layout = (segments, tuple(starts), total)
+
+    def add_segment(self, segment: MetadataSegment):
+        segments, _, _ = self._layout
+        self.set_segments(segments + (segment,))
+
+    def __len__(self) -> int:
+        return self._layout[2]
+
+    def _locate(self, row: int):
+        segments, starts, total = self._layout
+        if row < 0:
+            row += total
+        if not 0 <= row < total:
+            raise IndexError(f"chunk {row} out of range")
+        position = bisect.bisect_right(starts, row) - 1
+        return segments[position], row - starts[position]
+
+    def __getitem__(self, row: int) -> dict:
+        segment, local_row = self._locate(int(row))
+        return segment.row(local_row)
+
+    def __iter__(self):
+        for segment in self._layout[0]:
+            for local_row in range(len(segment)):
+                yield segment.row(local_row)
+
+    def column(self, name: str) -> np.ndarray:
+        """A whole column across all segments."""
+        segments = self._layout[0]
+        if not segments:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.concatenate([getattr(segment, name)[:len(segment)] for segment in segments])
+
+    def gather(self, name: str, rows) -> np.ndarray:
+        """Column values for the given global rows; costs O(len(rows))."""
+        rows = np.asarray(rows, dtype="int64")
+        values = np.empty(len(rows), dtype=COLUMNS[name])
+        if not len(rows):
+            return values
+        segments, starts, _ = self._layout
+        starts = np.asarray(starts, dtype="int64")
+        positions = np.searchsorted(starts, rows, side="right") - 1
+        for position in np.unique(positions):
+            mask = positions == position
+            values[mask] = getattr(segments[position], name)[rows[mask] - starts[position]]
+        return values
+
+    def owner_ids(self) -> np.ndarray:
+        return self.column("owner_ids")
+
+    def document_ids(self) -> np.ndarray:
+        return self.column("document_ids")
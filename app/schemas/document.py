@@ -7,6 +7,10 @@ class DocumentCreate(BaseModel):
     owner_id: int
 
 
+class DocumentContentUpdate(BaseModel):
+    content: str
+
+
 class DocumentResponse(BaseModel):
     id: int
     title: str
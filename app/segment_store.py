@@ -0,0 +1,541 @@
+"""Append-only, crash-safe persistence for chunk vectors and metadata.
+
+Layout under the store root:
+
+    MANIFEST.json                    ordered list of live segments
+    segments/<name>/vectors.npy      float32 (rows, dim)
+    segments/<name>/*.npy, text.bin  metadata columns (see metadata_store)
+    tombstones.bin                   int64 rows deleted since they were written
+
+Every append writes one new segment into `<name>.tmp`, renames it into
+place and only then publishes it by atomically replacing the manifest, so a
+crash at any point leaves either the old or the new manifest. Directories
+not listed in the manifest are leftovers of an interrupted write and are
+removed on load. Row order across the listed segments is the global chunk
+order. Segment files are memory-mapped read-only once written.
+
+Segments are never modified, so deletes are recorded by appending the
+deleted rows to tombstones.bin; a torn trailing record from a crash is
+dropped on load. purge() then rewrites the segments holding deleted rows,
+each deleted row replaced by an empty placeholder (EMPTY_ID document and
+owner, no text, zero vector), and starts tombstones.bin afresh, so deleted
+text and vectors leave the disk. Placeholder rows are never live.
+
+Global rows are chunk IDs, so they never move. When load() finds a segment
+it cannot read, or one shorter than the manifest says, it rewrites the
+segment with the same row count: rows it could not recover become
+placeholders and are tombstoned.
+
+Several processes (uvicorn workers) can share one store. Writes - load's
+repairs, appends, deletes and compaction - happen under writer_lock(), an
+exclusive file lock, after refresh() has mapped everything other processes
+wrote. Readers call changed() (two stat calls) and then refresh(), which
+maps only the new or rewritten segments and new tombstones. Segments are mapped read-only,
+so the processes share them through the page cache.
+"""
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process per store
+    fcntl = None
+
+from app.metadata_store import (
+    ChunkMetadataStore,
+    MetadataSegment,
+    columns_from_dicts,
+    concat_columns,
+    write_columns,
+)
+
+MANIFEST_FILE = "MANIFEST.json"
+SEGMENTS_DIR = "segments"
+VECTORS_FILE = "vectors.npy"
+TOMBSTONES_FILE = "tombstones.bin"
+LOCK_FILE = "writer.lock"
+# Document and owner ID of placeholder rows, see purge() and load()
+EMPTY_ID = -1
+
+
+def _fsync_dir(path: str):
+    # Directory fsync makes renames durable; not supported on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _empty_rows(count: int, dim: int) -> tuple:
+    """(vectors, columns) of `count` placeholder rows."""
+    metadata = [{"document_id": EMPTY_ID, "owner_id": EMPTY_ID, "text": ""}] * count
+    return np.zeros((count, dim), dtype="float32"), columns_from_dicts(metadata)
+
+
+def _blank_rows(vectors: np.ndarray, columns: dict, rows: np.ndarray) -> tuple:
+    """(vectors, columns) of a segment with the given sorted local rows turned into placeholders."""
+    vectors = np.array(vectors, dtype="float32")
+    vectors[rows] = 0
+    columns = dict(columns)
+    placeholder = _empty_rows(1, 0)[1]
+    for name in ("document_ids", "owner_ids", "chunk_hashes", "char_starts", "pages"):
+        columns[name] = np.array(columns[name])
+        columns[name][rows] = placeholder[name][0]
+    offsets, text = columns["text_offsets"], columns["text"]
+    pieces, start = [], 0
+    for row in rows.tolist():
+        pieces.append(text[offsets[start]:offsets[row]])
+        start = row + 1
+    pieces.append(text[offsets[start]:offsets[-1]])
+    lengths = np.diff(offsets)
+    lengths[rows] = 0
+    columns["text_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+    columns["text"] = b"".join(pieces)
+    return vectors, columns
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+class SegmentStore:
+    """Segmented on-disk log of (vector, metadata) rows.
+
+    Args:
+        root: Directory holding the manifest and segments
+        dim: Vector dimension
+        max_segments: Segment count above which appends trigger compaction
+    """
+
+    def __init__(self, root: str, dim: int, max_segments: int = 16):
+        self.root = root
+        self.dim = dim
+        self.max_segments = max_segments
+        self.segments = []  # [{"name": str, "rows": int}] in row order
+        self.next_segment = 1
+        self.vectors = []  # mapped vectors, aligned with segments
+        self.metadata = ChunkMetadataStore()
+        self.tombstones = np.empty(0, dtype="int64")  # deleted rows, in deletion order
+        self._tombstone_bytes = 0  # length of tombstones.bin already read
+        self._tombstone_inode = None  # of the tombstones.bin read; purge() replaces the file
+        self._seen_files = None  # _file_state() when last loaded or refreshed
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILE)
+
+    @property
+    def segments_path(self) -> str:
+        return os.path.join(self.root, SEGMENTS_DIR)
+
+    @property
+    def tombstones_path(self) -> str:
+        return os.path.join(self.root, TOMBSTONES_FILE)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.manifest_path)
+
+    @property
+    def total_rows(self) -> int:
+        return sum(segment["rows"] for segment in self.segments)
+
+    # -------------------------
+    # Segment files
+    # -------------------------
+
+    def _segment_dir(self, name: str) -> str:
+        return os.path.join(self.segments_path, name)
+
+    def _new_segment_name(self) -> str:
+        name = f"{self.next_segment:08d}"
+        self.next_segment += 1
+        return name
+
+    def _write_segment(self, vectors: np.ndarray, columns) -> dict:
+        name = self._new_segment_name()
+        final_dir = self._segment_dir(name)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        with open(os.path.join(tmp_dir, VECTORS_FILE), "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+            f.flush()
+            os.fsync(f.fileno())
+        write_columns(tmp_dir, columns)
+
+        os.rename(tmp_dir, final_dir)
+        _fsync_dir(self.segments_path)
+        return {"name": name, "rows": len(vectors)}
+
+    def _read_segment(self, name: str):
+        segment_dir = self._segment_dir(name)
+        vectors = np.load(os.path.join(segment_dir, VECTORS_FILE), mmap_mode="r")
+        return vectors, MetadataSegment.open(segment_dir)
+
+    def _write_manifest(self):
+        manifest = {"segments": self.segments, "next_segment": self.next_segment}
+        _atomic_write(self.manifest_path, json.dumps(manifest).encode("utf-8"))
+
+    def _remove_segments(self, names):
+        for name in names:
+            shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+
+    def _read_tombstones(self) -> np.ndarray:
+        self._tombstone_bytes = 0
+        self._tombstone_inode = None
+        if not os.path.isfile(self.tombstones_path):
+            return np.empty(0, dtype="int64")
+        with open(self.tombstones_path, "rb") as f:
+            self._tombstone_inode = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        whole = len(data) - len(data) % 8
+        if whole != len(data):
+            print(f"WARNING: dropping a torn record at the end of {TOMBSTONES_FILE}")
+            with open(self.tombstones_path, "r+b") as f:
+                f.truncate(whole)
+        self._tombstone_bytes = whole
+        return np.frombuffer(data[:whole], dtype="<i8").astype("int64")
+
+    def _read_new_tombstones(self) -> np.ndarray:
+        """Whole records appended to tombstones.bin since the last read."""
+        try:
+            stat = os.stat(self.tombstones_path)
+        except FileNotFoundError:
+            return np.empty(0, dtype="int64")
+        if stat.st_ino != self._tombstone_inode:
+            # Started afresh by purge(): every record in it is new
+            self._tombstone_inode, self._tombstone_bytes = stat.st_ino, 0
+        # A record being written by another process is read next time
+        whole = stat.st_size - stat.st_size % 8
+        if whole <= self._tombstone_bytes:
+            return np.empty(0, dtype="int64")
+        with open(self.tombstones_path, "rb") as f:
+            f.seek(self._tombstone_bytes)
+            data = f.read(whole - self._tombstone_bytes)
+        self._tombstone_bytes += len(data)
+        return np.frombuffer(data, dtype="<i8").astype("int64")
+
+    def _read_manifest(self) -> dict:
+        with open(self.manifest_path, "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def _file_state(self):
+        state = []
+        for path in (self.manifest_path, self.tombstones_path):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                state.append(None)
+        return tuple(state)
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    @contextmanager
+    def writer_lock(self):
+        """Exclusive lock shared by every process using this store.
+
+        Hold it for load(), append(), delete(), purge() and compact(); it is not
+        reentrant. Call refresh() first thing inside it.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def changed(self) -> bool:
+        """Whether the manifest or tombstones changed since the last load or refresh."""
+        return self._file_state() != self._seen_files
+
+    def refresh(self):
+        """Map segments and tombstones other processes wrote since the last load or refresh.
+
+        Rows only ever get appended (compaction keeps row order), so the
+        rows from the previous total_rows on are new. Rows that another
+        process's purge() turned into placeholders count as new tombstones,
+        as the tombstones.bin recording them may already be gone.
+
+        Returns:
+            (first_new_row, new_tombstones)
+        """
+        for attempt in range(3):
+            try:
+                return self._refresh()
+            except FileNotFoundError:
+                # A segment listed in the manifest was compacted away meanwhile
+                if attempt == 2:
+                    raise
+
+    def _refresh(self):
+        first_new_row = self.total_rows
+        seen_files = self._file_state()
+        purged = np.empty(0, dtype="int64")
+        if self.exists():
+            manifest = self._read_manifest()
+            if manifest["segments"] != self.segments:
+                mapped = {
+                    segment["name"]: (vectors, metadata)
+                    for segment, vectors, metadata in zip(self.segments, self.vectors, self.metadata.segments)
+                }
+                vectors, metadata_segments = [], []
+                for segment in manifest["segments"]:
+                    segment_vectors, metadata = mapped.get(segment["name"]) or self._read_segment(segment["name"])
+                    vectors.append(segment_vectors)
+                    metadata_segments.append(metadata)
+                purged = self._new_placeholders(manifest["segments"], metadata_segments, first_new_row)
+                # Readers take a snapshot of the list, so swap in a new one
+                self.vectors = vectors
+                self.metadata.set_segments(metadata_segments)
+                self.segments = manifest["segments"]
+            self.next_segment = max(self.next_segment, manifest["next_segment"])
+        new_tombstones = self._read_new_tombstones()
+        if len(purged):
+            new_tombstones = np.concatenate([new_tombstones, np.setdiff1d(purged, new_tombstones)])
+        if len(new_tombstones):
+            self.tombstones = np.concatenate([self.tombstones, new_tombstones])
+        self._seen_files = seen_files
+        return first_new_row, new_tombstones
+
+    def _new_placeholders(self, segments: list, metadata_segments: list, mapped_rows: int) -> np.ndarray:
+        """Rows that are placeholders in the given layout, but neither were in the mapped one nor are tombstoned.
+
+        Rows from `mapped_rows` on were not mapped yet; any placeholder among
+        them was purged before this process saw it.
+        """
+        mapped_names = {segment["name"] for segment in self.segments}
+        found = []
+        start = 0
+        for segment, metadata in zip(segments, metadata_segments):
+            if segment["name"] not in mapped_names:
+                owners = np.asarray(metadata.owner_ids[:len(metadata)])
+                found.append(np.flatnonzero(owners == EMPTY_ID) + start)
+            start += segment["rows"]
+        if not found:
+            return np.empty(0, dtype="int64")
+        rows = np.concatenate(found).astype("int64")
+        seen = rows[rows < mapped_rows]
+        seen = seen[(self.metadata.gather("owner_ids", seen) != EMPTY_ID) & ~np.isin(seen, self.tombstones)]
+        return np.concatenate([seen, rows[rows >= mapped_rows]])
+
+    def load(self):
+        """Map every live segment, repairing damage left by a crash.
+
+        With other processes on the same store, call it under writer_lock().
+
+        Returns:
+            (vectors, metadata): vectors of shape (len(metadata), dim) and
+            the ChunkMetadataStore over all segments
+        """
+        os.makedirs(self.segments_path, exist_ok=True)
+        self._seen_files = self._file_state()
+        if self.exists():
+            manifest = self._read_manifest()
+            self.segments = manifest["segments"]
+            self.next_segment = manifest["next_segment"]
+
+        live_names = {segment["name"] for segment in self.segments}
+        orphans = [name for name in os.listdir(self.segments_path) if name not in live_names]
+        if orphans:
+            print(f"Removing {len(orphans)} unpublished segment(s): {orphans}")
+            self._remove_segments(orphans)
+
+        kept, replaced = [], []
+        lost = []  # global rows turned into placeholders
+        first_row = 0
+        self.vectors, metadata_segments = [], []
+        for segment in self.segments:
+            rows = segment["rows"]
+            try:
+                vectors, metadata = self._read_segment(segment["name"])
+                readable = min(len(vectors), len(metadata), rows)
+                damaged = not len(vectors) == len(metadata) == rows
+            except (OSError, ValueError, EOFError) as e:
+                print(f"WARNING: segment {segment['name']} is unreadable: {e}")
+                readable, damaged = 0, True
+
+            if damaged:
+                print(f"WARNING: rewriting segment {segment['name']} with {readable} of its "
+                      f"{rows} rows and {rows - readable} empty ones, so later rows keep their IDs")
+                empty_vectors, empty_columns = _empty_rows(rows - readable, self.dim)
+                parts = [metadata.columns(readable), empty_columns] if readable else [empty_columns]
+                replaced.append(segment["name"])
+                segment = self._write_segment(
+                    np.concatenate([vectors[:readable], empty_vectors]) if readable else empty_vectors,
+                    concat_columns(parts),
+                )
+                vectors, metadata = self._read_segment(segment["name"])
+                lost.extend(range(first_row + readable, first_row + rows))
+
+            kept.append(segment)
+            self.vectors.append(vectors)
+            metadata_segments.append(metadata)
+            first_row += rows
+
+        self.metadata.set_segments(metadata_segments)
+        self.tombstones = self._read_tombstones()
+        if replaced:
+            # Tombstoned before the manifest lists the placeholders, so they
+            # are never live; a crash in between repeats the repair
+            self.delete(np.setdiff1d(np.asarray(lost, dtype="int64"), self.tombstones))
+            self.segments = kept
+            self._write_manifest()
+            self._remove_segments(replaced)
+        return self.all_vectors(), self.metadata
+
+    def all_vectors(self) -> np.ndarray:
+        if not self.vectors:
+            return np.empty((0, self.dim), dtype="float32")
+        return np.concatenate(self.vectors)
+
+    def gather_vectors(self, rows) -> np.ndarray:
+        """Copy the vectors at the given global rows; safe during an append or compaction."""
+        rows = np.asarray(rows, dtype="int64")
+        gathered = np.empty((len(rows), self.dim), dtype="float32")
+        mapped = list(self.vectors)  # compaction swaps list entries in place
+        if not len(rows) or not mapped:
+            return gathered
+        starts = np.cumsum([0] + [len(vectors) for vectors in mapped[:-1]])
+        positions = np.searchsorted(starts, rows, side="right") - 1
+        for position in np.unique(positions):
+            mask = positions == position
+            gathered[mask] = mapped[position][rows[mask] - starts[position]]
+        return gathered
+
+    def append(self, vectors: np.ndarray, metadata: list):
+        """Durably append rows as a new segment.
+
+        Args:
+            vectors: float32 (rows, dim)
+            metadata: list of {"document_id", "owner_id", "text"} dicts
+        """
+        if len(vectors) != len(metadata):
+            raise ValueError(f"{len(vectors)} vectors but {len(metadata)} metadata entries")
+        if not metadata:
+            return
+        os.makedirs(self.segments_path, exist_ok=True)
+        segment = self._write_segment(vectors, columns_from_dicts(metadata))
+        self.segments.append(segment)
+        self._write_manifest()
+
+        mapped_vectors, mapped_metadata = self._read_segment(segment["name"])
+        self.vectors.append(mapped_vectors)
+        self.metadata.add_segment(mapped_metadata)
+        self.maybe_compact()
+
+    def delete(self, rows):
+        """Durably mark rows as deleted."""
+        rows = np.asarray(rows, dtype="<i8")
+        if not len(rows):
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.tombstones_path, "ab") as f:
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            self._tombstone_inode, self._tombstone_bytes = os.fstat(f.fileno()).st_ino, f.tell()
+        self.tombstones = np.concatenate([self.tombstones, rows.astype("int64")])
+
+    def purge(self) -> int:
+        """Rewrite the segments holding deleted rows without their text and vectors.
+
+        Each deleted row becomes a placeholder, so rows keep their numbers,
+        and tombstones.bin is started afresh. The whole segment is rewritten,
+        so the cost grows with the size of the segments involved, not the
+        number of rows deleted.
+
+        Returns:
+            Number of rows purged
+        """
+        deleted = np.unique(self.tombstones)
+        purged = 0
+        segments, metadata_segments = list(self.segments), self.metadata.segments
+        replaced = []
+        start = 0
+        for position, segment in enumerate(self.segments):
+            end = start + segment["rows"]
+            local = deleted[(deleted >= start) & (deleted < end)] - start
+            start = end
+            metadata = metadata_segments[position]
+            local = local[np.asarray(metadata.owner_ids)[local] != EMPTY_ID]  # not purged already
+            if not len(local):
+                continue
+            vectors, columns = _blank_rows(self.vectors[position], metadata.columns(), local)
+            segments[position] = self._write_segment(vectors, columns)
+            self.vectors[position], metadata_segments[position] = self._read_segment(segments[position]["name"])
+            replaced.append(segment["name"])
+            purged += len(local)
+
+        if replaced:
+            self.segments = segments
+            self._write_manifest()
+            self.metadata.set_segments(metadata_segments)
+        if len(self.tombstones) or replaced:
+            # Every tombstoned row is a placeholder now
+            _atomic_write(self.tombstones_path, b"")
+            self._tombstone_inode, self._tombstone_bytes = os.stat(self.tombstones_path).st_ino, 0
+            self.tombstones = np.empty(0, dtype="int64")
+        self._remove_segments(replaced)
+        if purged:
+            print(f"Purged {purged} deleted rows from {len(replaced)} segment(s)")
+        return purged
+
+    def maybe_compact(self):
+        """Merge trailing segments once there are more than max_segments.
+
+        The merged run is extended backwards while the preceding segment is
+        no larger than the run, which keeps segment sizes roughly geometric:
+        each row is rewritten O(log n) times over the life of the store.
+        """
+        if len(self.segments) <= self.max_segments:
+            return
+        start = len(self.segments) - 2
+        run_rows = self.segments[-1]["rows"] + self.segments[-2]["rows"]
+        while start > 0 and self.segments[start - 1]["rows"] <= run_rows:
+            start -= 1
+            run_rows += self.segments[start]["rows"]
+        self.compact(start, len(self.segments))
+
+    def compact(self, start: int = 0, end: int = None):
+        """Merge segments[start:end] into one segment and swap it in atomically."""
+        end = len(self.segments) if end is None else end
+        run = self.segments[start:end]
+        if len(run) < 2:
+            return
+
+        vectors = np.concatenate(self.vectors[start:end])
+        columns = concat_columns([metadata.columns() for metadata in self.metadata.segments[start:end]])
+        merged = self._write_segment(vectors, columns)
+        mapped_vectors, mapped_metadata = self._read_segment(merged["name"])
+
+        self.segments = self.segments[:start] + [merged] + self.segments[end:]
+        self._write_manifest()
+        self.vectors[start:end] = [mapped_vectors]
+        metadata_segments = self.metadata.segments
+        metadata_segments[start:end] = [mapped_metadata]
+        self.metadata.set_segments(metadata_segments)
+        self._remove_segments(segment["name"] for segment in run)
+        print(f"Compacted {len(run)} segments into {merged['name']} ({merged['rows']} rows)")
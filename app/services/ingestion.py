@@ -0,0 +1,307 @@
+"""In-process background pipeline for uploads: OCR -> chunk -> embed -> index.
+
+Uploads are queued as jobs and run on a small thread pool, so the request
+returns immediately with a job ID and clients poll the job for progress.
+No external broker is needed: a job runs in the worker process that took
+the upload, which copies its state into a SQLite file under CACHE_DIR so
+a poll answered by any worker finds it. Pages are
+chunked and embedded as they come out of OCR, so embedding overlaps
+extraction; the chunks become searchable once the whole text is stored.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import SessionLocal
+from app.models.document import Document
+from app.utils.disk_cache import DiskLRUCache
+from app.utils.ocr import extract_text_from_image, iter_pdf_pages
+from app.vector_store import delete_document_chunks, prepare_document_chunks, publish_document_chunks
+
+# Jobs processed at once; the rest wait in the queue
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Jobs allowed to wait before uploads are rejected
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "100"))
+# Finished jobs kept for status lookups
+INGEST_MAX_FINISHED = int(os.getenv("INGEST_MAX_FINISHED", "1000"))
+
+SUPPORTED_PDF_TYPE = "application/pdf"
+
+# Extracted text keyed by SHA-256 of the raw upload, so re-uploads skip OCR;
+# "document:<id>" entries record which upload a document's text came from
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+extraction_cache = DiskLRUCache(
+    os.path.join(CACHE_DIR, "extractions.sqlite"), EXTRACTION_CACHE_MAX_MB * 1024 * 1024
+)
+
+# Job states shared by the uvicorn workers; the least recently updated go first
+JOB_STATE_MAX_MB = int(os.getenv("JOB_STATE_MAX_MB", "64"))
+job_states = DiskLRUCache(os.path.join(CACHE_DIR, "jobs.sqlite"), JOB_STATE_MAX_MB * 1024 * 1024)
+
+_COPY_BUFFER = 1024 * 1024
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class IngestionJob:
+    def __init__(self, owner_id: int, document_id: int, filename: str, content_type: str, content_hash: str):
+        self.job_id = uuid.uuid4().hex
+        self.owner_id = owner_id
+        self.document_id = document_id
+        self.filename = filename
+        self.content_type = content_type
+        self.content_hash = content_hash
+        self.cached = False  # text came from the extraction cache
+        self.status = "queued"  # queued | running | done | failed
+        self.stage = "queued"  # queued | extracting | indexing | done
+        self.pages_done = 0
+        self.pages_total = None
+        self.pages = []  # [{"page": int, "method": "text" | "ocr", "chars": int}]
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "document_id": self.document_id,
+            "owner_id": self.owner_id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "pages": list(self.pages),
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def save(self):
+        """Copy the job's state to job_states for status polls on other workers."""
+        try:
+            job_states.set(self.job_id, json.dumps(self.to_dict()).encode("utf-8"))
+        except Exception as e:
+            # Only polls through other workers miss the update
+            print(f"ERROR saving state of ingestion job {self.job_id}: {e}")
+
+
+def is_supported(content_type: str) -> bool:
+    content_type = content_type or ""
+    return content_type.startswith("image/") or content_type == SUPPORTED_PDF_TYPE
+
+
+def save_upload(fileobj):
+    """Stream an upload to a temp file, hashing it on the way.
+
+    Returns:
+        (path, sha256 hex digest)
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        while True:
+            block = fileobj.read(_COPY_BUFFER)
+            if not block:
+                break
+            digest.update(block)
+            tmp.write(block)
+    return tmp.name, digest.hexdigest()
+
+
+def _split_pages(text: str, pages: list) -> list:
+    """Cached text cut back into pages by their recorded lengths."""
+    lengths = [page.get("chars") for page in pages]
+    if None in lengths or sum(lengths) != len(text):
+        # Cached before page lengths were recorded
+        return [text]
+    offsets = [0]
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def extract_pages(job: IngestionJob, path: str, texts: list):
+    """Yield the uploaded file's text page by page, from the cache when this exact file was seen.
+
+    Each page is also appended to `texts`; once the generator is
+    exhausted, "".join(texts) is the whole document text.
+    """
+    cached = extraction_cache.get(job.content_hash)
+    if cached is not None:
+        extraction_cache.set(_document_key(job.document_id), job.content_hash.encode("utf-8"))
+        entry = json.loads(cached)
+        job.cached = True
+        job.pages = entry["pages"]
+        job.pages_done = job.pages_total = len(entry["pages"])
+        job.save()
+        for text in _split_pages(entry["text"], entry["pages"]):
+            texts.append(text)
+            yield text
+        return
+
+    if job.content_type == SUPPORTED_PDF_TYPE:
+        # Every page ends in a newline
+        pages = iter_pdf_pages(path)
+        separator = "\n"
+    else:
+        pages = [(1, 1, extract_text_from_image(path), "ocr")]
+        separator = ""
+    for page_number, page_count, text, method in pages:
+        text += separator
+        job.pages.append({"page": page_number, "method": method, "chars": len(text)})
+        job.pages_done = page_number
+        job.pages_total = page_count
+        job.save()
+        texts.append(text)
+        yield text
+
+    extraction_cache.set_many({
+        job.content_hash: json.dumps({"text": "".join(texts), "pages": job.pages}).encode("utf-8"),
+        _document_key(job.document_id): job.content_hash.encode("utf-8"),
+    })
+
+
+def _document_key(document_id: int) -> str:
+    return f"document:{document_id}"
+
+
+def forget_extraction(document_id: int):
+    """Drop the cached text extracted from a document's upload, once the document is deleted.
+
+    Another document uploaded from the same file loses it too; its next
+    re-upload is extracted again.
+    """
+    key = _document_key(document_id)
+    content_hash = extraction_cache.get(key)
+    extraction_cache.delete_many([key] + ([content_hash.decode("utf-8")] if content_hash is not None else []))
+
+
+def run_ingestion(job: IngestionJob, path: str, session_factory=SessionLocal):
+    """Extract text from the file at `path`, store it on the document and index it.
+
+    On failure the placeholder document is deleted, so a failed upload
+    leaves nothing behind, as before uploads ran in the background.
+    """
+    try:
+        _ingest(job, path, session_factory)
+    except Exception:
+        _discard_document(job, session_factory)
+        raise
+
+
+def _ingest(job: IngestionJob, path: str, session_factory):
+    job.stage = "extracting"
+    job.save()
+    texts = []
+    try:
+        prepared = prepare_document_chunks(job.document_id, extract_pages(job, path, texts), job.owner_id)
+    finally:
+        os.remove(path)
+    extracted_text = "".join(texts)
+
+    db = session_factory()
+    try:
+        document = db.get(Document, job.document_id)
+        if document is None:
+            raise ValueError(f"document {job.document_id} was deleted during ingestion")
+        document.content = extracted_text
+        db.commit()
+    finally:
+        db.close()
+
+    job.stage = "indexing"
+    job.save()
+    publish_document_chunks(job.document_id, job.owner_id, prepared)
+    # A DELETE between the commit above and the publish found no chunks to
+    # remove; it deletes chunks again after committing, so seeing the row
+    # gone here means those chunks are ours to remove
+    if not _document_exists(job.document_id, session_factory):
+        raise ValueError(f"document {job.document_id} was deleted during ingestion")
+
+
+def _document_exists(document_id: int, session_factory) -> bool:
+    db = session_factory()
+    try:
+        return db.get(Document, document_id) is not None
+    finally:
+        db.close()
+
+
+def _discard_document(job: IngestionJob, session_factory):
+    """Delete a failed job's document row and any chunks it got to index."""
+    try:
+        delete_document_chunks(job.document_id, job.owner_id)
+        db = session_factory()
+        try:
+            document = db.get(Document, job.document_id)
+            if document is not None:
+                db.delete(document)
+                db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"ERROR cleaning up document {job.document_id} after a failed ingestion: {e}")
+
+
+class JobQueue:
+    """Bounded thread pool plus a registry of this worker's jobs."""
+
+    def __init__(self, workers: int, max_queued: int, max_finished: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._max_queued = max_queued
+        self._max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: IngestionJob, fn, *args):
+        with self._lock:
+            queued = sum(1 for queued_job in self._jobs.values() if queued_job.status == "queued")
+            if queued >= self._max_queued:
+                raise QueueFullError(f"{queued} jobs already waiting")
+            self._jobs[job.job_id] = job
+            self._prune()
+        job.save()
+        self._executor.submit(self._run, job, fn, *args)
+
+    def get(self, job_id: str):
+        """The job's state as a dict, or None if no worker has it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        # Submitted through another worker
+        state = job_states.get(job_id)
+        return json.loads(state) if state is not None else None
+
+    def _run(self, job: IngestionJob, fn, *args):
+        job.status = "running"
+        job.save()
+        try:
+            fn(job, *args)
+            job.stage = "done"
+            job.status = "done"
+        except Exception as e:
+            print(f"ERROR in ingestion job {job.job_id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.save()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue(INGEST_WORKERS, INGEST_MAX_QUEUED, INGEST_MAX_FINISHED)
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Per-owner cache of answers, looked up by question similarity.
+
+    Each owner has up to `max_entries` past questions as normalized
+    embeddings. A lookup returns the answer of the most similar unexpired
+    question when the cosine similarity reaches `min_similarity`. Like
+    VersionedLRUCache, entries carry the owner's index version and a lookup
+    with a different version drops them all.
+
+    Args:
+        max_entries: Questions kept per owner; 0 disables the cache
+        ttl_seconds: Age after which an entry is ignored and evicted
+        min_similarity: Cosine similarity needed for a hit
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, min_similarity: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._owners = {}  # owner_id -> {"version", "vectors", "entries"}
+        self._lock = threading.Lock()
+
+    def _owner(self, owner_id: int, version: int) -> dict:
+        owner = self._owners.get(owner_id)
+        if owner is None or owner["version"] != version:
+            owner = self._owners[owner_id] = {"version": version, "vectors": None, "entries": []}
+        return owner
+
+    def _evict_expired(self, owner: dict, now: float):
+        keep = [i for i, entry in enumerate(owner["entries"]) if now - entry["created"] < self.ttl_seconds]
+        if len(keep) < len(owner["entries"]):
+            owner["entries"] = [owner["entries"][i] for i in keep]
+            owner["vectors"] = owner["vectors"][keep] if keep else None
+
+    def get(self, owner_id: int, version: int, vector: np.ndarray):
+        """Cached value for the closest question, or None.
+
+        Args:
+            vector: Normalized question embedding, shape (DIM,) or (1, DIM)
+        """
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            owner = self._owner(owner_id, version)
+            self._evict_expired(owner, now)
+            if owner["vectors"] is not None:
+                similarities = owner["vectors"] @ np.ravel(vector)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.min_similarity:
+                    entry = owner["entries"][best]
+                    entry["used"] = now
+                    self.hits += 1
+                    self.seconds_saved += entry["latency"]
+                    return entry["value"]
+            self.misses += 1
+            return None
+
+    def set(self, owner_id: int, version: int, vector: np.ndarray, value, latency: float = 0.0):
+        """Cache a value for a question.
+
+        Args:
+            latency: Seconds it took to compute the value, counted as saved
+                on every hit
+        """
+        if self.max_entries <= 0:
+            return
+        now = time.monotonic()
+        vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+        with self._lock:
+            owner = self._owner(owner_id, version)
+            self._evict_expired(owner, now)
+            if len(owner["entries"]) >= self.max_entries:
+                # Least recently used
+                oldest = min(range(len(owner["entries"])), key=lambda i: owner["entries"][i]["used"])
+                del owner["entries"][oldest]
+                owner["vectors"] = np.delete(owner["vectors"], oldest, axis=0)
+            owner["entries"].append({"value": value, "created": now, "used": now, "latency": latency})
+            owner["vectors"] = vector if owner["vectors"] is None else np.vstack([owner["vectors"], vector])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "owners": len(self._owners),
+                "size": sum(len(owner["entries"]) for owner in self._owners.values()),
+                "max_entries_per_owner": self.max_entries,
+            }
@@ -1,44 +1,197 @@
+"""Sentence-aware text chunking.
+
+iter_chunks() consumes a document as consecutive pieces of text (for
+example OCR'd pages) and yields each chunk as soon as it is complete, so
+early chunks can be embedded while later pages are still being
+extracted. Chunks are exact slices of the document, punctuation and line
+breaks included: "".join(pieces)[chunk.start:chunk.end] == chunk.text,
+and chunk.page is the 1-based piece the chunk starts in.
+
+The sentence pattern scans each character once. Text without sentence
+ends is cut at spaces by searches bounded to one chunk's worth of text,
+and text before the current chunk is dropped from the buffer once it is
+at least half of it, so time stays linear in the length of the text even
+for a multi-megabyte piece without punctuation.
+"""
+import bisect
+import os
 import re
+from collections import deque
+from typing import Iterable, Iterator, NamedTuple
+
+# Target chunk size and overlap between neighbouring chunks, in CHUNK_UNIT
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+# "chars", or "tokens" as counted for prompts (see context_builder.count_tokens)
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars")
+CHUNK_UNITS = ("chars", "tokens")
+
+# Sentences end after ., ! or ? (and closing quotes or brackets) followed
+# by whitespace, or at a blank line
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s)|\n[ \t]*\n')
+# Longest run of text without a sentence end, per CHUNK_SIZE unit, before
+# it is cut at a space; keeps the buffer small for unpunctuated OCR output
+_MAX_SENTENCE_CHARS_PER_UNIT = {"chars": 1, "tokens": 8}
+# Consumed text dropped from the buffer in the middle of a piece once it is
+# this long and at least half the buffer, so each character is copied
+# out at most once
+_MIN_DROP_CHARS = 64 * 1024
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offset in the whole document
+    end: int
+    page: int  # 1-based piece of the input the chunk starts in
+
 
-def chunk_text(text: str, chunk_size: int = 800, overlap: int = 200):
+def _measure(unit: str):
+    if unit == "chars":
+        return len
+    if unit == "tokens":
+        from app.agents.context_builder import count_tokens
+        return count_tokens
+    raise ValueError(f"CHUNK_UNIT must be one of {CHUNK_UNITS}, got {unit!r}")
+
+
+def _cut(text: str, start: int, end: int, limit: int) -> int:
+    """End of the longest run text[start:cut], cut <= end, at most limit chars, that ends before a space."""
+    stop = start + limit
+    if end <= stop:
+        return end
+    space = max(text.rfind(" ", start + 1, stop + 1), text.rfind("\n", start + 1, stop + 1))
+    return space if space > start else stop
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = None, overlap: int = None,
+                unit: str = None) -> Iterator[Chunk]:
+    """Split a document into overlapping, sentence-aligned chunks.
+
+    Chunks hold whole sentences up to chunk_size; the next chunk repeats
+    the previous chunk's last sentences, up to overlap. A sentence longer
+    than chunk_size is cut at spaces.
+
+    Args:
+        pieces: The document as consecutive pieces of text, e.g. pages
+        chunk_size: Maximum chunk size in `unit`, default CHUNK_SIZE
+        overlap: Maximum repeated text between neighbouring chunks, default CHUNK_OVERLAP
+        unit: "chars" or "tokens", default CHUNK_UNIT
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    unit = unit or CHUNK_UNIT
+    measure = _measure(unit)
+    by_chars = unit == "chars"
+    max_sentence_chars = chunk_size * _MAX_SENTENCE_CHARS_PER_UNIT[unit]
+
+    buffer = ""  # text from the start of the current chunk on
+    buffer_start = 0  # document offset of buffer[0]
+    page_starts = []  # document offset of each piece
+    window = deque()  # (start, end, size) of the sentences in the current chunk
+    window_size = 0
+    emitted_end = 0  # end of the last chunk yielded
+    sentence_start = 0  # start of the sentence being read
+
+    def emit():
+        """The current chunk, unless it adds nothing to the last one."""
+        start, end = window[0][0], window[-1][1]
+        raw = buffer[start - buffer_start:end - buffer_start]
+        text = raw.strip()
+        start += len(raw) - len(raw.lstrip())
+        if not text or start + len(text) <= emitted_end:
+            return None
+        return Chunk(text, start, start + len(text), bisect.bisect_right(page_starts, start))
+
+    def add(start: int, end: int, size: int):
+        """Add a sentence to the window; returns the chunk it completes, if any."""
+        nonlocal window_size, emitted_end
+        chunk = None
+        if window and window_size + size > chunk_size:
+            chunk = emit()
+            if chunk is not None:
+                emitted_end = chunk.end
+            while window and (window_size > overlap or window_size + size > chunk_size):
+                window_size -= window.popleft()[2]
+        window.append((start, end, size))
+        window_size += size
+        return chunk
+
+    def add_sentence(start: int, end: int) -> list:
+        """Add buffer text [start, end) as one or more sentences; returns completed chunks."""
+        size = end - start if by_chars else measure(buffer[start - buffer_start:end - buffer_start])
+        chunks = []
+        # Longer than a chunk: add it in parts cut at spaces, by offset so the
+        # rest of a long sentence isn't copied again for every part
+        while size > chunk_size:
+            offset = start - buffer_start
+            cut = _cut(buffer, offset, end - buffer_start, max(1, (end - start) * chunk_size // size))
+            part_size = measure(buffer[offset:cut])
+            while cut - offset > 1 and part_size > chunk_size:
+                cut = _cut(buffer, offset, end - buffer_start, max(1, (cut - offset) * 9 // 10))
+                part_size = measure(buffer[offset:cut])
+            chunks.append(add(start, buffer_start + cut, min(part_size, chunk_size)))
+            start = buffer_start + cut
+            # Token counts are close to additive; re-counting the rest would be quadratic
+            size = max(size - part_size, 0)
+        if start < end:
+            chunks.append(add(start, end, size))
+        return [chunk for chunk in chunks if chunk is not None]
+
+    def drop_consumed():
+        """Drop text before the current chunk once it is most of the buffer."""
+        nonlocal buffer, buffer_start
+        consumed = (window[0][0] if window else sentence_start) - buffer_start
+        if consumed >= _MIN_DROP_CHARS and 2 * consumed > len(buffer):
+            buffer = buffer[consumed:]
+            buffer_start += consumed
+
+    for piece in pieces:
+        # Drop text before the current chunk; the buffer stays about one chunk long
+        keep_from = window[0][0] if window else sentence_start
+        buffer = buffer[keep_from - buffer_start:] + piece
+        buffer_start = keep_from
+        page_starts.append(buffer_start + len(buffer) - len(piece))
+
+        match = _SENTENCE_END.search(buffer, sentence_start - buffer_start)
+        while match is not None:
+            end = buffer_start + match.end()
+            if by_chars and end - sentence_start <= chunk_size:
+                # The common case, without the generic sentence bookkeeping
+                chunk = add(sentence_start, end, end - sentence_start)
+                if chunk is not None:
+                    yield chunk
+            else:
+                yield from add_sentence(sentence_start, end)
+            sentence_start = end
+            drop_consumed()
+            match = _SENTENCE_END.search(buffer, sentence_start - buffer_start)
+        # Cut text running longer than max_sentence_chars without a sentence
+        # end at spaces, searching only max_sentence_chars ahead each time
+        while buffer_start + len(buffer) - sentence_start > max_sentence_chars:
+            offset = sentence_start - buffer_start
+            cut = buffer_start + _cut(buffer, offset, len(buffer), max_sentence_chars)
+            yield from add_sentence(sentence_start, cut)
+            sentence_start = cut
+            drop_consumed()
+
+    if sentence_start < buffer_start + len(buffer):
+        yield from add_sentence(sentence_start, buffer_start + len(buffer))
+    if window:
+        chunk = emit()
+        if chunk is not None:
+            yield chunk
+
+
+def chunk_text(text: str, chunk_size: int = None, overlap: int = None, unit: str = None) -> list:
     """Split text into chunks with sentence-aware boundaries.
-    
+
     Args:
         text: Text to chunk
-        chunk_size: Target size per chunk (chars)
-        overlap: Overlap between chunks (chars)
+        chunk_size: Target size per chunk, default CHUNK_SIZE
+        overlap: Overlap between chunks, default CHUNK_OVERLAP
+        unit: "chars" or "tokens", default CHUNK_UNIT
+
+    Returns:
+        Chunk texts, see iter_chunks() for their offsets and pages
     """
-    text = text.strip()
-    
-    if not text:
-        return []
-    
-    # For short text, return as single chunk
-    if len(text) <= chunk_size:
-        return [text]
-    
-    # Split into sentences
-    sentence_endings = re.compile(r'[.!?]\s+')
-    sentences = sentence_endings.split(text)
-    
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-            
-        # If adding this sentence exceeds chunk_size, save current chunk
-        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Keep last overlap chars for context
-            current_chunk = current_chunk[-overlap:] + " " + sentence if len(current_chunk) > overlap else sentence
-        else:
-            current_chunk += (" " if current_chunk else "") + sentence
-    
-    # Add final chunk
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks if chunks else [text]
+    return [chunk.text for chunk in iter_chunks([text], chunk_size, overlap, unit)]
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite caps bound parameters per statement
+_BATCH = 500
+
+
+class DiskLRUCache:
+    """Bytes-valued cache in a SQLite file with least-recently-used eviction.
+
+    Safe to share between threads, and between worker processes pointing at
+    the same file.
+
+    Args:
+        path: SQLite database file
+        max_bytes: Total value size above which the oldest entries are evicted
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None  # opened on first use, so defining a cache at import creates no file
+
+    def _connection(self) -> sqlite3.Connection:
+        """The SQLite connection, opening the file on first call; the caller holds _lock."""
+        if self._conn is not None:
+            return self._conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        for attempt in range(50):
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                break
+            except sqlite3.OperationalError:
+                # Another worker is creating the file; the busy timeout doesn't cover this
+                if attempt == 49:
+                    raise
+                time.sleep(0.1)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn = conn
+        return conn
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        """Values for the keys that are cached; marks them as recently used."""
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), _BATCH):
+                batch = keys[start:start + _BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    conn.execute(
+                        f"UPDATE entries SET accessed = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _ in rows],
+                    )
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    [(key, value, len(value), now) for key, value in items.items()],
+                )
+                self._evict()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete_many(self, keys: list):
+        if not keys:
+            return
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), _BATCH):
+                batch = keys[start:start + _BATCH]
+                conn.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch)
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            evicted.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        for start in range(0, len(evicted), _BATCH):
+            batch = evicted[start:start + _BATCH]
+            self._conn.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
@@ -0,0 +1,110 @@
+import os
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+pytesseract.pytesseract.tesseract_cmd = os.getenv(
+    "TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+)
+
+# Worker processes for PDF OCR, shared by all uploads (0 = one per core)
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", "0")) or os.cpu_count() or 1
+# Pages rendered or OCR'd at any moment per worker; bounds peak memory
+OCR_PAGES_PER_PROCESS = int(os.getenv("OCR_PAGES_PER_PROCESS", "2"))
+# Pages whose embedded text layer has fewer non-whitespace chars are OCR'd
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+
+# Poppler's pdftotext, installed alongside pdftoppm used by pdf2image
+PDFTOTEXT_CMD = os.getenv("PDFTOTEXT_CMD") or shutil.which("pdftotext")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # One Tesseract thread per process, parallelism comes from the pool
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server process is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def extract_text_from_image(path: str) -> str:
+    image = Image.open(path)
+    return pytesseract.image_to_string(image)
+
+
+def extract_text_layer(path: str, page_number: int) -> str:
+    """Text embedded in a 1-based PDF page, or "" if there is none."""
+    if not PDFTOTEXT_CMD:
+        return ""
+    result = subprocess.run(
+        [PDFTOTEXT_CMD, "-f", str(page_number), "-l", str(page_number), "-layout", "-enc", "UTF-8", path, "-"],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return ""
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def has_usable_text(text: str) -> bool:
+    return sum(1 for char in text if not char.isspace()) >= OCR_MIN_TEXT_CHARS
+
+
+def ocr_pdf_page(path: str, page_number: int):
+    """Extract one 1-based page, OCR'ing only when it has no usable text layer.
+
+    Returns:
+        (text, method) where method is "text" or "ocr"
+    """
+    text = extract_text_layer(path, page_number)
+    if has_usable_text(text):
+        return text, "text"
+    images = convert_from_path(path, first_page=page_number, last_page=page_number)
+    return (pytesseract.image_to_string(images[0]) if images else ""), "ocr"
+
+
+def count_pdf_pages(path: str) -> int:
+    return pdfinfo_from_path(path)["Pages"]
+
+
+def iter_pdf_pages(path: str, pool: ProcessPoolExecutor = None, window: int = None):
+    """Yield (page_number, page_count, text, method) for each page, in order.
+
+    Pages are extracted inside the pool's worker processes, with at
+    most `window` pages submitted at once, so memory stays flat no matter
+    how long the document is.
+    """
+    pool = pool or _get_pool()
+    window = window or OCR_PROCESSES * OCR_PAGES_PER_PROCESS
+    page_count = count_pdf_pages(path)
+
+    pending = deque()
+    next_page = 1
+    try:
+        while pending or next_page <= page_count:
+            while next_page <= page_count and len(pending) < window:
+                pending.append(pool.submit(ocr_pdf_page, path, next_page))
+                next_page += 1
+            page_number = next_page - len(pending)
+            text, method = pending.popleft().result()
+            yield page_number, page_count, text, method
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,44 @@
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """In-memory LRU cache whose entries are only valid for one version.
+
+    Entries are stored with the version of the data they were computed
+    from; a lookup with a newer version is a miss, so bumping the version
+    invalidates every entry derived from the old data at once.
+
+    Args:
+        maxsize: Maximum number of entries
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
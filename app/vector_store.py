@@ -1,104 +1,909 @@
 import faiss
+import hashlib
 import numpy as np
 import pickle
 import os
-from app.llm.embedding import embed_text, DIM
-from app.utils.chunking import chunk_text
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+from app.index_factory import (
+    ExcludingSearch, apply_search_params, build_index, choose_index_type, copy_index, create_index,
+    index_settings, index_type_of, to_similarity,
+)
+from app.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from app.llm.embedding import embed_chunks, embed_query, forget_embeddings, normalize_query, DIM, EMBED_BATCH_SIZE
+from app.metadata_store import chunk_hash
+from app.segment_store import EMPTY_ID, SegmentStore
+from app.utils.chunking import iter_chunks
+from app.utils.result_cache import VersionedLRUCache
 
-INDEX_FILE = 'vector_index.faiss'
-METADATA_FILE = 'chunk_metadata.pkl'
+# Append-only segment store: source of truth for vectors and metadata.
+# Owner partitions are built from it and written under its partitions/
+# directory, from where every worker memory-maps them.
+STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+STORE_MAX_SEGMENTS = int(os.getenv("VECTOR_STORE_MAX_SEGMENTS", "16"))
 
-def save_index():
-    faiss.write_index(index, INDEX_FILE)
-    with open(METADATA_FILE, 'wb') as f:
-        pickle.dump(chunk_metadata, f)
+# Seconds between checks for segments and deletes written by other
+# processes (uvicorn workers) sharing STORE_DIR; 0 turns the checks off
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "1"))
+
+# Search results per (owner, query, top_k), dropped when the owner's index changes
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+
+# Trained (IVF) partitions are retrained once they grow this many times
+# past the size they were trained at
+INDEX_REBUILD_GROWTH = float(os.getenv("INDEX_REBUILD_GROWTH", "4"))
+# Partitions are rebuilt without deleted chunks once more than this
+# fraction of their vectors are tombstoned
+TOMBSTONE_COMPACT_RATIO = float(os.getenv("TOMBSTONE_COMPACT_RATIO", "0.2"))
+# Seconds after a failed rebuild before the owner's next change may start
+# another, doubled after every further failure up to an hour; searches
+# keep using the old partition meanwhile
+INDEX_REBUILD_RETRY_SECONDS = float(os.getenv("INDEX_REBUILD_RETRY_SECONDS", "30"))
+# Chunks indexed since an owner's partition was built go to a small flat
+# partition that is copied on every write; past this size it is folded in
+INDEX_RECENT_MAX_VECTORS = int(os.getenv("INDEX_RECENT_MAX_VECTORS", "8192"))
+
+# "vector" (FAISS), "keyword" (BM25) or "hybrid" (both, fused by reciprocal rank)
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+# hybrid: candidates taken from each ranking before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# hybrid: RRF constant; larger values flatten the advantage of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# The original layout, imported into the segment store on first start:
+# a single IndexFlatL2 shared by every owner
+LEGACY_INDEX_FILE = 'vector_index.faiss'
+LEGACY_METADATA_FILE = 'chunk_metadata.pkl'
+
+_NO_IDS = np.empty(0, dtype="int64")
+
+
+def _new_owner_index():
+    # Index types that need training start out flat, see index_factory
+    return create_index(choose_index_type(0), DIM, mappable=True)
+
+
+# -------------------------
+# Partition files
+# -------------------------
+# A built partition is written to a file named after its owner, settings
+# and chunk IDs, and memory-mapped from there. Workers that build the same
+# partition find the file already written and map it too, so the pages are
+# shared between processes. Only the small recent partitions (and, as
+# faiss copies graphs into memory, HNSW partitions) are per process.
+
+def _partition_dir() -> str:
+    return os.path.join(store.root, "partitions")
+
+def _partition_path(owner_id: int, index_type: str, ids: np.ndarray) -> str:
+    """File for the owner's partition of this type holding `ids`, in that order."""
+    digest = hashlib.sha1(np.ascontiguousarray(ids, dtype="<i8").tobytes()).hexdigest()[:16]
+    return os.path.join(_partition_dir(), f"owner_{owner_id}_{index_settings(index_type)}_{digest}.faiss")
+
+def _open_partition(path: str):
+    """Partition memory-mapped from `path`, or None when no worker has written it."""
+    try:
+        partition = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    except RuntimeError:
+        return None  # never written, removed since, or torn by a crash
+    apply_search_params(partition)
+    return partition
+
+def _save_partition(path: str, partition):
+    """Write a built partition to `path` and return it memory-mapped from there."""
+    os.makedirs(_partition_dir(), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    faiss.write_index(partition, tmp_path)
+    # Mapped before the rename: the mapping holds whoever replaces or
+    # removes the file later
+    mapped = _open_partition(tmp_path)
+    os.replace(tmp_path, path)
+    return mapped
+
+def _set_partition_file(owner_id: int, path: Optional[str]):
+    """Record the file the owner's partition is mapped from, removing the one it replaces.
+
+    The caller holds _index_lock. Workers still mapping the old file keep
+    their mapping; it only disappears from the directory.
+    """
+    old_path = owner_partition_files.pop(owner_id, None)
+    if path is not None:
+        owner_partition_files[owner_id] = path
+    if old_path is not None and old_path != path:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass  # already removed by another worker
+
+def _remove_stale_partition_files(before: float):
+    """Remove partition files last written before `before` that no owner here maps.
+
+    They are left over from earlier runs, or mapped by workers that will
+    replace them on their next rebuild.
+    """
+    try:
+        names = os.listdir(_partition_dir())
+    except OSError:
+        return
+    in_use = set(owner_partition_files.values())
+    for name in names:
+        path = os.path.join(_partition_dir(), name)
+        try:
+            if path not in in_use and os.path.getmtime(path) < before:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _group_by_owner(owners: np.ndarray) -> dict:
+    """Row positions per owner, in ascending order, using one sort."""
+    if not len(owners):
+        return {}
+    order = np.argsort(owners, kind="stable")
+    boundaries = np.flatnonzero(np.diff(owners[order])) + 1
+    return {int(owners[ids[0]]): ids.astype("int64") for ids in np.split(order, boundaries)}
+
+
+def _build_owner_indexes(vectors: np.ndarray, groups: dict) -> dict:
+    """One partition per owner, keyed by row position, with the file it is mapped from.
+
+    A partition of the wanted type already written for the same chunks,
+    by another worker or before a restart, is mapped as it is. Otherwise
+    partitions start out with no training; larger index types are built
+    in the background by _schedule_rebuild.
+
+    Returns:
+        {owner_id: (partition, path)}
+    """
+    partitions = {}
+    for owner_id, ids in groups.items():
+        for index_type in dict.fromkeys([choose_index_type(len(ids)), "flat"]):
+            path = _partition_path(owner_id, index_type, ids)
+            partition = _open_partition(path)
+            if partition is not None:
+                break
+        else:
+            partition = _save_partition(path, build_index("flat", vectors[ids], ids, mappable=True))
+        partitions[owner_id] = partition, path
+    return partitions
+
+
+class OwnerSnapshot(NamedTuple):
+    """Everything a search reads for one owner.
+
+    Never mutated once published to owner_snapshots: writers build a new
+    snapshot off to the side and swap it in with one assignment, so
+    searches get a consistent view without taking a lock.
+    """
+    partition: faiss.Index  # built (and possibly trained) partition, mapped from a file once built
+    recent: Optional[faiss.Index]  # flat partition of chunks indexed since, or None
+    chunk_ids: np.ndarray  # live chunk IDs in the partitions, ascending
+    deleted: frozenset  # tombstoned chunk IDs still in partition or recent
+    duplicates: np.ndarray  # live chunk IDs not indexed because their text is, under an ID in chunk_ids; ascending
+    version: int = 0
+    searches: tuple = (None, None)  # ExcludingSearch skipping `deleted` in partition and recent, set by _publish
+
+    @property
+    def vector_count(self) -> int:
+        return self.partition.ntotal + (self.recent.ntotal if self.recent is not None else 0)
+
+
+def _with_chunks(owner_id: int, snapshot, chunk_ids: np.ndarray, vectors: np.ndarray, texts) -> OwnerSnapshot:
+    """New snapshot with the chunks added; also adds them to the keyword index.
+
+    The published partition may be in use by searches (and is read-only
+    once mapped), so chunks go into a copy of the small recent partition
+    instead. A new owner starts with an empty partition, filled from the
+    recent one by the first fold.
+    """
+    if snapshot is None and owner_id not in owner_keyword_indexes:
+        # A new owner's keyword index starts empty and grows with each upload
+        owner_keyword_indexes[owner_id] = KeywordIndex()
+    if snapshot is None:
+        snapshot = OwnerSnapshot(_new_owner_index(), None, _NO_IDS, frozenset(), _NO_IDS)
+    recent = faiss.clone_index(snapshot.recent) if snapshot.recent is not None else create_index("flat", DIM)
+    recent.add_with_ids(vectors, chunk_ids)
+    merged = np.concatenate([snapshot.chunk_ids, chunk_ids])
+    if len(snapshot.chunk_ids) and chunk_ids[0] < snapshot.chunk_ids[-1]:
+        merged.sort()  # promoted duplicates are older than the newest chunks
+    snapshot = snapshot._replace(recent=recent, chunk_ids=merged)
+    keyword_index = owner_keyword_indexes.get(owner_id)
+    if keyword_index is not None:
+        keyword_index.add(chunk_ids, texts)
+    return snapshot
+
+
+def _without_chunks(owner_id: int, snapshot: OwnerSnapshot, doomed: np.ndarray) -> Optional[OwnerSnapshot]:
+    """New snapshot with live chunks tombstoned, or None when none are left."""
+    keyword_index = owner_keyword_indexes.get(owner_id)
+    if keyword_index is not None:
+        keyword_index.mark_removed(doomed)
+    chunk_ids = np.setdiff1d(snapshot.chunk_ids, doomed, assume_unique=True)
+    if not len(chunk_ids):
+        return None
+    return snapshot._replace(chunk_ids=chunk_ids, deleted=snapshot.deleted | frozenset(doomed.tolist()))
+
+
+def _split_duplicates(snapshot, chunk_ids: np.ndarray) -> tuple:
+    """Split new chunk IDs into (to index, duplicates) by text hash.
+
+    A chunk is a duplicate when its text is already indexed for the owner,
+    or an earlier chunk in chunk_ids has the same text.
+    """
+    hashes = chunk_metadata.gather("chunk_hashes", chunk_ids)
+    _, first = np.unique(hashes, return_index=True)
+    fresh = np.zeros(len(chunk_ids), dtype=bool)
+    fresh[first] = True
+    if snapshot is not None:
+        fresh &= ~np.isin(hashes, chunk_metadata.gather("chunk_hashes", snapshot.chunk_ids))
+    return chunk_ids[fresh], chunk_ids[~fresh]
+
+
+def _add_chunks(owner_id: int, snapshot, chunk_ids: np.ndarray) -> OwnerSnapshot:
+    """New snapshot with stored chunks added, duplicates kept out of the partitions."""
+    to_index, duplicates = _split_duplicates(snapshot, chunk_ids)
+    if len(to_index):
+        texts = (chunk_metadata[int(chunk_id)]["text"] for chunk_id in to_index)
+        snapshot = _with_chunks(owner_id, snapshot, to_index, store.gather_vectors(to_index), texts)
+    if len(duplicates):
+        snapshot = snapshot._replace(duplicates=np.union1d(snapshot.duplicates, duplicates))
+    return snapshot
+
+
+def _remove_chunks(owner_id: int, snapshot: OwnerSnapshot, doomed: np.ndarray) -> Optional[OwnerSnapshot]:
+    """New snapshot without live chunks (indexed or duplicates), or None when none are left.
+
+    When an indexed chunk goes but another document holds the same text,
+    that document's duplicate is indexed in its place, so deleting one
+    document never takes text out of another's search results.
+    """
+    duplicates = np.setdiff1d(snapshot.duplicates, doomed, assume_unique=True)
+    doomed = doomed[np.isin(doomed, snapshot.chunk_ids)]
+    promoted = _NO_IDS
+    if len(doomed) and len(duplicates):
+        duplicate_hashes = chunk_metadata.gather("chunk_hashes", duplicates)
+        orphaned = np.flatnonzero(np.isin(duplicate_hashes, chunk_metadata.gather("chunk_hashes", doomed)))
+        # The oldest copy of each text, so every worker promotes the same one
+        _, first = np.unique(duplicate_hashes[orphaned], return_index=True)
+        promoted = np.sort(duplicates[orphaned[first]])
+        duplicates = np.setdiff1d(duplicates, promoted, assume_unique=True)
+    snapshot = snapshot._replace(duplicates=duplicates)
+    if len(promoted):
+        texts = (chunk_metadata[int(chunk_id)]["text"] for chunk_id in promoted)
+        snapshot = _with_chunks(owner_id, snapshot, promoted, store.gather_vectors(promoted), texts)
+    if len(doomed):
+        snapshot = _without_chunks(owner_id, snapshot, doomed)
+    return snapshot
+
+
+def _publish(owner_id: int, snapshot: Optional[OwnerSnapshot]):
+    """Make the owner's new snapshot visible to searches; the caller holds _index_lock."""
+    owner_versions[owner_id] = owner_versions.get(owner_id, 0) + 1
+    if snapshot is not None:
+        searches = _tombstone_searches(snapshot, owner_snapshots.get(owner_id))
+        owner_snapshots[owner_id] = snapshot._replace(version=owner_versions[owner_id], searches=searches)
+        return
+    # Nothing left to search; drop the partition outright
+    owner_snapshots.pop(owner_id, None)
+    owner_keyword_indexes.pop(owner_id, None)
+    owner_trained_sizes.pop(owner_id, None)
+    _set_partition_file(owner_id, None)
+
+
+def _tombstone_searches(snapshot: OwnerSnapshot, previous: Optional[OwnerSnapshot]) -> tuple:
+    """Searches of the snapshot's partition and recent that skip its tombstones.
+
+    None for a partition holding none of them. A partition whose tombstones
+    are unchanged since the previous snapshot keeps its search.
+    """
+    partitions = (snapshot.partition, snapshot.recent)
+    if not snapshot.deleted:
+        return (None,) * len(partitions)
+    unchanged = previous is not None and previous.deleted == snapshot.deleted
+    deleted = np.fromiter(snapshot.deleted, dtype="int64", count=len(snapshot.deleted))
+    searches = []
+    for position, partition in enumerate(partitions):
+        if unchanged and (previous.partition, previous.recent)[position] is partition:
+            searches.append(previous.searches[position])
+        elif partition is None or partition.ntotal == 0:
+            searches.append(None)
+        else:
+            search = ExcludingSearch(partition, deleted)
+            searches.append(search if search.excluded_count else None)
+    return tuple(searches)
+
+
+def _read_legacy_index():
+    """Read vectors and metadata from the original single-index layout, if present.
+
+    Returns:
+        (vectors, metadata) or None when there is nothing to import
+    """
+    if not os.path.exists(LEGACY_METADATA_FILE) or not os.path.isfile(LEGACY_INDEX_FILE):
+        return None
+    with open(LEGACY_METADATA_FILE, 'rb') as f:
+        metadata = pickle.load(f)
+    legacy = faiss.read_index(LEGACY_INDEX_FILE)
+    count = min(legacy.ntotal, len(metadata))
+    if count != legacy.ntotal or count != len(metadata):
+        print(f"WARNING: legacy index has {legacy.ntotal} vectors but {len(metadata)} "
+              f"metadata entries, keeping the first {count}")
+    vectors = legacy.reconstruct_n(0, count) if count else np.empty((0, DIM), dtype="float32")
+    return vectors, metadata[:count]
+
+
+# -------------------------
+# Background index rebuilds
+# -------------------------
+
+def _wanted_index_type(owner_id: int):
+    """Index type the owner's partition should be rebuilt as, or None."""
+    snapshot = owner_snapshots.get(owner_id)
+    if snapshot is None:
+        return None
+    wanted = choose_index_type(len(snapshot.chunk_ids))
+    if wanted != index_type_of(snapshot.partition):
+        return wanted
+    if len(snapshot.deleted) > TOMBSTONE_COMPACT_RATIO * snapshot.vector_count:
+        return wanted
+    trained_size = owner_trained_sizes.get(owner_id)
+    if trained_size and snapshot.vector_count >= INDEX_REBUILD_GROWTH * trained_size:
+        return wanted
+    return None
+
+def _recent_is_full(snapshot) -> bool:
+    return snapshot is not None and snapshot.recent is not None and snapshot.recent.ntotal >= INDEX_RECENT_MAX_VECTORS
+
+def _schedule_rebuild(owner_id: int):
+    with _index_lock:
+        if owner_id in _pending_rebuilds:
+            return
+        if time.monotonic() < _rebuild_failures.get(owner_id, (0, 0.0))[1]:
+            return
+        if _wanted_index_type(owner_id) is None and not _recent_is_full(owner_snapshots.get(owner_id)):
+            return
+        _pending_rebuilds.add(owner_id)
+    _rebuild_executor.submit(_rebuild_owner_index, owner_id)
+
+def _rebuild_owner_index(owner_id: int):
+    """Build a new partition off to the side, then publish it.
+
+    A rebuild trains and fills the wanted index type with live chunks
+    only, which also compacts away tombstones. When only the recent
+    partition is full, it is folded into a copy of the current partition
+    instead, without retraining. The result is written to a partition file
+    and mapped from it, unless another worker already wrote the same one.
+    Searches keep using the old snapshot meanwhile; chunks indexed during
+    the build go into the new snapshot's recent partition.
+    """
+    try:
+        with _index_lock:
+            snapshot = owner_snapshots.get(owner_id)
+            index_type = _wanted_index_type(owner_id)
+            if index_type is None and not _recent_is_full(snapshot):
+                return
+
+        start = time.perf_counter()
+        retrained = index_type is not None
+        if retrained:
+            path = _partition_path(owner_id, index_type, snapshot.chunk_ids)
+            partition = _open_partition(path)
+            if partition is None:
+                print(f"Building {index_type} index for owner {owner_id} ({len(snapshot.chunk_ids)} vectors)")
+                partition = _save_partition(path, build_index(
+                    index_type, store.gather_vectors(snapshot.chunk_ids), snapshot.chunk_ids, mappable=True
+                ))
+        else:
+            index_type = index_type_of(snapshot.partition)
+            recent_ids = faiss.vector_to_array(snapshot.recent.id_map)
+            path = _partition_path(owner_id, index_type, np.concatenate([
+                faiss.vector_to_array(snapshot.partition.id_map), recent_ids
+            ]))
+            partition = _open_partition(path)
+            if partition is None:
+                print(f"Folding {len(recent_ids)} recent vectors into the {index_type} index for owner {owner_id}")
+                folded = copy_index(snapshot.partition)
+                folded.add_with_ids(store.gather_vectors(recent_ids), recent_ids)
+                partition = _save_partition(path, folded)
+                del folded
+
+        with _index_lock:
+            current = owner_snapshots.get(owner_id)
+            if current is None or current.partition is not snapshot.partition:
+                return  # every chunk was deleted meanwhile
+            # Includes promoted duplicates, which can be older than chunks in the build
+            added = np.setdiff1d(current.chunk_ids, snapshot.chunk_ids, assume_unique=True)
+            recent = None
+            if len(added):
+                recent = create_index("flat", DIM)
+                recent.add_with_ids(store.gather_vectors(added), added)
+            if retrained:
+                # Chunks deleted during the build are still in the new partition
+                deleted = np.setdiff1d(snapshot.chunk_ids, current.chunk_ids, assume_unique=True)
+                _publish(owner_id, current._replace(partition=partition, recent=recent, deleted=frozenset(deleted.tolist())))
+                if index_type in ("ivf_flat", "ivf_pq"):
+                    owner_trained_sizes[owner_id] = len(snapshot.chunk_ids)
+                else:
+                    owner_trained_sizes.pop(owner_id, None)
+            else:
+                # Chunks indexed and deleted again during the fold never reached the copy
+                deleted_since = np.array(sorted(current.deleted - snapshot.deleted), dtype="int64")
+                deleted = snapshot.deleted | frozenset(np.intersect1d(deleted_since, snapshot.chunk_ids).tolist())
+                _publish(owner_id, current._replace(partition=partition, recent=recent, deleted=deleted))
+            _set_partition_file(owner_id, path)
+            keyword_index = owner_keyword_indexes.get(owner_id)
+        print(f"Swapped in {index_type} index for owner {owner_id} "
+              f"({partition.ntotal} vectors, {time.perf_counter() - start:.1f}s)")
+        if keyword_index is not None and keyword_index.removed_count:
+            keyword_index.compact()
+        _rebuild_failures.pop(owner_id, None)
+    except Exception as e:
+        with _index_lock:
+            failures = _rebuild_failures.get(owner_id, (0, 0.0))[0] + 1
+            delay = min(INDEX_REBUILD_RETRY_SECONDS * 2 ** (failures - 1), 3600)
+            _rebuild_failures[owner_id] = (failures, time.monotonic() + delay)
+        print(f"ERROR building index for owner {owner_id} (failure {failures}, retrying in {delay:.0f}s): {e}")
+    finally:
+        with _index_lock:
+            _pending_rebuilds.discard(owner_id)
+    # More chunks may have arrived while building
+    _schedule_rebuild(owner_id)
 
 def load_index():
-    global index, chunk_metadata
-    if os.path.exists(INDEX_FILE):
-        print(f"Loading index from {INDEX_FILE}")
-        index = faiss.read_index(INDEX_FILE)
-        print(f"Loaded index with {index.ntotal} vectors")
-    else:
-        print("No saved index file found")
-    if os.path.exists(METADATA_FILE):
-        print(f"Loading metadata from {METADATA_FILE}")
-        with open(METADATA_FILE, 'rb') as f:
-            chunk_metadata = pickle.load(f)
-        print(f"Loaded {len(chunk_metadata)} metadata entries")
-    else:
-        print("No saved metadata file found")
+    global chunk_metadata, owner_snapshots, owner_keyword_indexes
+    started = time.time()
+    # Other workers may be writing to the same store
+    with store.writer_lock():
+        if not store.exists():
+            legacy = _read_legacy_index()
+            if legacy is not None:
+                print(f"Importing {len(legacy[1])} legacy chunks into {STORE_DIR}/")
+                store.append(*legacy)
+
+        vectors, chunk_metadata = store.load()
+    # Deleted chunks not purged yet are still in the segments; purged ones are placeholders
+    live_rows = np.setdiff1d(np.flatnonzero(chunk_metadata.owner_ids() != EMPTY_ID), store.tombstones)
+    groups, duplicates = {}, {}
+    for owner_id, positions in _group_by_owner(chunk_metadata.owner_ids()[live_rows]).items():
+        groups[owner_id], duplicates[owner_id] = _split_duplicates(None, live_rows[positions])
+    partitions = _build_owner_indexes(vectors, groups)
+    # Keyword indexes are built in the background, see _build_keyword_index
+    owner_keyword_indexes = {}
+    owner_snapshots = {}
+    for owner_id, ids in groups.items():
+        partition, path = partitions[owner_id]
+        _publish(owner_id, OwnerSnapshot(partition, None, ids, frozenset(), duplicates[owner_id]))
+        _set_partition_file(owner_id, path)
+        if index_type_of(partition) in ("ivf_flat", "ivf_pq"):
+            owner_trained_sizes[owner_id] = len(ids)
+    _remove_stale_partition_files(started)
+    print(f"Loaded {len(chunk_metadata)} chunks in {len(store.segments)} segments "
+          f"for {len(owner_snapshots)} owners")
+    for owner_id in owner_snapshots:
+        _schedule_rebuild(owner_id)
+    # Smallest owners first, so most owners get keyword search soonest
+    for owner_id in sorted(owner_snapshots, key=lambda owner_id: len(owner_snapshots[owner_id].chunk_ids)):
+        _keyword_executor.submit(_build_keyword_index, owner_id)
 
-# Load on startup
-index = faiss.IndexFlatL2(DIM)
+# Loaded by ensure_index_loaded() on first use, or by the startup warm-up
+store = SegmentStore(STORE_DIR, DIM, max_segments=STORE_MAX_SEGMENTS)
+owner_snapshots = {}  # owner_id -> OwnerSnapshot, replaced whole on every change
+owner_versions = {}  # owner_id -> counter bumped on every published snapshot
+owner_trained_sizes = {}  # owner_id -> vectors in the partition when it was last trained
+owner_partition_files = {}  # owner_id -> file its partition is mapped from, once built
+owner_keyword_indexes = {}  # owner_id -> KeywordIndex, once built or for owners new since load
+result_cache = VersionedLRUCache(RESULT_CACHE_SIZE)
 chunk_metadata = []
-load_index()
 
-# FAISS index position == metadata position
-# each item: { "document_id": int, "owner_id": int, "text": str }
+# Serializes writes (appends, snapshot publishes); searches never take it
+_index_lock = threading.RLock()
+_rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-build")
+_pending_rebuilds = set()
+_rebuild_failures = {}  # owner_id -> (consecutive failed rebuilds, monotonic time of the next try)
+_keyword_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyword-build")
+_index_loaded = False
 
-def index_document_chunks(document_id: int, content: str, owner_id: int):
-    print(f"Indexing document {document_id} for owner {owner_id}, content length: {len(content)}")
-    chunks = chunk_text(content)
-    print(f"Created {len(chunks)} chunks")
+def ensure_index_loaded():
+    """Load the store and build partitions on first call; cheap afterwards."""
+    global _index_loaded
+    if _index_loaded:
+        return
+    with _index_lock:
+        if not _index_loaded:
+            load_index()
+            _index_loaded = True
+            if INDEX_RELOAD_INTERVAL_SECONDS > 0:
+                threading.Thread(target=_watch_store, name="index-reload", daemon=True).start()
 
-    for i, chunk in enumerate(chunks):
-        print(f"Embedding chunk {i}: {chunk[:50]}...")
-        vector = np.array(embed_text(chunk), dtype="float32").reshape(1, -1)
-        index.add(vector)
+def index_loaded() -> bool:
+    return _index_loaded
 
-        chunk_metadata.append({
+# owner_snapshots[owner_id] partitions hold only that owner's vectors, keyed
+# by metadata position: chunk_metadata[id] for every id in the partitions.
+# chunk_metadata is a columnar, memory-mapped ChunkMetadataStore;
+# chunk_metadata[id] returns { "document_id": int, "owner_id": int, "text": str,
+# "start": int, "page": int }
+# Deleted chunks stay in their partition until it is rebuilt; their IDs
+# are in the snapshot's `deleted` and never returned from searches. Their
+# rows in the store are purged to placeholders (see SegmentStore.purge).
+
+def index_document_chunks(document_id: int, content, owner_id: int, replace: bool = False):
+    """Chunk, embed and index a document's content.
+
+    Args:
+        document_id: Document the chunks belong to
+        content: Extracted text, or an iterable of consecutive pieces of
+            it such as pages
+        owner_id: Document owner; chunks go into their partition
+        replace: Tombstone the document's previously indexed chunks in the
+            same step, so searches see either the old or the new content
+    """
+    print(f"Indexing document {document_id} for owner {owner_id}")
+    prepared = prepare_document_chunks(document_id, content, owner_id)
+    publish_document_chunks(document_id, owner_id, prepared, replace)
+
+def prepare_document_chunks(document_id: int, content, owner_id: int):
+    """Chunk and embed a document as its text arrives, without indexing it.
+
+    Chunks are embedded EMBED_BATCH_SIZE at a time as soon as they are
+    cut, so when `content` is a generator of pages from extraction,
+    embedding runs while later pages are still being extracted. Chunks
+    whose text the owner already has indexed reuse its stored vector.
+
+    Returns:
+        (metadata, vectors) for publish_document_chunks
+    """
+    ensure_index_loaded()
+    pieces = [content] if isinstance(content, str) else content
+
+    snapshot = owner_snapshots.get(owner_id)
+    live_ids = snapshot.chunk_ids if snapshot is not None else _NO_IDS
+    # Text hash -> chunk ID whose vector can be copied
+    indexed = dict(zip(chunk_metadata.gather("chunk_hashes", live_ids).tolist(), live_ids.tolist()))
+
+    metadata = []
+    copied_from = []  # per metadata entry, chunk ID to copy the vector from, or -1 to embed it
+    embedded = []
+    pending = []  # texts waiting for the next embedding batch
+    seen = set()
+    chunk_count = 0
+    for chunk in iter_chunks(pieces):
+        chunk_count += 1
+        digest = chunk_hash(chunk.text)
+        if digest in seen:
+            continue  # repeated within the document
+        seen.add(digest)
+        metadata.append({
             "document_id": document_id,
             "owner_id": owner_id,
-            "text": chunk
+            "text": chunk.text,
+            "chunk_hash": digest,
+            "start": chunk.start,
+            "page": chunk.page,
         })
-    
-    print(f"Total indexed: {index.ntotal}")
-    # Save after indexing
-    save_index()
-    print("Saved index to disk")
+        copied_from.append(indexed.get(digest, -1))
+        if copied_from[-1] < 0:
+            pending.append(chunk.text)
+            if len(pending) == EMBED_BATCH_SIZE:
+                embedded.append(embed_chunks(pending))
+                pending = []
+    if pending:
+        embedded.append(embed_chunks(pending))
+
+    copied_from = np.array(copied_from, dtype="int64")
+    copies = copied_from >= 0
+    vectors = np.empty((len(metadata), DIM), dtype="float32")
+    if embedded:
+        vectors[~copies] = np.concatenate(embedded)
+    if copies.any():
+        vectors[copies] = store.gather_vectors(copied_from[copies])
+        # A chunk deleted since reads back purged, as a zero vector
+        lost = np.flatnonzero(copies & ~vectors.any(axis=1))
+        if len(lost):
+            vectors[lost] = embed_chunks([metadata[i]["text"] for i in lost])
+            copies[lost] = False
+
+    print(f"Created {chunk_count} chunks")
+    if copies.any():
+        print(f"Reusing {int(copies.sum())} chunks already indexed for owner {owner_id}")
+    return metadata, vectors
+
+def publish_document_chunks(document_id: int, owner_id: int, prepared, replace: bool = False):
+    """Store chunks from prepare_document_chunks and make them searchable.
+
+    Chunks whose text the owner already has indexed, in this or another
+    document, are stored but not indexed again (see _remove_chunks for
+    why they are kept).
+    """
+    new_metadata, vectors = prepared
+    if not new_metadata and not replace:
+        return
+
+    with _index_lock, store.writer_lock():
+        # Chunk IDs are row positions, so first catch up with other workers
+        synced = _apply_store_changes()
+        # The replace and the add are published as one snapshot, so
+        # searches never see both versions of the document, or neither
+        snapshot = owner_snapshots.get(owner_id)
+        if replace:
+            snapshot, removed = _delete_chunks(owner_id, snapshot, document_id)
+            print(f"Replaced {len(removed)} chunks of document {document_id}")
+        if new_metadata:
+            # Persist the new rows before exposing them to searches
+            # store.append also maps the new segment into chunk_metadata
+            first_id = len(chunk_metadata)
+            store.append(vectors, new_metadata)
+            chunk_ids = np.arange(first_id, first_id + len(new_metadata), dtype="int64")
+            # Checked here, under the lock: concurrent uploads of the same
+            # text are only seen by whichever publishes second
+            snapshot = _add_chunks(owner_id, snapshot, chunk_ids)
+        _publish(owner_id, snapshot)
+        if replace:
+            store.purge()
+
+    print(f"Total indexed for owner {owner_id}: {owner_chunk_count(owner_id)}")
+    for changed_owner in synced | {owner_id}:
+        _schedule_rebuild(changed_owner)
+
+def _delete_chunks(owner_id: int, snapshot, document_id: int):
+    """Tombstone a document's chunks; the caller holds _index_lock and the store's writer lock.
+
+    Returns:
+        (snapshot without them, IDs of the chunks removed)
+    """
+    if snapshot is None:
+        return None, _NO_IDS
+    owned = np.concatenate([snapshot.chunk_ids, snapshot.duplicates])
+    doomed = np.sort(owned[chunk_metadata.gather("document_ids", owned) == document_id])
+    if not len(doomed):
+        return snapshot, _NO_IDS
+    store.delete(doomed)
+    return _remove_chunks(owner_id, snapshot, doomed), doomed
+
+def delete_document_chunks(document_id: int, owner_id: int) -> int:
+    """Remove a document from search results and its text from disk.
+
+    Its chunks are tombstoned at once and filtered out of searches, then
+    purged from the segment store along with their cached embeddings. The
+    owner's partition is rebuilt without their vectors in the background
+    once TOMBSTONE_COMPACT_RATIO of it is deleted.
+
+    Returns:
+        Number of chunks removed
+    """
+    ensure_index_loaded()
+    with _index_lock, store.writer_lock():
+        synced = _apply_store_changes()
+        snapshot, removed = _delete_chunks(owner_id, owner_snapshots.get(owner_id), document_id)
+        if len(removed):
+            _publish(owner_id, snapshot)
+            texts = [chunk_metadata[int(chunk_id)]["text"] for chunk_id in removed]
+            store.purge()
+    if len(removed):
+        forget_embeddings(texts)
+        print(f"Deleted {len(removed)} chunks of document {document_id} for owner {owner_id}")
+        synced.add(owner_id)
+    for changed_owner in synced:
+        _schedule_rebuild(changed_owner)
+    return len(removed)
+
+# -------------------------
+# Writes from other workers
+# -------------------------
+
+def _apply_store_changes() -> set:
+    """Index rows and deletes that other processes wrote to the store.
+
+    The caller holds _index_lock.
+
+    Returns:
+        Owners whose chunks changed
+    """
+    first_row, new_tombstones = store.refresh()
+    snapshots = {}  # owner_id -> new snapshot, published once all changes are in
+
+    rows = np.arange(first_row, len(chunk_metadata), dtype="int64")
+    # Rows deleted again before this process saw them are never indexed
+    rows = rows[~np.isin(rows, new_tombstones)]
+    for owner_id, positions in _group_by_owner(chunk_metadata.gather("owner_ids", rows)).items():
+        snapshots[owner_id] = _add_chunks(owner_id, owner_snapshots.get(owner_id), rows[positions])
+
+    deleted = np.unique(new_tombstones[new_tombstones < first_row])
+    for owner_id, positions in _group_by_owner(chunk_metadata.gather("owner_ids", deleted)).items():
+        snapshot = snapshots[owner_id] if owner_id in snapshots else owner_snapshots.get(owner_id)
+        if snapshot is None:
+            continue
+        ids = deleted[positions]
+        ids = ids[np.isin(ids, snapshot.chunk_ids) | np.isin(ids, snapshot.duplicates)]
+        if len(ids):
+            snapshots[owner_id] = _remove_chunks(owner_id, snapshot, ids)
+
+    for owner_id, snapshot in snapshots.items():
+        _publish(owner_id, snapshot)
+    return set(snapshots)
+
+def _watch_store():
+    """Apply other workers' writes every INDEX_RELOAD_INTERVAL_SECONDS."""
+    while True:
+        time.sleep(INDEX_RELOAD_INTERVAL_SECONDS)
+        try:
+            if not store.changed():
+                continue
+            with _index_lock:
+                changed = _apply_store_changes()
+            if changed:
+                print(f"Reloaded index changes for owners {sorted(changed)}")
+            for owner_id in changed:
+                _schedule_rebuild(owner_id)
+        except Exception as e:
+            print(f"ERROR reloading index changes: {e}")
+
+def owner_version(owner_id: int) -> int:
+    """Changes whenever the owner's indexed chunks change."""
+    ensure_index_loaded()
+    return owner_versions.get(owner_id, 0)
+
+def owner_index_type(owner_id: int):
+    """Index type currently serving the owner's searches, or None."""
+    ensure_index_loaded()
+    snapshot = owner_snapshots.get(owner_id)
+    return index_type_of(snapshot.partition) if snapshot is not None else None
+
+def total_vectors() -> int:
+    """Number of vectors across all owner partitions."""
+    ensure_index_loaded()
+    return sum(snapshot.vector_count for snapshot in list(owner_snapshots.values()))
 
 def has_documents_for_owner(owner_id: int) -> bool:
     """Check if there are any indexed documents for this owner."""
-    return any(meta["owner_id"] == owner_id for meta in chunk_metadata)
+    ensure_index_loaded()
+    return owner_id in owner_snapshots
+
+def owner_chunk_count(owner_id: int) -> int:
+    """Number of indexed chunks for this owner."""
+    ensure_index_loaded()
+    snapshot = owner_snapshots.get(owner_id)
+    return len(snapshot.chunk_ids) if snapshot is not None else 0
+
+def list_owners() -> list[int]:
+    """Owners with at least one indexed chunk."""
+    ensure_index_loaded()
+    return list(owner_snapshots)
+
+def _build_keyword_index(owner_id: int):
+    """Build an owner's keyword index from their stored chunk texts.
 
-def search_similar_chunks(query: str, owner_id: int, top_k: int = 5):
+    Runs on _keyword_executor for every owner after load, so no search
+    waits for it; until it is published, keyword and hybrid searches fall
+    back to vector search. Chunks indexed afterwards are added to it by
+    _with_chunks. It can be ahead of the snapshot being searched; search
+    with allowed=chunk_ids.
+    """
+    try:
+        with _index_lock:
+            snapshot = owner_snapshots.get(owner_id)
+            if snapshot is None or owner_id in owner_keyword_indexes:
+                return
+        ids = snapshot.chunk_ids
+        start = time.perf_counter()
+        keyword_index = KeywordIndex()
+        keyword_index.add(ids, (chunk_metadata[int(chunk_id)]["text"] for chunk_id in ids))
+
+        with _index_lock:
+            current = owner_snapshots.get(owner_id)
+            if current is None or owner_id in owner_keyword_indexes:
+                return  # every chunk was deleted meanwhile, and maybe new ones indexed
+            # Catch up with chunks indexed or deleted during the build
+            added = np.setdiff1d(current.chunk_ids, ids, assume_unique=True)
+            keyword_index.add(added, (chunk_metadata[int(chunk_id)]["text"] for chunk_id in added))
+            keyword_index.mark_removed(ids[~np.isin(ids, current.chunk_ids)])
+            owner_keyword_indexes[owner_id] = keyword_index
+        print(f"Built keyword index for owner {owner_id} ({len(keyword_index)} chunks, "
+              f"{len(keyword_index.postings)} terms, {time.perf_counter() - start:.1f}s)")
+    except Exception as e:
+        print(f"ERROR building keyword index for owner {owner_id}: {e}")
+
+def _vector_ranking(query_vector: np.ndarray, snapshot: OwnerSnapshot, k: int) -> list:
+    """[(chunk_id, similarity)] from the snapshot's partitions, best first."""
+    hits = []
+    for partition, search in zip((snapshot.partition, snapshot.recent), snapshot.searches):
+        if partition is None or partition.ntotal == 0:
+            continue
+        # The snapshot's tombstones are skipped inside faiss
+        distances, indices = (search or partition).search(query_vector, min(k, partition.ntotal))
+        hits.extend(zip(indices[0].tolist(), to_similarity(distances[0]).tolist()))
+    hits = [(idx, score) for idx, score in hits if idx != -1]
+    hits.sort(key=lambda hit: hit[1], reverse=True)
+    return hits[:k]
+
+def _similarities(query_vector: np.ndarray, chunk_ids: list) -> np.ndarray:
+    """Vector similarity of the query to specific chunks, as in _vector_ranking."""
+    cosine = store.gather_vectors(chunk_ids) @ query_vector[0]
+    return to_similarity(cosine, faiss.METRIC_INNER_PRODUCT)
+
+def search_similar_chunks(query: str, owner_id: int, top_k: int = 5, mode: str = "vector"):
     """Search for similar chunks from owner's documents.
-    
+
+    Only the owner's partition is searched, so exactly top_k results are
+    returned whenever the owner has at least top_k chunks. Results are
+    ordered best first and carry their "chunk_id"; "score" is always the
+    vector similarity in [0, 1] (see index_factory.to_similarity), higher
+    meaning more relevant.
+
+    Modes:
+        vector   FAISS nearest neighbours
+        keyword  BM25 over the chunk texts; adds "keyword_score"
+        hybrid   both rankings fused by reciprocal rank, ordered by
+                 "rrf_score"; also adds "keyword_score" (0 when the chunk
+                 matched no query term)
+    keyword and hybrid return vector results while the owner's keyword
+    index is still being built after startup.
+
     Args:
         query: Search query
         owner_id: Filter by document owner
         top_k: Number of chunks to return
+        mode: One of SEARCH_MODES
     """
-    if index.ntotal == 0:
+    ensure_index_loaded()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+    # Everything below reads this one snapshot, however writers move on
+    snapshot = owner_snapshots.get(owner_id)
+    if snapshot is None:
         return []
 
-    # Get all chunks for this owner
-    owner_chunks = [(i, meta) for i, meta in enumerate(chunk_metadata) if meta["owner_id"] == owner_id]
-    
-    if not owner_chunks:
-        return []
-    
-    print(f"Searching {len(owner_chunks)} chunks for owner {owner_id}")
-    
-    query_vector = np.array(embed_text(query), dtype="float32").reshape(1, -1)
-    
-    # Search broadly to find owner's chunks
-    search_k = min(index.ntotal, max(top_k * 20, 100))
-    distances, indices = index.search(query_vector, search_k)
-
-    # Filter by owner and take best matches
-    results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if idx < len(chunk_metadata) and chunk_metadata[idx]["owner_id"] == owner_id:
-            results.append({
+    cache_key = (owner_id, normalize_query(query), top_k, mode)
+    cached = result_cache.get(cache_key, snapshot.version)
+    if cached is not None:
+        return [dict(result) for result in cached]
+
+    print(f"Searching {len(snapshot.chunk_ids)} chunks for owner {owner_id} ({mode})")
+
+    query_vector = embed_query(query)
+    keyword_index = owner_keyword_indexes.get(owner_id) if mode != "vector" else None
+    # Not cached, so searches use the keyword index as soon as it is ready
+    cacheable = mode == "vector" or keyword_index is not None
+    if not cacheable:
+        print(f"Keyword index for owner {owner_id} is still being built, using vector search")
+    if keyword_index is None:
+        results = [
+            {**chunk_metadata[idx], "chunk_id": idx, "score": score}
+            for idx, score in _vector_ranking(query_vector, snapshot, top_k)
+        ]
+    else:
+        candidates = top_k if mode == "keyword" else max(top_k, HYBRID_CANDIDATES)
+        keyword_hits = keyword_index.search(query, candidates, allowed=snapshot.chunk_ids)
+        keyword_scores = dict(keyword_hits)
+        if mode == "keyword":
+            ranked = [(idx, None) for idx, _ in keyword_hits]
+        else:
+            vector_hits = _vector_ranking(query_vector, snapshot, candidates)
+            fused = reciprocal_rank_fusion(
+                [[idx for idx, _ in vector_hits], [idx for idx, _ in keyword_hits]], k=RRF_K
+            )
+            ranked = fused[:top_k]
+        ids = [idx for idx, _ in ranked]
+        similarities = _similarities(query_vector, ids) if ids else []
+        results = []
+        for (idx, fused_score), similarity in zip(ranked, similarities):
+            result = {
                 **chunk_metadata[idx],
-                "score": float(dist)
-            })
-            if len(results) >= top_k:
-                break
-    
+                "chunk_id": idx,
+                "score": float(similarity),
+                "keyword_score": keyword_scores.get(idx, 0.0),
+            }
+            if fused_score is not None:
+                result["rrf_score"] = fused_score
+            results.append(result)
+
+    # A chunk deleted since the snapshot was taken may be purged already
+    results = [result for result in results if result["owner_id"] == owner_id]
     if results:
-        print(f"Found {len(results)} chunks, best score: {results[0]['score']:.3f}")
-    
+        print(f"Found {len(results)} chunks, best score: {max(r['score'] for r in results):.3f}")
+
+    if cacheable:
+        result_cache.set(cache_key, snapshot.version, [dict(result) for result in results])
     return results
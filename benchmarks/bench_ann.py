@@ -0,0 +1,85 @@
+"""Recall@k vs latency for each index type on synthetic 384-dim vectors.
+
+Usage:
+    python -m benchmarks.bench_ann [--vectors 100000] [--queries 500] [--k 10]
+
+Vectors are drawn around random cluster centres and L2-normalized, like
+sentence embeddings; queries are perturbed corpus vectors. Ground truth
+comes from exact flat search. Each index type is built through the app's
+index factory and searched one query at a time, as /search does, across a
+sweep of nprobe (IVF) or efSearch (HNSW) values.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.index_factory import apply_search_params, build_index
+
+DIM = 384
+
+
+def make_vectors(count: int, clusters: int, rng) -> np.ndarray:
+    centres = rng.standard_normal((clusters, DIM)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, DIM)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int):
+    found = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, found[i] = index.search(query[np.newaxis], k)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+    return recall, latency_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.clusters, rng)
+    ids = np.arange(len(vectors), dtype="int64")
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    sweeps = {
+        "flat": [None],
+        "ivf_flat": [1, 4, 16, 64],
+        "hnsw": [16, 32, 64, 128],
+        "ivf_pq": [4, 16, 64],
+    }
+    print(f"{args.vectors} vectors, {args.queries} queries, recall@{args.k}")
+    print(f"{'index':9} {'param':>12} {'recall':>7} {'ms/query':>9} {'build s':>8} {'MiB':>8}")
+    for index_type, values in sweeps.items():
+        start = time.perf_counter()
+        index = build_index(index_type, vectors, ids)
+        build_seconds = time.perf_counter() - start
+        size_mib = len(faiss.serialize_index(index)) / 2 ** 20
+        for value in values:
+            if index_type == "hnsw":
+                apply_search_params(index, ef_search=value)
+                param = f"efSearch={value}"
+            elif value is not None:
+                apply_search_params(index, nprobe=value)
+                param = f"nprobe={value}"
+            else:
+                param = "-"
+            recall, latency_ms = measure(index, queries, truth, args.k)
+            print(f"{index_type:9} {param:>12} {recall:7.3f} {latency_ms:9.3f} {build_seconds:8.1f} {size_mib:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Chunking throughput and peak memory on multi-megabyte documents.
+
+Usage:
+    python -m benchmarks.bench_chunking [--sizes 1,4,16] [--page-chars 3000]
+
+For each document size (MB of synthetic OCR-like text, generated before
+timing) reports seconds, MB/s and the peak memory allocated while
+chunking, for:
+
+    concat        the previous chunk_text(): regex split that drops the
+                  sentence punctuation, chunk grown by string concatenation
+    chunk_text    app.utils.chunking.chunk_text() on the whole string
+    pages         iter_chunks() fed one page at a time, as ingestion does
+                  with OCR output; the document is never joined
+    pages/tokens  the same with CHUNK_UNIT=tokens
+    flat          iter_chunks() on the same amount of text as one piece
+                  without punctuation or line breaks, like a bad OCR pass,
+                  so every chunk is cut at a space
+
+Time per MB should stay flat as the size grows.
+"""
+import argparse
+import random
+import re
+import time
+import tracemalloc
+
+from app.utils.chunking import chunk_text, iter_chunks
+
+WORDS = (
+    "invoice total amount due contract party notice termination shipment warehouse "
+    "revenue quarter payment schedule clause delivery customer supplier agreement"
+).split()
+
+
+def concat_chunk_text(text: str, chunk_size: int = 800, overlap: int = 200):
+    """The chunker before iter_chunks(), kept for comparison."""
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+    sentences = re.compile(r'[.!?]\s+').split(text)
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = current_chunk[-overlap:] + " " + sentence if len(current_chunk) > overlap else sentence
+        else:
+            current_chunk += (" " if current_chunk else "") + sentence
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks if chunks else [text]
+
+
+def make_pages(total_chars: int, page_chars: int, seed: int = 0):
+    """Yield pages of sentence-like text, each ending in a newline, totalling about total_chars."""
+    rng = random.Random(seed)
+    produced = 0
+    while produced < total_chars:
+        sentences = []
+        length = 0
+        while length < page_chars:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize()
+            sentence += rng.choice([".", ".", ".", "?", "!", ":"])
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        page = " ".join(sentences) + "\n"
+        produced += len(page)
+        yield page
+
+
+def make_flat(total_chars: int, seed: int = 0) -> str:
+    """One string of words without punctuation or line breaks, about total_chars long."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < total_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def measure(run) -> tuple:
+    """(seconds, peak bytes allocated, result); timed without tracing, which slows Python down."""
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,4,16", help="document sizes in MB")
+    parser.add_argument("--page-chars", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"{'MB':>4} {'chunker':<13} {'seconds':>8} {'MB/s':>7} {'peak MB':>8} {'chunks':>7}")
+    for size in [float(size) for size in args.sizes.split(",")]:
+        pages = list(make_pages(int(size * 1024 * 1024), args.page_chars))
+        flat = make_flat(int(size * 1024 * 1024))
+        runs = {
+            "concat": lambda: len(concat_chunk_text("".join(pages))),
+            "chunk_text": lambda: len(chunk_text("".join(pages))),
+            "pages": lambda: sum(1 for _ in iter_chunks(iter(pages))),
+            "pages/tokens": lambda: sum(1 for _ in iter_chunks(iter(pages), 200, 50, unit="tokens")),
+            "flat": lambda: sum(1 for _ in iter_chunks([flat])),
+        }
+        for name, run in runs.items():
+            seconds, peak, chunks = measure(run)
+            print(f"{size:4g} {name:<13} {seconds:8.2f} {size / seconds:7.1f} {peak / 1024 / 1024:8.1f} {chunks:7d}")
+
+
+if __name__ == "__main__":
+    main()
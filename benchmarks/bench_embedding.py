@@ -0,0 +1,67 @@
+"""Chunks/sec for document ingestion: per-chunk embedding vs batched.
+
+Usage:
+    python -m benchmarks.bench_embedding [--chunks 500] [--batch-size 64]
+
+Runs on CPU with the same model as the app. The "before" path reproduces
+the old per-chunk loop (one encode, .tolist() and index.add per chunk);
+the "after" path is embed_texts + a single bulk add.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.llm.embedding import embed_texts, get_model, DIM
+from app.utils.chunking import chunk_text
+
+SENTENCE = "The invoice for order {n} was issued on the third of the month and is payable within thirty days. "
+
+
+def make_chunks(count: int) -> list[str]:
+    chunks = []
+    n = 0
+    while len(chunks) < count:
+        text = "".join(SENTENCE.format(n=n + i) for i in range(200))
+        chunks.extend(chunk_text(text))
+        n += 200
+    return chunks[:count]
+
+
+def per_chunk(chunks: list[str]) -> float:
+    model = get_model()
+    index = faiss.IndexFlatL2(DIM)
+    start = time.perf_counter()
+    for chunk in chunks:
+        embedding = model.encode([chunk])[0]
+        embedding = (embedding / np.linalg.norm(embedding)).tolist()
+        index.add(np.array(embedding, dtype="float32").reshape(1, -1))
+    return time.perf_counter() - start
+
+
+def batched(chunks: list[str], batch_size: int) -> float:
+    index = faiss.IndexFlatL2(DIM)
+    start = time.perf_counter()
+    index.add(embed_texts(chunks, batch_size=batch_size))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    print(f"{len(chunks)} chunks")
+
+    before = per_chunk(chunks)
+    after = batched(chunks, args.batch_size)
+    print(f"per-chunk: {len(chunks) / before:8.1f} chunks/sec ({before:.2f}s)")
+    print(f"batched:   {len(chunks) / after:8.1f} chunks/sec ({after:.2f}s, batch_size={args.batch_size})")
+    print(f"speedup:   {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
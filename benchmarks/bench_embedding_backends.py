@@ -0,0 +1,71 @@
+"""Embedding throughput, query latency and agreement for each backend.
+
+Usage:
+    python -m benchmarks.bench_embedding_backends [--chunks 500] [--queries 200] [--backends torch,onnx,onnx-int8]
+
+For every backend (see app/llm/embedding_backends.py) reports:
+
+    load      seconds to load (and, the first time, export) the model
+    chunks/s  ingestion throughput, chunk_text() chunks in batches of 64
+    p50/p99   single-query latency in ms, one encode call per query
+    cosine    mean / minimum cosine similarity to the torch vectors
+
+Run with ONNX_THREADS set to compare thread counts on the target nodes.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.llm.embedding import MODEL_NAME
+from app.llm.embedding_backends import BACKENDS, create_backend
+from benchmarks.bench_embedding import make_chunks
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    queries = [f"when is invoice {n} due for payment?" for n in range(args.queries)]
+    names = args.backends.split(",")
+    reference = None
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries")
+    print(f"{'backend':<10} {'load s':>7} {'chunks/s':>9} {'p50 ms':>7} {'p99 ms':>7} {'cosine':>15}")
+    for name in names:
+        start = time.perf_counter()
+        backend = create_backend(name, MODEL_NAME)
+        backend.encode(["warm up"])
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = normalize(backend.encode(chunks, batch_size=64))
+        throughput = len(chunks) / (time.perf_counter() - start)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            backend.encode([query])
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+
+        if name == "torch":
+            reference = vectors
+        if reference is not None:
+            cosine = np.sum(vectors * reference, axis=1)
+            agreement = f"{cosine.mean():.4f}/{cosine.min():.4f}"
+        else:
+            agreement = "n/a"
+        print(f"{name:<10} {load:7.1f} {throughput:9.1f} {p50:7.2f} {p99:7.2f} {agreement:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Per-worker memory for chunk metadata: pickled list of dicts vs mapped columns.
+
+Usage:
+    python -m benchmarks.bench_metadata_rss [--chunks 1000000] [--chunk-chars 800]
+
+Builds a synthetic corpus once in a temporary directory, then loads it in a
+fresh process per layout (as a uvicorn worker would at import time) and
+reports that process's RSS split into anonymous (private to the worker)
+and file-backed (page cache, shared between workers) memory. Linux only.
+"""
+import argparse
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from app.metadata_store import ChunkMetadataStore, MetadataSegment, write_columns
+
+WORDS = "invoice total amount due payment order customer address date reference account balance".split()
+
+
+def _status_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def build_corpus(directory: str, chunks: int, chunk_chars: int):
+    rng = random.Random(0)
+    owner_ids = np.array([rng.randrange(1000) for _ in range(chunks)], dtype="int64")
+    document_ids = np.arange(chunks, dtype="int64") // 20
+    texts = []
+    for _ in range(chunks):
+        words = []
+        while sum(len(word) + 1 for word in words) < chunk_chars:
+            words.append(rng.choice(WORDS))
+        texts.append(" ".join(words))
+
+    with open(os.path.join(directory, "chunk_metadata.pkl"), "wb") as f:
+        pickle.dump(
+            [{"document_id": int(d), "owner_id": int(o), "text": t}
+             for d, o, t in zip(document_ids, owner_ids, texts)],
+            f,
+        )
+
+    segment_dir = os.path.join(directory, "segment")
+    os.makedirs(segment_dir)
+    encoded = [text.encode("utf-8") for text in texts]
+    text_offsets = np.zeros(chunks + 1, dtype="int64")
+    np.cumsum([len(text) for text in encoded], out=text_offsets[1:])
+    write_columns(segment_dir, document_ids, owner_ids, text_offsets, b"".join(encoded))
+
+
+def measure(directory: str, layout: str):
+    before_anon, before_file = _status_kb("RssAnon"), _status_kb("RssFile")
+    if layout == "pickle":
+        with open(os.path.join(directory, "chunk_metadata.pkl"), "rb") as f:
+            metadata = pickle.load(f)
+    else:
+        metadata = ChunkMetadataStore([MetadataSegment.open(os.path.join(directory, "segment"))])
+
+    # What the app does per request: owner lookup and a few result rows
+    np.unique(np.array([m["owner_id"] for m in metadata]) if layout == "pickle" else metadata.owner_ids())
+    rng = random.Random(1)
+    for _ in range(1000):
+        metadata[rng.randrange(len(metadata))]
+
+    anon = _status_kb("RssAnon") - before_anon
+    file_backed = _status_kb("RssFile") - before_file
+    print(f"{layout:>7}: private {anon / 1024:9.1f} MiB   shared/file-backed {file_backed / 1024:9.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--chunk-chars", type=int, default=800)
+    parser.add_argument("--measure", choices=["pickle", "mapped"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.dir, args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building {args.chunks} chunks of ~{args.chunk_chars} chars...")
+        build_corpus(directory, args.chunks, args.chunk_chars)
+        for layout in ("pickle", "mapped"):
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_metadata_rss", "--measure", layout, "--dir", directory],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
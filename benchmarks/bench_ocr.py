@@ -0,0 +1,72 @@
+"""PDF OCR throughput (pages/sec) against the number of worker processes.
+
+Usage:
+    python -m benchmarks.bench_ocr [--pages 40] [--max-workers N]
+
+Generates an image-only (scanned-style) PDF with Pillow, so every page
+takes the OCR path, and runs the app's page-streaming extraction engine
+over it with 1, 2, 4, ... worker processes. Needs Tesseract and Poppler on
+PATH (or TESSERACT_CMD).
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from app.utils.ocr import OCR_PAGES_PER_PROCESS, _init_worker, iter_pdf_pages
+
+LINE = "Invoice {page}-{line}: 12 units of part AX-{line:04d} at 19.99 each, due on delivery."
+
+
+def make_pdf(path: str, pages: int):
+    images = []
+    for page in range(pages):
+        image = Image.new("RGB", (1654, 2339), "white")  # A4 at 200 dpi
+        draw = ImageDraw.Draw(image)
+        for line in range(45):
+            draw.text((100, 100 + line * 48), LINE.format(page=page, line=line), fill="black")
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=200)
+
+
+def worker_counts(max_workers: int) -> list[int]:
+    counts, workers = [], 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    return counts + [max_workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.pdf")
+        make_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.cpu_count()} cores")
+
+        for workers in worker_counts(args.max_workers):
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            ) as pool:
+                # Start the worker processes before timing
+                pool.submit(_init_worker).result()
+
+                start = time.perf_counter()
+                for _ in iter_pdf_pages(path, pool, window=workers * OCR_PAGES_PER_PROCESS):
+                    pass
+                elapsed = time.perf_counter() - start
+            print(f"workers={workers:3d}: {args.pages / elapsed:7.2f} pages/sec ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Query embedding throughput and latency with and without micro-batching.
+
+Usage:
+    python -m benchmarks.bench_query_batching [--queries 2000] [--threads 32] [--max-wait-ms 2]
+
+Simulates concurrent /search traffic: each thread embeds distinct queries
+one at a time (the LRU cache is bypassed). "unbatched" calls encode once
+per query; "batched" goes through an EmbeddingBatcher with the given
+limits and also reports the batch sizes it achieved.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.llm.embedding import QUERY_BATCH_MAX_SIZE, EmbeddingBatcher, embed_texts
+
+
+def run(embed, queries: list, threads: int):
+    latencies = []
+
+    def timed(query):
+        start = time.perf_counter()
+        embed(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return len(queries) / elapsed, np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--max-batch-size", type=int, default=QUERY_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    queries = [f"what does clause {n} of the contract say about late payment" for n in range(args.queries)]
+    batcher = EmbeddingBatcher(embed_texts, args.max_batch_size, args.max_wait_ms)
+
+    for name, embed in [("unbatched", lambda query: embed_texts([query])), ("batched", batcher.embed)]:
+        qps, p50, p99 = run(embed, queries, args.threads)
+        print(f"{name:10} {qps:8.1f} queries/sec  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms")
+
+    stats = batcher.stats()
+    print(f"batches: {stats['batches']}, mean size {stats['mean_batch_size']:.1f}, max {stats['max_batch_size']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Keyword routing cost: one compiled alternation vs one re.search per pattern.
+
+Usage:
+    python -m benchmarks.bench_routing [--rounds 2000]
+
+Runs the question corpus from tests/test_routing.py through the old
+per-pattern matching (patterns recompiled from the re module cache on
+every call, as intent_node and answer_node used to) and through
+app.agents.routing.route_question, checks both agree, and prints
+microseconds per question.
+"""
+import argparse
+import re
+import time
+
+from app.agents.routing import DOC_KEYWORD_PATTERNS, route_question
+from tests.test_routing import ROUTING_CASES
+
+
+def route_per_pattern(question: str) -> bool:
+    question = question.lower()
+    return any(re.search(pattern, question) for pattern in DOC_KEYWORD_PATTERNS.values())
+
+
+def timed(route, questions: list, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            route(question)
+    return (time.perf_counter() - start) / (rounds * len(questions)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    questions = [question for question, _ in ROUTING_CASES]
+    for question in questions:
+        assert route_per_pattern(question) == route_question(question)["has_doc_keywords"], question
+
+    # The old nodes each matched the question separately
+    per_pattern = 2 * timed(route_per_pattern, questions, args.rounds)
+    compiled = timed(route_question, questions, args.rounds)
+    print(f"{len(questions)} questions x {args.rounds} rounds")
+    print(f"{'per-pattern re.search, twice':<32} {per_pattern:8.2f} us/question")
+    print(f"{'compiled alternation, once':<32} {compiled:8.2f} us/question")
+    print(f"speed-up: {per_pattern / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
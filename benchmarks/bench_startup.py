@@ -0,0 +1,50 @@
+"""Cold start: process start to first response, and to readiness.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 3]
+
+Each run starts a fresh interpreter that imports app.main, enters the
+FastAPI lifespan (which starts the background warm-up) and then:
+
+    import      seconds to import app.main
+    first       seconds from interpreter start to the first /healthz response
+    ready       seconds from interpreter start until /readyz returns 200
+
+Before lazy loading, "import" included loading the model and the whole
+index, and nothing could respond until both were done.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter() - start
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    assert client.get("/healthz").status_code == 200
+    first = time.perf_counter() - start
+    while client.get("/readyz").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter() - start
+print(json.dumps({"import": imported, "first": first, "ready": ready}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'run':>4} {'import':>8} {'first':>8} {'ready':>8}")
+    for run in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{run + 1:>4} {timings['import']:8.2f} {timings['first']:8.2f} {timings['ready']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
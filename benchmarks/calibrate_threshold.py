@@ -0,0 +1,95 @@
+"""Pick CONTEXT_MIN_SCORE from a labelled query set.
+
+Usage:
+    python -m benchmarks.calibrate_threshold queries.jsonl [--objective f1|accuracy]
+
+Each line of queries.jsonl is a JSON object:
+
+    {"owner_id": 1, "question": "When is the invoice due?", "relevant": true}
+
+where "relevant" says whether the owner's indexed documents answer the
+question. Every question is searched against the vector store in
+VECTOR_STORE_DIR, and each candidate threshold is scored on how well
+"best score >= threshold" predicts the label. Prints a summary table and
+the threshold to set as CONTEXT_MIN_SCORE.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from app.vector_store import search_similar_chunks
+
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(scores: np.ndarray, labels: np.ndarray, threshold: float) -> dict:
+    predicted = scores >= threshold
+    tp = int(np.sum(predicted & labels))
+    fp = int(np.sum(predicted & ~labels))
+    fn = int(np.sum(~predicted & labels))
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "threshold": threshold,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "accuracy": float(np.mean(predicted == labels)),
+    }
+
+
+def best_threshold(scores: np.ndarray, labels: np.ndarray, objective: str = "f1") -> dict:
+    """Threshold maximising the objective.
+
+    Candidates lie halfway between neighbouring observed scores; among
+    equally good candidates the one in the widest gap wins, leaving the
+    most margin on both sides.
+    """
+    observed = np.unique(np.concatenate([scores.astype("float64"), [0.0, 1.0]]))
+    gaps = np.diff(observed)
+    candidates = observed[:-1] + gaps / 2
+    results = [evaluate(scores, labels, float(threshold)) for threshold in candidates]
+    best = max(range(len(results)), key=lambda i: (results[i][objective], gaps[i]))
+    return results[best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("queries")
+    parser.add_argument("--objective", choices=["f1", "accuracy"], default="f1")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    scores, labels = [], []
+    for query in queries:
+        results = search_similar_chunks(query["question"], query["owner_id"], top_k=1)
+        scores.append(results[0]["score"] if results else 0.0)
+        labels.append(bool(query["relevant"]))
+    scores = np.array(scores, dtype="float32")
+    labels = np.array(labels, dtype=bool)
+
+    print(f"{len(queries)} queries, {int(labels.sum())} relevant")
+    for name, mask in (("relevant", labels), ("not relevant", ~labels)):
+        if mask.any():
+            print(f"best score, {name:12}: median {np.median(scores[mask]):.3f}, "
+                  f"min {scores[mask].min():.3f}, max {scores[mask].max():.3f}")
+
+    print(f"\n{'threshold':>9} {'precision':>9} {'recall':>7} {'f1':>6} {'accuracy':>8}")
+    for threshold in np.arange(0.3, 0.95, 0.05):
+        result = evaluate(scores, labels, float(threshold))
+        print(f"{threshold:9.2f} {result['precision']:9.3f} {result['recall']:7.3f} "
+              f"{result['f1']:6.3f} {result['accuracy']:8.3f}")
+
+    best = best_threshold(scores, labels, args.objective)
+    print(f"\nbest {args.objective}: {best[args.objective]:.3f} "
+          f"(precision {best['precision']:.3f}, recall {best['recall']:.3f})")
+    print(f"CONTEXT_MIN_SCORE={best['threshold']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,16 @@
+import os
+import shutil
+import tempfile
+
+# Tests must not call Azure; set before app.main imports the LLM client
+os.environ.setdefault("LLM_BACKEND", "fake")
+# Nor write to ./vector_store and ./cache. Test modules import app modules,
+# which read these at import, while being collected, before any fixture
+# (tmp_path_factory included) exists, so the directory is made here
+DATA_DIR = tempfile.mkdtemp(prefix="ai-backend-tests-")
+os.environ["VECTOR_STORE_DIR"] = os.path.join(DATA_DIR, "vector_store")
+os.environ["CACHE_DIR"] = os.path.join(DATA_DIR, "cache")
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -13,6 +26,12 @@ def setup_test_database():
     drop_test_db()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def remove_data_dir():
+    yield
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
 def override_get_db():
     db = TestingSessionLocal()
     try:
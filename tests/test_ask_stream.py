@@ -0,0 +1,46 @@
+import json
+
+from tests.conftest import client
+from tests.test_documents import create_test_user
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_ask_stream_matches_ask():
+    user_id = create_test_user()
+    request = {"question": "What is Python?", "owner_id": user_id}
+
+    response = client.post("/ai/ask/stream", json=request)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(response.text)
+    assert events[0] == ("route", {"from_documents": False})
+    assert events[-1][0] == "done"
+
+    tokens = [data["text"] for event, data in events if event == "token"]
+    assert len(tokens) > 1
+    assert tokens[0] == "This is not from documents.\n\n"
+    assert "".join(tokens) == events[-1][1]["answer"]
+
+    # Another owner, so the answer isn't served from the stream's cache entry
+    other_request = {**request, "owner_id": create_test_user()}
+    answer = client.post("/ai/ask", json=other_request).json()["answer"]
+    assert events[-1][1]["answer"] == answer
+
+
+def test_ask_reuses_cached_answer():
+    user_id = create_test_user()
+    before = client.get("/debug/cache_stats").json()["answers"]["hits"]
+
+    first = client.post("/ai/ask", json={"question": "What is Python?", "owner_id": user_id})
+    second = client.post("/ai/ask", json={"question": "what is  python?", "owner_id": user_id})
+
+    assert second.json() == first.json()
+    assert client.get("/debug/cache_stats").json()["answers"]["hits"] == before + 1
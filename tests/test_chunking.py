@@ -0,0 +1,79 @@
+from app.utils import chunking
+from app.utils.chunking import chunk_text, iter_chunks
+
+PAGES = [
+    "Invoice 42 is due on March 3. Payment goes to the supplier account!\n",
+    "Is the shipment late? The warehouse says no. " * 20 + "\n",
+    "no punctuation at all on this scanned page " * 40 + "\n",
+]
+
+
+def test_chunks_are_exact_slices_with_pages():
+    document = "".join(PAGES)
+    chunks = list(iter_chunks(iter(PAGES), chunk_size=200, overlap=50))
+    assert len(chunks) > 5
+    page_starts = [0, len(PAGES[0]), len(PAGES[0]) + len(PAGES[1])]
+    previous = None
+    for chunk in chunks:
+        assert document[chunk.start:chunk.end] == chunk.text
+        assert len(chunk.text) <= 200
+        assert page_starts[chunk.page - 1] <= chunk.start
+        if previous is not None:
+            # Moves forward, overlapping the previous chunk by at most 50 chars
+            assert previous.start < chunk.start and previous.end < chunk.end
+            assert previous.end - chunk.start <= 50
+        previous = chunk
+    assert chunks[0].text.startswith("Invoice 42 is due on March 3. Payment")
+    assert chunks[-1].page == 3
+    # Nothing is lost between chunks
+    covered = set()
+    for chunk in chunks:
+        covered.update(range(chunk.start, chunk.end))
+    assert all(i in covered for i, char in enumerate(document) if not char.isspace())
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("  Hello world.  ") == ["Hello world."]
+    assert chunk_text("") == []
+
+
+def test_token_sizing():
+    from app.agents.context_builder import count_tokens
+
+    chunks = chunk_text("".join(PAGES), chunk_size=40, overlap=10, unit="tokens")
+    assert len(chunks) > 3
+    assert all(count_tokens(chunk) <= 40 for chunk in chunks)
+
+
+def flat_text(words: int) -> str:
+    """Words without punctuation or line breaks, like OCR output of some scans."""
+    vocabulary = ["invoice", "total", "amount", "due", "supplier", "warehouse", "shipment", "account", "net"]
+    return " ".join(vocabulary[n * 7 % len(vocabulary)] for n in range(words))
+
+
+def test_unpunctuated_text_is_chunked_in_linear_time(monkeypatch):
+    text = flat_text(150_000)  # about 1 MB
+    work = {"scanned": 0, "copied": 0, "buffer": None}
+    cut = chunking._cut
+
+    def counting_cut(buffer, start, end, limit):
+        # Every new buffer string is a copy of document text
+        if buffer is not work["buffer"]:
+            work["buffer"] = buffer
+            work["copied"] += len(buffer)
+        work["scanned"] += min(end, start + limit) - start
+        return cut(buffer, start, end, limit)
+
+    monkeypatch.setattr(chunking, "_cut", counting_cut)
+    chunks = list(iter_chunks([text]))
+    # Copying or searching the rest of the text for every cut made both grow with its square
+    assert work["copied"] <= 3 * len(text)
+    assert work["scanned"] <= 2 * len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert text[chunk.start:chunk.end] == chunk.text
+        assert len(chunk.text) <= 800
+        # Each cut run fills a chunk, so neighbours meet at a space instead of overlapping
+        assert previous.start < chunk.start and not text[previous.end:chunk.start].strip()
+    assert text[chunks[-1].end:].strip() == ""
+    # One sentence end after a megabyte of words is cut the same way
+    assert list(iter_chunks([text + "."]))[:-1] == chunks[:-1]
@@ -0,0 +1,59 @@
+from app.agents.context_builder import MIN_PASSAGE_TOKENS, build_context, count_tokens, merge_chunks
+from app.utils.chunking import iter_chunks
+
+DOCUMENT = " ".join(f"Sentence {n} of the contract covers clause {n}." for n in range(60))
+CHUNKS = [
+    {"document_id": 1, "chunk_id": 100 + n, "text": chunk.text, "start": chunk.start, "score": 0.5}
+    for n, chunk in enumerate(iter_chunks([DOCUMENT], chunk_size=200, overlap=60))
+]
+
+
+def test_adjacent_chunks_merge_without_the_overlap():
+    first, second, third = CHUNKS[2:5]
+    assert second["start"] < first["start"] + len(first["text"])  # they do overlap
+    passages = merge_chunks([third, first, dict(second, score=0.9)])
+    assert passages == [{
+        "document_id": 1,
+        "text": DOCUMENT[first["start"]:third["start"] + len(third["text"])],
+        "score": 0.9,
+    }]
+
+
+def test_separate_chunks_stay_separate_best_first():
+    near, far = CHUNKS[1], dict(CHUNKS[6], score=0.8)
+    other_document = dict(CHUNKS[2], document_id=2, score=0.7)
+    passages = merge_chunks([near, far, other_document])
+    assert [(p["document_id"], p["text"]) for p in passages] == [
+        (1, far["text"]), (2, other_document["text"]), (1, near["text"]),
+    ]
+
+
+def test_consecutive_ids_are_not_joined_unless_text_is_contiguous():
+    # Dedup skips chunks, so neighbouring IDs can hold unrelated text
+    apart = [dict(CHUNKS[1], chunk_id=7), dict(CHUNKS[6], chunk_id=8)]
+    assert len(merge_chunks(apart)) == 2
+    # Likewise for chunks stored before offsets were recorded
+    legacy = [dict(chunk, start=-1) for chunk in apart]
+    assert len(merge_chunks(legacy)) == 2
+    legacy = [dict(chunk, start=-1) for chunk in CHUNKS[2:4]]
+    assert merge_chunks(legacy)[0]["text"] == DOCUMENT[CHUNKS[2]["start"]:CHUNKS[3]["start"] + len(CHUNKS[3]["text"])]
+
+
+def test_exact_repeat_is_dropped():
+    assert len(merge_chunks([CHUNKS[3], dict(CHUNKS[3])])) == 1
+    legacy = dict(CHUNKS[3], start=-1)
+    assert len(merge_chunks([legacy, dict(legacy, chunk_id=500)])) == 1
+
+
+def test_context_is_trimmed_to_the_budget():
+    chunks = [dict(CHUNKS[0], score=0.9), dict(CHUNKS[6], score=0.5)]
+    first_tokens = count_tokens(CHUNKS[0]["text"])
+
+    context, tokens = build_context(chunks, max_tokens=first_tokens + MIN_PASSAGE_TOKENS + 10)
+    assert context.startswith(CHUNKS[0]["text"] + "\n\n")
+    assert tokens == count_tokens(context) <= first_tokens + MIN_PASSAGE_TOKENS + 10
+    assert CHUNKS[6]["text"].startswith(context.split("\n\n")[1])
+
+    # Too little room left for a useful second passage
+    context, tokens = build_context(chunks, max_tokens=first_tokens + 5)
+    assert context == CHUNKS[0]["text"] and tokens == first_tokens
@@ -53,3 +53,35 @@ def test_get_user_documents():
     assert response.status_code == 200
     assert isinstance(response.json(), list)
     assert len(response.json()) >= 1
+
+
+def test_update_document_content():
+    user_id = create_test_user()
+    doc_id = client.post(
+        "/documents",
+        json={"title": "Editable Doc", "owner_id": user_id}
+    ).json()["id"]
+
+    response = client.put(
+        f"/documents/{doc_id}/content",
+        json={"content": "The warranty covers parts and labour for two years."}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["content"] == "The warranty covers parts and labour for two years."
+
+
+def test_delete_document():
+    user_id = create_test_user()
+    doc_id = client.post(
+        "/documents",
+        json={"title": "Doomed Doc", "owner_id": user_id}
+    ).json()["id"]
+    client.put(f"/documents/{doc_id}/content", json={"content": "Temporary text."})
+
+    response = client.delete(f"/documents/{doc_id}")
+
+    assert response.status_code == 200
+    assert response.json()["chunks_removed"] >= 1
+    assert client.get(f"/users/{user_id}/documents").json() == []
+    assert client.delete(f"/documents/{doc_id}").status_code == 404
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+from app.llm.embedding import DIM, MODEL_NAME
+from app.llm.embedding_backends import create_backend
+from app.utils.chunking import chunk_text
+
+SENTENCES = [
+    "What is the total amount due on invoice INV-2023-0042?",
+    "The contract may be terminated by either party with thirty days written notice.",
+    "Quarterly revenue grew by 12% compared to the same period last year.",
+    "hello",
+    "",
+] + chunk_text("The shipment left the warehouse on Monday. " * 60)
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("onnx"))
+
+
+@pytest.fixture(scope="module")
+def torch_vectors():
+    vectors = create_backend("torch", MODEL_NAME).encode(SENTENCES)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("name,min_cosine", [("onnx", 0.9999), ("onnx-int8", 0.98)])
+def test_onnx_backend_matches_torch(name, min_cosine, model_dir, torch_vectors):
+    vectors = create_backend(name, MODEL_NAME, model_dir).encode(SENTENCES, batch_size=4)
+
+    assert vectors.shape == (len(SENTENCES), DIM)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert np.sum(vectors * torch_vectors, axis=1).min() >= min_cosine
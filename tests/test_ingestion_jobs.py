@@ -0,0 +1,44 @@
+import threading
+
+from app.services import ingestion
+from app.services.ingestion import IngestionJob, JobQueue
+from app.utils.disk_cache import DiskLRUCache
+
+
+def test_job_state_is_visible_to_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "job_states", DiskLRUCache(str(tmp_path / "jobs.sqlite"), 1024 * 1024))
+    # Two queues stand in for two uvicorn workers sharing CACHE_DIR
+    uploading, polled = JobQueue(1, 10, 10), JobQueue(1, 10, 10)
+    started, release = threading.Event(), threading.Event()
+
+    def run(job):
+        job.stage = "extracting"
+        job.pages_total = 3
+        job.save()
+        started.set()
+        release.wait(5)
+
+    job = IngestionJob(1, 42, "scan.pdf", "application/pdf", "hash")
+    uploading.submit(job, run)
+    assert started.wait(5)
+    state = polled.get(job.job_id)
+    assert (state["status"], state["stage"], state["pages_total"]) == ("running", "extracting", 3)
+
+    release.set()
+    uploading._executor.shutdown(wait=True)
+    assert polled.get(job.job_id) == uploading.get(job.job_id)
+    assert polled.get(job.job_id)["status"] == "done"
+    assert polled.get("unknown") is None
+
+
+def test_forgetting_a_document_drops_its_extracted_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "extraction_cache", DiskLRUCache(str(tmp_path / "extractions.sqlite"), 1024 * 1024))
+    monkeypatch.setattr(ingestion, "job_states", DiskLRUCache(str(tmp_path / "jobs.sqlite"), 1024 * 1024))
+    monkeypatch.setattr(ingestion, "iter_pdf_pages", lambda path: iter([(1, 1, "page text", "text")]))
+    job = IngestionJob(1, 42, "scan.pdf", "application/pdf", "hash")
+    assert list(ingestion.extract_pages(job, str(tmp_path / "scan.pdf"), [])) == ["page text\n"]
+    assert ingestion.extraction_cache.get("hash") is not None
+
+    ingestion.forget_extraction(42)
+    assert ingestion.extraction_cache.stats()["entries"] == 0
+    ingestion.forget_extraction(42)  # nothing left to drop
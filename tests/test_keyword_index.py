@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.keyword_index import KeywordIndex, reciprocal_rank_fusion, tokenize
+
+TEXTS = {
+    10: "Invoice INV-2023-0042 is due in March.",
+    11: "Invoice INV-2023-0043 was paid in full.",
+    12: "The warehouse shipped the order late.",
+    13: "Late fees apply to every late invoice, late payment and late delivery.",
+}
+
+
+def build() -> KeywordIndex:
+    index = KeywordIndex()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Invoice INV-2023-0042, see a/b and 3.14") == [
+        "invoice", "inv-2023-0042", "inv", "2023", "0042", "see", "a/b", "b", "3.14", "3", "14",
+    ]
+
+
+def test_exact_identifier_ranks_first():
+    hits = build().search("INV-2023-0042", top_k=4)
+    assert hits[0][0] == 10
+    # Shares the "inv" and "2023" parts, but not the whole identifier
+    assert [chunk_id for chunk_id, _ in hits] == [10, 11]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_term_frequency_and_top_k():
+    hits = build().search("late", top_k=1)
+    assert hits == [(13, hits[0][1])]
+    assert build().search("nothing matches", top_k=3) == []
+
+
+def test_allowed_filters_results():
+    index = build()
+    assert [chunk_id for chunk_id, _ in index.search("invoice", 4, allowed=np.array([11, 12]))] == [11]
+    assert index.search("invoice", 4, allowed=np.array([], dtype="int64")) == []
+
+
+def test_compact_drops_removed_postings():
+    index = build()
+    index.mark_removed(np.array([10]))
+    assert len(index) == 3
+    index.compact()
+    assert (len(index), index.removed_count) == (3, 0)
+    assert "inv-2023-0042" not in index.postings
+    assert [chunk_id for chunk_id, _ in index.search("invoice", 4)] == [11, 13]
+    assert index.total_length == sum(len(tokenize(TEXTS[chunk_id])) for chunk_id in (11, 12, 13))
+
+    # Postings stay appendable after searching and compacting
+    index.add([14], ["Invoice INV-2023-0044"])
+    # A removal marked after a compact is kept for the next one
+    index.mark_removed([11])
+    index.compact()
+    index.mark_removed([13])
+    assert (len(index), index.removed_count) == (2, 1)
+    index.compact()
+    assert index.chunk_count == 2
+    assert [chunk_id for chunk_id, _ in index.search("invoice", 4)] == [14]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == 1 / 61 + 1 / 62
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from app.llm import azure_client
+from app.llm.azure_client import achat_completion, create_async_client
+
+
+class MockAzureServer:
+    """Local stand-in for the Azure chat completions endpoint.
+
+    Replies with the queued status codes in order, then 200.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests += 1
+                status = server.statuses.pop(0) if server.statuses else 200
+                if status == 200:
+                    body = {
+                        "id": "mock",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": "mock",
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "mock answer"},
+                            "finish_reason": "stop",
+                        }],
+                    }
+                else:
+                    body = {"error": {"message": f"status {status}"}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(azure_client, "LLM_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(azure_client, "LLM_MAX_RETRIES", 3)
+
+
+def ask(server):
+    async def run():
+        client = create_async_client(azure_endpoint=server.url, api_key="test", api_version="2024-02-15-preview")
+        return await achat_completion(["hello"], llm_client=client)
+
+    return asyncio.run(run())
+
+
+def test_retries_rate_limits_and_server_errors():
+    server = MockAzureServer([429, 500, 503])
+    try:
+        assert ask(server) == "mock answer"
+        assert server.requests == 4
+    finally:
+        server.close()
+
+
+def test_client_errors_are_not_retried():
+    server = MockAzureServer([400])
+    try:
+        with pytest.raises(openai.BadRequestError):
+            ask(server)
+        assert server.requests == 1
+    finally:
+        server.close()
+
+
+def test_gives_up_after_max_retries():
+    server = MockAzureServer([500] * 10)
+    try:
+        with pytest.raises(openai.InternalServerError):
+            ask(server)
+        assert server.requests == 4
+    finally:
+        server.close()
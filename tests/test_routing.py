@@ -0,0 +1,41 @@
+import pytest
+
+from app.agents.routing import route_question
+
+# (question, first matched feature); also the corpus for benchmarks/bench_routing.py
+ROUTING_CASES = [
+    ("Summarize my document", ["summarize"]),
+    ("Can you summarize it?", ["summarize"]),
+    ("What is in this file?", ["what_in"]),
+    ("what is written in here", ["what_in"]),
+    ("Tell me about this", ["tell_me_about"]),
+    ("Explain it in simple words", ["explain"]),
+    ("What did I upload? The uploaded invoice", ["uploaded"]),
+    ("Use the text above", ["doc_reference"]),
+    ("Use the figures above", ["above"]),
+    ("Based on the information provided, who signed?", ["provided"]),
+    ("Show the content of the document", ["content_of_doc"]),
+    ("List all dates from the doc", ["list_from_doc"]),
+    ("Find the total in my invoices doc", ["find_in_doc"]),
+    ("Show me names in the document", ["show_from_doc"]),
+    ("show me names from each document", ["show_from_doc"]),
+    ("What is the capital of France?", []),
+    ("How do I reverse a list in Python?", []),
+    ("Write a haiku about autumn", []),
+    ("Who won the 2018 World Cup?", []),
+    ("Explain quantum entanglement", []),
+    ("What's the weather like today?", []),
+    ("Translate 'good morning' to Spanish", []),
+]
+
+
+@pytest.mark.parametrize("question,features", ROUTING_CASES)
+def test_route_question(question, features):
+    routing = route_question(question)
+
+    assert routing["has_doc_keywords"] == bool(features)
+    assert routing["features"][:1] == features
+
+
+def test_route_question_is_case_insensitive():
+    assert route_question("SUMMARIZE THE PDF") == route_question("summarize the pdf")
@@ -0,0 +1,177 @@
+import numpy as np
+
+from app.segment_store import SegmentStore
+
+DIM = 4
+
+
+def rows(count: int, document_id: int, owner_id: int = 1):
+    vectors = np.random.default_rng(document_id).random((count, DIM), dtype="float32")
+    metadata = [
+        {"document_id": document_id, "owner_id": owner_id, "text": f"doc {document_id} chunk {i}"}
+        for i in range(count)
+    ]
+    return vectors, metadata
+
+
+def test_refresh_sees_other_writers(tmp_path):
+    """Two stores on one directory behave like two uvicorn workers."""
+    writer = SegmentStore(str(tmp_path), DIM, max_segments=2)
+    reader = SegmentStore(str(tmp_path), DIM, max_segments=2)
+    with writer.writer_lock():
+        writer.load()
+    with reader.writer_lock():
+        reader.load()
+    assert not reader.changed()
+
+    for document_id in range(4):
+        with writer.writer_lock():
+            writer.refresh()
+            writer.append(*rows(3, document_id))
+    with writer.writer_lock():
+        writer.delete([1, 4])
+
+    assert reader.changed()
+    first_new_row, new_tombstones = reader.refresh()
+    assert first_new_row == 0
+    assert reader.total_rows == writer.total_rows == 12
+    assert new_tombstones.tolist() == [1, 4]
+    assert reader.metadata.gather("document_ids", np.arange(12)).tolist() == [0] * 3 + [1] * 3 + [2] * 3 + [3] * 3
+    np.testing.assert_array_equal(reader.gather_vectors([0, 11]), writer.gather_vectors([0, 11]))
+    assert not reader.changed()
+
+    # The reader writes next and must not reuse the writer's segment names
+    with reader.writer_lock():
+        reader.refresh()
+        reader.append(*rows(2, 9))
+    first_new_row, new_tombstones = writer.refresh()
+    assert (first_new_row, len(new_tombstones)) == (12, 0)
+    assert writer.metadata.gather("document_ids", np.array([12, 13])).tolist() == [9, 9]
+
+
+def reopen(path) -> SegmentStore:
+    store = SegmentStore(str(path), DIM, max_segments=16)
+    store.load()
+    return store
+
+
+def texts(store: SegmentStore) -> list:
+    return [store.metadata[row]["text"] for row in range(store.total_rows)]
+
+
+def test_load_removes_unpublished_segments(tmp_path):
+    store = reopen(tmp_path)
+    store.append(*rows(3, 1))
+    # An interrupted write, and a renamed segment whose manifest never got written
+    (tmp_path / "segments" / "00000002.tmp").mkdir()
+    (tmp_path / "segments" / "00000003").mkdir()
+    (tmp_path / "MANIFEST.json.tmp").write_bytes(b"{")
+
+    store = reopen(tmp_path)
+    assert sorted(p.name for p in (tmp_path / "segments").iterdir()) == ["00000001"]
+    assert texts(store) == [f"doc 1 chunk {i}" for i in range(3)]
+
+
+def test_load_pads_segment_with_mismatched_counts(tmp_path):
+    store = reopen(tmp_path)
+    store.append(*rows(3, 1))
+    store.append(*rows(4, 2))
+    store.append(*rows(2, 3))
+    store.delete([7])
+    vectors = rows(4, 2)[0]
+    # Crash while the vectors of segment 2 were being written: 2 of 4 rows made it
+    np.save(tmp_path / "segments" / "00000002" / "vectors.npy", vectors[:2])
+
+    store = reopen(tmp_path)
+    # Missing rows become tombstoned placeholders, so later rows keep their IDs
+    assert [segment["rows"] for segment in store.segments] == [3, 4, 2]
+    assert texts(store)[3:] == ["doc 2 chunk 0", "doc 2 chunk 1", "", "", "doc 3 chunk 0", "doc 3 chunk 1"]
+    assert store.metadata.gather("owner_ids", np.array([5, 6])).tolist() == [-1, -1]
+    assert sorted(store.tombstones.tolist()) == [5, 6, 7]
+    np.testing.assert_array_equal(store.gather_vectors([3, 4]), vectors[:2])
+    # The repair is durable and not repeated
+    store = reopen(tmp_path)
+    assert (store.total_rows, sorted(store.tombstones.tolist())) == (9, [5, 6, 7])
+
+
+def test_load_replaces_unreadable_segment(tmp_path):
+    store = reopen(tmp_path)
+    for document_id in range(3):
+        store.append(*rows(2, document_id))
+    store.delete([4])
+    worker = reopen(tmp_path)  # mapped the segments before the damage
+    (tmp_path / "segments" / "00000002" / "vectors.npy").write_bytes(b"not a numpy file")
+
+    store = reopen(tmp_path)
+    assert not (tmp_path / "segments" / "00000002").exists()
+    assert store.metadata.gather("document_ids", np.arange(store.total_rows)).tolist() == [0, 0, -1, -1, 2, 2]
+    # The deleted "doc 2 chunk 0" stays deleted
+    assert texts(store)[4] == "doc 2 chunk 0"
+    assert sorted(store.tombstones.tolist()) == [2, 3, 4]
+
+    # Another worker sees the lost rows as deletes, with no rows renumbered
+    first_new_row, new_tombstones = worker.refresh()
+    assert (first_new_row, worker.total_rows) == (6, 6)
+    assert sorted(new_tombstones.tolist()) == [2, 3]
+    assert texts(worker) == texts(store)
+
+
+def test_load_drops_torn_tombstone_record(tmp_path):
+    store = reopen(tmp_path)
+    store.append(*rows(4, 1))
+    store.delete([1, 3])
+    with open(tmp_path / "tombstones.bin", "ab") as f:
+        f.write(b"\x02\x00\x00")  # part of a third record
+
+    store = reopen(tmp_path)
+    assert store.tombstones.tolist() == [1, 3]
+    assert (tmp_path / "tombstones.bin").stat().st_size == 16
+    store.delete([2])
+    assert reopen(tmp_path).tombstones.tolist() == [1, 3, 2]
+
+
+def test_compaction_preserves_row_order(tmp_path):
+    store = SegmentStore(str(tmp_path), DIM, max_segments=2)
+    store.load()
+    expected_vectors = []
+    for document_id in range(6):
+        vectors, metadata = rows(document_id + 1, document_id)
+        store.append(vectors, metadata)
+        expected_vectors.append(vectors)
+    assert len(store.segments) <= 2
+
+    expected_texts = [f"doc {d} chunk {i}" for d in range(6) for i in range(d + 1)]
+    for opened in (store, reopen(tmp_path)):
+        assert texts(opened) == expected_texts
+        np.testing.assert_array_equal(opened.all_vectors(), np.concatenate(expected_vectors))
+    assert len(list((tmp_path / "segments").iterdir())) == len(store.segments)
+
+
+def test_purge_removes_deleted_text_and_keeps_row_numbers(tmp_path):
+    store = reopen(tmp_path)
+    store.append(*rows(3, 1))
+    store.append(*rows(3, 2))
+    store.delete([1, 4])
+    worker = reopen(tmp_path)  # has read the tombstones
+    store.delete([5])  # not yet seen by the worker
+
+    assert store.purge() == 3
+    assert (tmp_path / "tombstones.bin").stat().st_size == 0
+    assert not len(store.tombstones)
+    segment_bytes = b"".join(path.read_bytes() for path in (tmp_path / "segments").rglob("*") if path.is_file())
+    for text in ("doc 1 chunk 1", "doc 2 chunk 1", "doc 2 chunk 2"):
+        assert text.encode() not in segment_bytes
+    expected = ["doc 1 chunk 0", "", "doc 1 chunk 2", "doc 2 chunk 0", "", ""]
+    assert texts(store) == texts(reopen(tmp_path)) == expected
+    assert store.metadata.gather("owner_ids", np.arange(6)).tolist() == [1, -1, 1, 1, -1, -1]
+    assert not store.gather_vectors([1, 4, 5]).any()
+    np.testing.assert_array_equal(store.gather_vectors([3]), rows(3, 2)[0][:1])
+
+    # The worker learns of the delete it missed from the rewritten segment
+    first_new_row, new_tombstones = worker.refresh()
+    assert (first_new_row, new_tombstones.tolist()) == (6, [5])
+    assert texts(worker) == expected
+    # and reads deletes recorded after the purge from the new tombstones.bin
+    store.delete([0])
+    assert worker.refresh()[1].tolist() == [0]
+    assert store.purge() == 1 and store.purge() == 0
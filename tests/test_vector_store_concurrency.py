@@ -0,0 +1,274 @@
+import hashlib
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from app import vector_store
+from app.llm.embedding import DIM
+from app.segment_store import SegmentStore
+from app.utils.chunking import Chunk
+from app.utils.result_cache import VersionedLRUCache
+
+OWNERS = [1, 2]
+WRITERS = 4
+READERS = 4
+DOCUMENTS_PER_WRITER = 25
+CHUNKS_PER_DOCUMENT = 12
+
+
+def fake_vector(text: str) -> np.ndarray:
+    seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype("float32")
+    return vector / np.linalg.norm(vector)
+
+
+def document(owner_id: int, document_id: int, revision: int) -> str:
+    return "\n".join(
+        f"owner {owner_id} doc {document_id} rev {revision} part {part}" for part in range(CHUNKS_PER_DOCUMENT)
+    )
+
+
+@pytest.fixture
+def isolated_store(tmp_path, monkeypatch):
+    """vector_store on an empty store in tmp_path, with deterministic embeddings."""
+    monkeypatch.setattr(vector_store, "store", SegmentStore(str(tmp_path), DIM, max_segments=4))
+    monkeypatch.setattr(vector_store, "owner_snapshots", {})
+    monkeypatch.setattr(vector_store, "owner_keyword_indexes", {})
+    monkeypatch.setattr(vector_store, "owner_trained_sizes", {})
+    monkeypatch.setattr(vector_store, "owner_partition_files", {})
+    monkeypatch.setattr(vector_store, "result_cache", VersionedLRUCache(64))
+    monkeypatch.setattr(vector_store, "_index_loaded", False)
+    monkeypatch.setattr(vector_store, "INDEX_RELOAD_INTERVAL_SECONDS", 0)
+    # Small enough that recent partitions get folded in during the run
+    monkeypatch.setattr(vector_store, "INDEX_RECENT_MAX_VECTORS", 64)
+    monkeypatch.setattr(vector_store, "iter_chunks", lambda pieces: (
+        Chunk(line, 0, len(line), 1) for line in "".join(pieces).split("\n")
+    ))
+    monkeypatch.setattr(vector_store, "embed_chunks", lambda texts: np.stack([fake_vector(t) for t in texts]))
+    monkeypatch.setattr(vector_store, "embed_query", lambda query: fake_vector(query)[None])
+    monkeypatch.setattr(vector_store, "forget_embeddings", lambda texts: None)
+    vector_store.ensure_index_loaded()
+    yield vector_store
+    vector_store._rebuild_executor.submit(lambda: None).result()
+
+
+def test_concurrent_writes_and_snapshot_reads(isolated_store):
+    errors = []
+    done = threading.Event()
+
+    def writer(number: int):
+        try:
+            for n in range(DOCUMENTS_PER_WRITER):
+                owner_id = OWNERS[n % len(OWNERS)]
+                document_id = number * 1000 + n
+                isolated_store.index_document_chunks(document_id, document(owner_id, document_id, 0), owner_id)
+                if n % 3 == 0:
+                    isolated_store.index_document_chunks(
+                        document_id, document(owner_id, document_id, 1), owner_id, replace=True
+                    )
+                if n % 5 == 0:
+                    isolated_store.delete_document_chunks(document_id, owner_id)
+        except Exception as e:
+            errors.append(f"writer {number}: {e!r}")
+
+    def reader(number: int):
+        query_number = 0
+        try:
+            while not done.is_set():
+                owner_id = OWNERS[query_number % len(OWNERS)]
+                mode = ("vector", "hybrid")[query_number % 2]
+                query = f"owner {owner_id} doc part {query_number}"
+                query_number += 1
+                results = isolated_store.search_similar_chunks(query, owner_id, top_k=8, mode=mode)
+                revisions = {}
+                for result in results:
+                    # FAISS ID, metadata row and stored text must all agree
+                    assert result["owner_id"] == owner_id
+                    assert f"owner {owner_id} doc {result['document_id']} rev " in result["text"]
+                    expected = max(float(fake_vector(result["text"]) @ fake_vector(query)), 0.0)
+                    assert abs(result["score"] - expected) < 1e-4
+                    # A replaced document is published in one step: never two revisions at once
+                    revision = result["text"].split(" rev ")[1].split()[0]
+                    assert revisions.setdefault(result["document_id"], revision) == revision
+        except Exception as e:
+            errors.append(f"reader {number}: {e!r}")
+
+    readers = [threading.Thread(target=reader, args=(n,)) for n in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    isolated_store._rebuild_executor.submit(lambda: None).result()
+
+    assert errors == []
+    metadata = isolated_store.chunk_metadata
+    live = np.setdiff1d(np.arange(len(metadata)), isolated_store.store.tombstones)
+    for owner_id in OWNERS:
+        snapshot = isolated_store.owner_snapshots[owner_id]
+        expected_ids = live[metadata.gather("owner_ids", live) == owner_id]
+        np.testing.assert_array_equal(np.union1d(snapshot.chunk_ids, snapshot.duplicates), expected_ids)
+        assert not len(snapshot.duplicates)  # every document's text is distinct
+        assert snapshot.vector_count - len(snapshot.deleted) == len(expected_ids)
+        in_partitions = [faiss_ids(snapshot.partition)]
+        if snapshot.recent is not None:
+            in_partitions.append(faiss_ids(snapshot.recent))
+        in_partitions = np.concatenate(in_partitions)
+        assert len(np.unique(in_partitions)) == len(in_partitions)
+        np.testing.assert_array_equal(np.setdiff1d(in_partitions, list(snapshot.deleted)), expected_ids)
+
+
+def faiss_ids(partition) -> np.ndarray:
+    return faiss.vector_to_array(partition.id_map)
+
+
+def test_built_partitions_are_mapped_from_shared_files(isolated_store, monkeypatch):
+    # 72 chunks, so the last upload fills the recent partition and it is folded in
+    for document_id in range(6):
+        isolated_store.index_document_chunks(document_id, document(1, document_id, 0), 1)
+    isolated_store._rebuild_executor.submit(lambda: None).result()
+    snapshot = isolated_store.owner_snapshots[1]
+    assert snapshot.recent is None and snapshot.partition.ntotal == 72
+    path = isolated_store.owner_partition_files[1]
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+    # The vectors stay in the file's pages instead of being copied
+    inner = faiss.downcast_index(snapshot.partition.index)
+    assert isinstance(faiss.downcast_InvertedLists(inner.invlists), faiss.OnDiskInvertedLists)
+    assert isolated_store.owner_index_type(1) == "flat"
+
+    # Another worker, or a restart, maps the same file instead of building one
+    def failing_build(*args, **kwargs):
+        raise AssertionError("partition built again")
+
+    monkeypatch.setattr(isolated_store, "build_index", failing_build)
+    isolated_store.load_index()
+    assert isolated_store.owner_partition_files[1] == path and os.path.exists(path)
+    query = "owner 1 doc 4 rev 0 part 7"
+    assert isolated_store.search_similar_chunks(query, 1, top_k=1)[0]["text"] == query
+
+
+def test_tombstones_are_skipped_inside_faiss(isolated_store, monkeypatch):
+    monkeypatch.setattr(isolated_store, "TOMBSTONE_COMPACT_RATIO", 1.0)
+    # 72 chunks folded into the partition, then 12 in the recent one
+    for document_id in range(7):
+        isolated_store.index_document_chunks(document_id, document(1, document_id, 0), 1)
+    isolated_store._rebuild_executor.submit(lambda: None).result()
+    isolated_store.delete_document_chunks(4, 1)
+    isolated_store.delete_document_chunks(6, 1)
+    snapshot = isolated_store.owner_snapshots[1]
+    assert [search.excluded_count for search in snapshot.searches] == [12, 12]
+
+    query = "owner 1 doc 4 rev 0 part 7"
+    results = isolated_store.search_similar_chunks(query, 1, top_k=10)
+    assert len(results) == 10 and {result["document_id"] for result in results}.isdisjoint({4, 6})
+    live = snapshot.chunk_ids
+    scores = isolated_store.store.gather_vectors(live) @ fake_vector(query)
+    expected = live[np.argsort(-scores, kind="stable")[:10]]
+    ranked = isolated_store._vector_ranking(fake_vector(query)[None], snapshot, 10)
+    assert [chunk_id for chunk_id, _ in ranked] == expected.tolist()
+    # Uploads keep the partition's search, whose tombstones did not change
+    isolated_store.index_document_chunks(7, document(1, 7, 0), 1)
+    assert isolated_store.owner_snapshots[1].searches[0] is snapshot.searches[0]
+
+
+def test_concurrent_uploads_of_the_same_text_index_it_once(isolated_store):
+    barrier = threading.Barrier(4)
+    content = document(1, 0, 0)
+
+    def upload(document_id: int):
+        prepared = isolated_store.prepare_document_chunks(document_id, content, 1)
+        barrier.wait()  # every upload has checked for duplicates before any publishes
+        isolated_store.publish_document_chunks(document_id, 1, prepared)
+
+    threads = [threading.Thread(target=upload, args=(document_id,)) for document_id in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isolated_store.owner_chunk_count(1) == CHUNKS_PER_DOCUMENT
+
+
+def test_failed_rebuild_backs_off(isolated_store, monkeypatch):
+    attempts = []
+
+    def failing_build(*args, **kwargs):
+        attempts.append(1)
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(isolated_store, "build_index", failing_build)
+    monkeypatch.setattr(isolated_store, "_wanted_index_type", lambda owner_id: "flat")
+    monkeypatch.setattr(isolated_store, "_rebuild_failures", {})
+    isolated_store.index_document_chunks(1, document(1, 1, 0), 1)
+    time.sleep(0.5)
+    isolated_store.index_document_chunks(2, document(1, 2, 0), 1)
+    isolated_store._rebuild_executor.submit(lambda: None).result()
+
+    assert len(attempts) == 1
+    assert isolated_store.search_similar_chunks("owner 1 doc 2 rev 0 part 3", 1, top_k=1)[0]["document_id"] == 2
+
+
+def test_deleting_a_document_keeps_text_shared_with_another(isolated_store):
+    content = document(1, 0, 0)
+    query = "owner 1 doc 0 rev 0 part 3"
+    for document_id in (1, 2, 3):
+        isolated_store.index_document_chunks(document_id, content, 1)
+    assert isolated_store.owner_chunk_count(1) == CHUNKS_PER_DOCUMENT
+
+    def found(mode: str) -> list:
+        return [result["document_id"] for result in isolated_store.search_similar_chunks(query, 1, top_k=1, mode=mode)]
+
+    assert isolated_store.delete_document_chunks(1, 1) == CHUNKS_PER_DOCUMENT
+    assert found("vector") == found("keyword") == [2]
+    # Re-indexing the remaining copy with other text hands the chunks on again
+    isolated_store.index_document_chunks(2, document(1, 2, 1), 1, replace=True)
+    assert found("vector") == found("hybrid") == [3]
+    assert isolated_store.owner_chunk_count(1) == 2 * CHUNKS_PER_DOCUMENT
+    isolated_store.delete_document_chunks(3, 1)
+    assert isolated_store.owner_chunk_count(1) == CHUNKS_PER_DOCUMENT
+    assert not len(isolated_store.owner_snapshots[1].duplicates)
+
+
+def test_deleting_a_document_purges_its_text(isolated_store, monkeypatch):
+    forgotten = []
+    monkeypatch.setattr(isolated_store, "forget_embeddings", forgotten.extend)
+    for document_id in (1, 2):
+        isolated_store.index_document_chunks(document_id, document(1, document_id, 0), 1)
+
+    assert isolated_store.delete_document_chunks(1, 1) == CHUNKS_PER_DOCUMENT
+    segments = os.path.join(isolated_store.store.root, "segments")
+    stored = b"".join(
+        open(os.path.join(directory, name), "rb").read()
+        for directory, _, names in os.walk(segments) for name in names
+    )
+    assert b"doc 1 rev" not in stored and b"doc 2 rev 0 part 3" in stored
+    assert sorted(forgotten) == sorted(document(1, 1, 0).split("\n"))
+    # The purged rows stay out of the partitions after a restart
+    isolated_store.load_index()
+    assert isolated_store.owner_chunk_count(1) == CHUNKS_PER_DOCUMENT
+    assert list(isolated_store.owner_snapshots) == [1]
+
+
+def test_keyword_search_falls_back_until_index_is_built(isolated_store):
+    isolated_store.index_document_chunks(1, document(1, 1, 0), 1)
+    query = "owner 1 doc 1 rev 0 part 3"
+    assert "keyword_score" in isolated_store.search_similar_chunks(query, 1, top_k=1, mode="keyword")[0]
+
+    # As after a restart, with the background build held back
+    release = threading.Event()
+    isolated_store._keyword_executor.submit(release.wait)
+    isolated_store.load_index()
+    results = isolated_store.search_similar_chunks(query, 1, top_k=1, mode="keyword")
+    assert results[0]["text"] == query and "keyword_score" not in results[0]
+
+    release.set()
+    isolated_store._keyword_executor.submit(lambda: None).result()
+    results = isolated_store.search_similar_chunks(query, 1, top_k=1, mode="keyword")
+    assert results[0]["text"] == query and results[0]["keyword_score"] > 0